@@ -1,8 +1,6 @@
 # airflow DAG
-from jinja2 import Template
-from yaml import load, Loader
 import os, inspect
-from dag_builder import DagBuilder
+from dag_builder import DagBuilder, load_dag_config
 from datetime import datetime
 
 # script directory
@@ -50,9 +48,5 @@ config = {
     'transformation_func': 'dag_transfer_files.transformation.transformations.timestamp_and_uppercase_transform'
 }
 
-with open(os.path.join(current_path, 'config.yaml'), 'r') as infile:
-    template = Template(infile.read())
-
-rendered_config = template.render(config=config)
-configs = load(rendered_config, Loader=Loader)
+configs = load_dag_config(os.path.join(current_path, 'config.yaml'), config=config)
 dag = DagBuilder(configs).build()
\ No newline at end of file
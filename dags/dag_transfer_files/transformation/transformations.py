@@ -1,3 +1,7 @@
+# Transformation functions for FileSyncOperator
+# they are StreamTransform objects: the operator streams the chunks of each file through them,
+# calling one directly on a chunk still works and handles that chunk as a whole file
+from transfer.transforms import ChainTransform, LineTransform, StreamTransform
 import logging
 from datetime import datetime
 
@@ -6,28 +10,29 @@ logger = logging.getLogger(__name__)
 
 
 def chain_transforms(*transforms):
-    def chained_transform(chunk):
-        result = chunk
-        for transform in transforms:
-            result = transform(result)
-        return result
+    return ChainTransform(*transforms)
 
-    return chained_transform
 
+class UppercaseTransform(LineTransform):
+    # lines never end inside a multi-byte UTF-8 sequence, so each block decodes on its own
+    def transform_block(self, block):
+        if block.isascii():
+            # fast path, no decode/encode round trip
+            return block.upper()
+        # bytes that are not valid UTF-8 are kept as they are instead of skipping the whole block
+        return block.decode('utf-8', 'surrogateescape').upper().encode('utf-8', 'surrogateescape')
 
-def uppercase_transform(chunk):
-    try:
-        text = chunk.decode('utf-8')
-        return text.upper().encode('utf-8')
-    except UnicodeDecodeError:
-        return chunk
 
+class AddTimestampTransform(StreamTransform):
+    # header once per file, the chunks themselves go through untouched
+    def header(self):
+        timestamp = datetime.utcnow().isoformat()
+        return f"[transferred at {timestamp}]\n".encode('utf-8')
 
-def add_timestamp_transform(chunk: bytes) -> bytes:
-    timestamp = datetime.utcnow().isoformat()
-    prefix = f"[transferred at {timestamp}]\n".encode('utf-8')
-    return prefix + chunk
 
+uppercase_transform = UppercaseTransform()
+
+add_timestamp_transform = AddTimestampTransform()
 
 timestamp_and_uppercase_transform = chain_transforms(
     add_timestamp_transform,
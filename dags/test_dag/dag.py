@@ -1,8 +1,6 @@
 # airflow DAG
-from jinja2 import Template
-from yaml import load, Loader
 import pprint, os, inspect
-from dag_builder import DagBuilder
+from dag_builder import DagBuilder, load_dag_config
 
 pp = pprint.PrettyPrinter(indent=2)
 
@@ -14,10 +12,7 @@ current_path = os.path.dirname(
 	)
 )
 
-with open(os.path.join(current_path, 'config.yaml'), 'r') as infile:
-    template = Template(infile.read())
-
-configs = load(template.render(), Loader=Loader)
+configs = load_dag_config(os.path.join(current_path, 'config.yaml'))
 
 
 dag = DagBuilder(configs).build()
\ No newline at end of file
@@ -0,0 +1,168 @@
+# airflow DAG
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import posixpath
+
+
+_END = object()
+
+
+def iterate_in_thread(iterator, executor):
+    """Async iterator over a blocking iterator, every next() runs on executor so the loop never blocks"""
+    async def generate():
+        loop = asyncio.get_running_loop()
+        it = iter(iterator)
+        try:
+            while True:
+                item = await loop.run_in_executor(executor, next, it, _END)
+                if item is _END:
+                    return
+                yield item
+        finally:
+            close = getattr(it, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(executor, close)
+    return generate()
+
+
+def iterate_from_loop(async_iterable, loop):
+    """Blocking iterator over an async iterable of loop, for code running in a thread of an executor
+
+    Only valid while the loop keeps running (the thread is awaited by a coroutine, not by the loop itself).
+    """
+    it = async_iterable.__aiter__()
+
+    async def next_item():
+        # run_coroutine_threadsafe wants a coroutine, __anext__() of an async generator isn't one
+        return await it.__anext__()
+
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(next_item(), loop).result()
+        except StopAsyncIteration:
+            return
+
+
+class BaseAsyncStorageAdapter(ABC):
+    """Async counterpart of BaseStorageAdapter, reads are async iterators and writes consume one
+
+    Many transfers then run as coroutines on one event loop instead of a thread each.
+    """
+
+    atomic_writes = False
+
+    @abstractmethod
+    def list_entries(self, path):
+        """Async iterator of FileEntry, names relative to path"""
+        pass
+
+    @abstractmethod
+    def read_file_chunks(self, file_path, chunk_size):
+        """Async iterator of chunks"""
+        pass
+
+    @abstractmethod
+    async def write_file_chunks(self, file_path, chunks):
+        """Write the chunks of an async iterable, return the number of bytes written"""
+        pass
+
+    @abstractmethod
+    async def delete_file(self, file_path):
+        pass
+
+    @abstractmethod
+    async def rename_file(self, old_path, new_path):
+        pass
+
+    @abstractmethod
+    async def is_directory(self, path):
+        pass
+
+    @abstractmethod
+    async def stat_file(self, file_path):
+        pass
+
+    async def list_files(self, path):
+        return [entry.name async for entry in self.list_entries(path)]
+
+    async def get_file_size(self, file_path):
+        return (await self.stat_file(file_path)).size
+
+    async def get_checksum(self, file_path, algorithm):
+        return None
+
+    async def walk(self, path, recursive=True):
+        # same names as BaseStorageAdapter.walk (a/b/c/file.txt), directories are yielded too
+        pending = deque([''])
+        while pending:
+            relative_dir = pending.popleft()
+            async for entry in self.list_entries(posixpath.join(path, relative_dir) if relative_dir else path):
+                entry = entry._replace(name=posixpath.join(relative_dir, entry.name) if relative_dir else entry.name)
+                yield entry
+                if entry.is_dir and recursive:
+                    pending.append(entry.name)
+
+    def set_buffer_pool(self, buffer_pool):
+        # native async adapters read into their own buffers
+        pass
+
+    async def close(self):
+        pass
+
+
+class ThreadBridgeAdapter(BaseAsyncStorageAdapter):
+    """Any (sync) BaseStorageAdapter behind the async interface, its blocking calls run on a thread pool
+
+    max_threads bounds the blocking calls in flight, not the transfers: a transfer only holds a thread
+    while the wrapped adapter is inside a call.
+    """
+
+    def __init__(self, adapter, max_threads=32):
+        self.adapter = adapter
+        self.atomic_writes = adapter.atomic_writes
+        self._executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='bridge')
+
+    def set_buffer_pool(self, buffer_pool):
+        self.adapter.set_buffer_pool(buffer_pool)
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def list_entries(self, path):
+        return iterate_in_thread(self.adapter.list_entries(path), self._executor)
+
+    def read_file_chunks(self, file_path, chunk_size):
+        return iterate_in_thread(self.adapter.read_file_chunks(file_path, chunk_size), self._executor)
+
+    async def write_file_chunks(self, file_path, chunks):
+        # the adapter pulls the chunks from the loop while it writes in its thread
+        loop = asyncio.get_running_loop()
+        return await self._call(self.adapter.write_file_chunks, file_path, iterate_from_loop(chunks, loop))
+
+    async def delete_file(self, file_path):
+        return await self._call(self.adapter.delete_file, file_path)
+
+    async def rename_file(self, old_path, new_path):
+        return await self._call(self.adapter.rename_file, old_path, new_path)
+
+    async def is_directory(self, path):
+        return await self._call(self.adapter.is_directory, path)
+
+    async def stat_file(self, file_path):
+        return await self._call(self.adapter.stat_file, file_path)
+
+    async def get_file_size(self, file_path):
+        return await self._call(self.adapter.get_file_size, file_path)
+
+    async def get_checksum(self, file_path, algorithm):
+        return await self._call(self.adapter.get_checksum, file_path, algorithm)
+
+    async def walk(self, path, recursive=True):
+        # the sync walk already lists sub directories the way the adapter does best (one listing on S3...)
+        async for entry in iterate_in_thread(self.adapter.walk(path, recursive=recursive), self._executor):
+            yield entry
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,155 @@
+# airflow DAG
+from adapters.storage_adapter.async_adapter import BaseAsyncStorageAdapter
+from adapters.storage_adapter.base_adapter import FileEntry
+from airflow.providers.ssh.hooks.ssh import SSHHook
+import asyncio
+import importlib
+import io
+import logging
+import posixpath
+import stat
+
+
+def _import_asyncssh():
+    # optional, only needed by execution_mode='asyncio' and imported when the adapter is created
+    try:
+        return importlib.import_module('asyncssh')
+    except ImportError:
+        raise ImportError("the asyncio SFTP adapter requires the asyncssh package")
+
+
+class AsyncSFTPStorageAdapter(BaseAsyncStorageAdapter):
+    """SFTP on asyncssh, one SSH connection per adapter and max_channels SFTP sessions used round robin
+
+    Every session keeps many requests in flight (asyncssh pipelines reads and writes of one file over
+    max_requests block requests), so hundreds of transfers share a few channels without a thread each.
+    asyncssh has no check-file request, get_checksum stays None and integrity='server' only hashes the stream.
+    """
+
+    def __init__(self, conn_id, max_channels=4, block_size=64 * 1024, max_requests=32):
+        self._asyncssh = _import_asyncssh()
+        self.conn_id = conn_id
+        self.max_channels = max(1, max_channels)
+        self.block_size = block_size
+        self.max_requests = max_requests
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._connection = None
+        self._channels = []
+        self._next_channel = 0
+        self._connect_lock = None
+        self._known_directories = set()
+        self._posix_rename = None
+
+    def _connect_options(self):
+        # same connection as the sync adapter, read through the SSH hook
+        hook = SSHHook(ssh_conn_id=self.conn_id)
+        options = {
+            'host': hook.remote_host,
+            'port': hook.port or 22,
+            'username': hook.username,
+            'password': hook.password,
+        }
+        client_keys = []
+        if hook.key_file:
+            client_keys.append(hook.key_file)
+        if hook.pkey is not None:
+            private_key = io.StringIO()
+            hook.pkey.write_private_key(private_key)
+            client_keys.append(self._asyncssh.import_private_key(private_key.getvalue()))
+        if client_keys:
+            options['client_keys'] = client_keys
+        if hook.no_host_key_check:
+            options['known_hosts'] = None
+        return options
+
+    async def _channel(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._connection is None:
+                self._connection = await self._asyncssh.connect(**self._connect_options())
+                self.logger.info(f"opened SSH connection for {self.conn_id}")
+            if len(self._channels) < self.max_channels:
+                self._channels.append(await self._connection.start_sftp_client())
+                return self._channels[-1]
+        self._next_channel = (self._next_channel + 1) % len(self._channels)
+        return self._channels[self._next_channel]
+
+    def _open(self, sftp, file_path, mode):
+        return sftp.open(file_path, mode, block_size=self.block_size, max_requests=self.max_requests)
+
+    def _entry(self, name, attrs):
+        return FileEntry(name, attrs.size or 0, attrs.mtime, stat.S_ISDIR(attrs.permissions or 0))
+
+    async def list_entries(self, path):
+        sftp = await self._channel()
+        async for name in sftp.scandir(path):
+            if name.filename in ('.', '..'):
+                continue
+            yield self._entry(name.filename, name.attrs)
+
+    async def read_file_chunks(self, file_path, chunk_size):
+        sftp = await self._channel()
+        async with self._open(sftp, file_path, 'rb') as f:
+            while True:
+                # one read of chunk_size is split in parallel block requests by asyncssh
+                chunk = await f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    async def write_file_chunks(self, file_path, chunks):
+        sftp = await self._channel()
+        parent_dir = posixpath.dirname(file_path)
+        if parent_dir and parent_dir not in self._known_directories:
+            await sftp.makedirs(parent_dir, exist_ok=True)
+            self._known_directories.add(parent_dir)
+        total_bytes = 0
+        async with self._open(sftp, file_path, 'wb') as f:
+            async for chunk in chunks:
+                await f.write(chunk, total_bytes)
+                total_bytes += len(chunk)
+        return total_bytes
+
+    async def delete_file(self, file_path):
+        sftp = await self._channel()
+        try:
+            await sftp.remove(file_path)
+        except self._asyncssh.SFTPNoSuchFile:
+            pass
+
+    async def rename_file(self, old_path, new_path):
+        sftp = await self._channel()
+        if self._posix_rename is not False:
+            try:
+                await sftp.posix_rename(old_path, new_path)
+                self._posix_rename = True
+                return
+            except self._asyncssh.SFTPOpUnsupported:
+                self._posix_rename = False
+                self.logger.info(f"posix-rename not supported by {self.conn_id}, using remove + rename")
+        await self.delete_file(new_path)
+        await sftp.rename(old_path, new_path)
+
+    async def _stat(self, path):
+        sftp = await self._channel()
+        try:
+            return await sftp.stat(path)
+        except self._asyncssh.SFTPNoSuchFile:
+            # same error as the sync adapters, callers test for OSError
+            raise FileNotFoundError(path)
+
+    async def is_directory(self, path):
+        return stat.S_ISDIR((await self._stat(path)).permissions or 0)
+
+    async def stat_file(self, file_path):
+        return self._entry(file_path.rstrip('/').split('/')[-1], await self._stat(file_path))
+
+    async def close(self):
+        for sftp in self._channels:
+            sftp.exit()
+        self._channels = []
+        if self._connection is not None:
+            self._connection.close()
+            await self._connection.wait_closed()
+            self._connection = None
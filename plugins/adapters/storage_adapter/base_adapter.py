@@ -1,9 +1,27 @@
 # airflow DAG
 from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import nullcontext
 from typing import Iterator, List
+import time
+
+
+# one listing entry, name is relative to the listed path
+FileEntry = namedtuple('FileEntry', ['name', 'size', 'mtime', 'is_dir'])
 
 
 class BaseStorageAdapter(ABC):
+    # adapters able to read byte ranges and write at offsets set this and override the methods below
+    supports_ranges = False
+    # adapters whose files only become visible once completely written (object storage) set this,
+    # files are then written in place instead of to a temp file renamed at the end
+    atomic_writes = False
+    # ConnectionGovernor shared by every task using the connection, set by the factory when configured
+    governor = None
+    # BufferPool of the worker process, set by the operator when reads should reuse buffers
+    buffer_pool = None
+
     @abstractmethod
     def list_files(self, path):
         pass
@@ -26,4 +44,158 @@ class BaseStorageAdapter(ABC):
 
     @abstractmethod
     def is_directory(self, path):
-        pass
\ No newline at end of file
+        pass
+
+    def list_entries(self, path):
+        # generic fallback, adapters override it when the backend returns attributes with the listing
+        entries = []
+        for name in self.list_files(path):
+            file_path = self._join_path(path, name)
+            if self.is_directory(file_path):
+                entries.append(FileEntry(name, 0, None, True))
+            else:
+                entries.append(self.stat_file(file_path))
+        return entries
+
+    def walk(self, path, recursive=True, max_workers=1):
+        """Yield a FileEntry for everything under path as soon as its directory is listed
+
+        Names are relative to path (a/b/c/file.txt) and directories are yielded too, callers filter on is_dir.
+        With max_workers > 1 sub directories are listed concurrently.
+        """
+        if max_workers <= 1:
+            pending = deque([''])
+            while pending:
+                relative_dir = pending.popleft()
+                for entry in self.list_entries(self._join_path(path, relative_dir)):
+                    entry = entry._replace(name=self._join_path(relative_dir, entry.name))
+                    yield entry
+                    if entry.is_dir and recursive:
+                        pending.append(entry.name)
+            return
+
+        def list_dir(relative_dir):
+            return relative_dir, list(self.list_entries(self._join_path(path, relative_dir)))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {executor.submit(list_dir, '')}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    relative_dir, entries = future.result()
+                    for entry in entries:
+                        entry = entry._replace(name=self._join_path(relative_dir, entry.name))
+                        yield entry
+                        if entry.is_dir and recursive:
+                            pending.add(executor.submit(list_dir, entry.name))
+
+    def set_governor(self, governor):
+        self.governor = governor
+
+    def _governed(self):
+        # one channel slot of the governor for the duration of a request/stream
+        if self.governor is None:
+            return nullcontext()
+        return self.governor.channel()
+
+    def _account(self, nbytes, seconds):
+        if self.governor is not None:
+            self.governor.observe(nbytes, seconds)
+            self.governor.consume(nbytes)
+
+    def _governed_chunks(self, chunks):
+        # chunks read from the backend, timed and paced by the governor
+        if self.governor is None:
+            yield from chunks
+            return
+        chunks = iter(chunks)
+        while True:
+            started = time.monotonic()
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            self._account(len(chunk), time.monotonic() - started)
+            yield chunk
+
+    def set_buffer_pool(self, buffer_pool):
+        self.buffer_pool = buffer_pool
+
+    def _read_into_buffers(self, readinto, offset, end, chunk_size):
+        """Chunks of [offset, end) filled by readinto(view, offset) -> bytes read (0 at end of file)
+
+        Without buffer pool every chunk is a new bytearray of its exact size. With one the chunks are memoryviews
+        of pooled buffers, reused once the chunk isn't referenced anymore, and the read waits while the budget
+        of the pool is used up.
+        """
+        if self.buffer_pool is None:
+            while offset < end:
+                buffer = bytearray(min(chunk_size, end - offset))
+                n = readinto(buffer, offset)
+                if not n:
+                    return
+                if n < len(buffer):
+                    del buffer[n:]
+                offset += n
+                yield buffer
+            return
+
+        buffers = self.buffer_pool.buffers(min(chunk_size, end - offset))
+        try:
+            while offset < end:
+                chunk = memoryview(next(buffers))[:min(chunk_size, end - offset)]
+                n = readinto(chunk, offset)
+                if not n:
+                    return
+                if n < len(chunk):
+                    chunk = chunk[:n]
+                offset += n
+                yield chunk
+                # drop our reference, the pool only reuses buffers nobody holds a chunk of
+                del chunk
+        finally:
+            buffers.close()
+
+    @staticmethod
+    def _join_path(parent, name):
+        if not parent:
+            return name
+        if not name:
+            return parent
+        return f"{parent.rstrip('/')}/{name}"
+
+    def stat_file(self, file_path):
+        name = file_path.rstrip('/').split('/')[-1]
+        try:
+            size = self.get_file_size(file_path)
+        except NotImplementedError:
+            # size is unknown for adapters that only implement the streaming methods
+            size = None
+        return FileEntry(name, size, None, False)
+
+    def ensure_directories(self, directories):
+        # batch hint before writing many files, adapters without directories (or creating them cheaply
+        # on write) have nothing to do
+        pass
+
+    def can_copy_to(self, target_adapter):
+        # adapters able to copy to target_adapter without going through Python chunks override both
+        return False
+
+    def copy_file_to(self, target_adapter, source_path, target_path):
+        raise NotImplementedError(f"{self.__class__.__name__} does not support direct copies")
+
+    def get_checksum(self, file_path, algorithm):
+        # hex digest computed by the server itself, None when the backend can't do it without reading the file
+        return None
+
+    def get_file_size(self, file_path):
+        raise NotImplementedError(f"{self.__class__.__name__} does not support get_file_size")
+
+    def read_file_range(self, file_path, offset, length, chunk_size):
+        raise NotImplementedError(f"{self.__class__.__name__} does not support ranged reads")
+
+    def create_file(self, file_path):
+        raise NotImplementedError(f"{self.__class__.__name__} does not support create_file")
+
+    def write_file_at(self, file_path, offset, chunks):
+        raise NotImplementedError(f"{self.__class__.__name__} does not support writes at an offset")
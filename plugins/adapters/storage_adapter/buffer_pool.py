@@ -0,0 +1,164 @@
+# airflow DAG
+import logging
+import os
+import threading
+import time
+
+
+def _is_referenced(buffer):
+    # a bytearray can't be resized while a memoryview of it (a chunk handed out) is still alive
+    try:
+        last = buffer.pop()
+    except BufferError:
+        return True
+    buffer.append(last)
+    return False
+
+
+class BufferPool:
+    """Reusable bytearrays for chunk reads, with a memory budget shared by every transfer of the worker process
+
+    Readers get buffers through buffers() and hand out memoryviews of them, a buffer goes back to the pool
+    once no chunk of it is referenced anymore (written, hashed, dropped by a pipeline stage...).
+
+    A read stream counts two buffers against max_bytes (the chunk being filled and the one its consumer is
+    still on), plus every other chunk downstream stages hold. It waits before its first read, and before a
+    read that needs one more buffer, until the budget has room. A wait longer than wait_timeout proceeds over
+    budget with a warning rather than stalling the task.
+
+    Sizes are rounded up to powers of two (at least min_buffer_size) so files of different sizes share buffers.
+    """
+
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, max_bytes, min_buffer_size=64 * 1024, wait_timeout=60, poll_interval=0.05):
+        self.max_bytes = max_bytes
+        self.min_buffer_size = min_buffer_size
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._cond = threading.Condition()
+        # size => idle buffers, and buffers of closed streams whose chunks were still referenced
+        self._free = {}
+        self._retained = []
+        self._in_use_bytes = 0
+        self._free_bytes = 0
+        self._counters = {'allocated': 0, 'reused': 0, 'waits': 0, 'wait_seconds': 0.0, 'over_budget': 0}
+
+    @classmethod
+    def get_pool(cls, max_bytes, **options):
+        # one per worker process, the first budget given wins
+        key = os.getpid()
+        with cls._pools_lock:
+            pool = cls._pools.get(key)
+            if pool is None:
+                pool = cls(max_bytes, **options)
+                cls._pools[key] = pool
+            return pool
+
+    def _size_class(self, size):
+        size_class = self.min_buffer_size
+        while size_class < size:
+            size_class *= 2
+        return size_class
+
+    def buffers(self, size):
+        """Buffers of at least size bytes for one read stream, a new one (or a recycled one) per next()"""
+        size = self._size_class(size)
+        held = []
+        counted = 0
+        try:
+            while True:
+                with self._cond:
+                    held, needed = self._wait_for_room(held, size, counted)
+                    self._in_use_bytes += needed - counted
+                    counted = needed
+                    buffer = self._take(size)
+                held.append(buffer)
+                yield buffer
+        finally:
+            with self._cond:
+                held = self._recycle(held)
+                # what is still referenced stays counted until _reclaim() sees it dropped
+                self._in_use_bytes -= counted - len(held) * size
+                self._retained.extend(held)
+                self._cond.notify_all()
+
+    def _wait_for_room(self, held, size, counted):
+        started = None
+        while True:
+            self._reclaim()
+            held = self._recycle(held)
+            needed = max(2, len(held) + 1) * size
+            extra = needed - counted
+            if extra <= 0 or not self._in_use_bytes or self._in_use_bytes + extra <= self.max_bytes:
+                break
+            if started is None:
+                started = time.monotonic()
+                self._counters['waits'] += 1
+            elif time.monotonic() - started >= self.wait_timeout:
+                self._counters['over_budget'] += 1
+                self.logger.warning(
+                    f"waited {self.wait_timeout}s for {extra} bytes of buffer, going over the budget of "
+                    f"{self.max_bytes} bytes ({self._in_use_bytes} in use)"
+                )
+                break
+            # a chunk being dropped downstream doesn't notify us, poll
+            self._cond.wait(self.poll_interval)
+        if started is not None:
+            self._counters['wait_seconds'] += time.monotonic() - started
+        return held, needed
+
+    def _recycle(self, held):
+        # buffers of the stream nobody references anymore go back to the pool, the rest is kept
+        still_held = []
+        for buffer in held:
+            if _is_referenced(buffer):
+                still_held.append(buffer)
+            else:
+                self._put(buffer)
+        return still_held
+
+    def _reclaim(self):
+        retained, self._retained = self._retained, []
+        for buffer in retained:
+            if _is_referenced(buffer):
+                self._retained.append(buffer)
+            else:
+                self._in_use_bytes -= len(buffer)
+                self._put(buffer)
+        if len(retained) != len(self._retained):
+            self._cond.notify_all()
+
+    def _put(self, buffer):
+        # idle buffers are kept as long as they fit in the budget next to what is in use
+        if self._in_use_bytes + self._free_bytes + len(buffer) > self.max_bytes:
+            return
+        self._free.setdefault(len(buffer), []).append(buffer)
+        self._free_bytes += len(buffer)
+
+    def _take(self, size):
+        free = self._free.get(size)
+        if free:
+            self._free_bytes -= size
+            self._counters['reused'] += 1
+            return free.pop()
+        # idle buffers of other sizes make room for this one
+        for free_size, free in self._free.items():
+            while free and self._in_use_bytes + self._free_bytes > self.max_bytes:
+                free.pop()
+                self._free_bytes -= free_size
+        self._counters['allocated'] += 1
+        return bytearray(size)
+
+    def stats(self):
+        with self._cond:
+            self._reclaim()
+            return dict(
+                self._counters,
+                wait_seconds=round(self._counters['wait_seconds'], 3),
+                in_use_bytes=self._in_use_bytes,
+                free_bytes=self._free_bytes,
+                max_bytes=self.max_bytes
+            )
@@ -1,21 +1,83 @@
 # airflow DAG
+from adapters.storage_adapter.async_adapter import ThreadBridgeAdapter
+from adapters.storage_adapter.async_sftp_adapter import AsyncSFTPStorageAdapter
+from adapters.storage_adapter.governor import ConnectionGovernor
+from adapters.storage_adapter.local_adapter import LocalStorageAdapter
+from adapters.storage_adapter.memory_adapter import MemoryStorageAdapter
 from adapters.storage_adapter.sftp_adapter import SFTPStorageAdapter
+from airflow.exceptions import AirflowNotFoundException
+from airflow.hooks.base import BaseHook
 from typing import Dict, Type
+import logging
+
+try:
+    from adapters.storage_adapter.s3_adapter import S3StorageAdapter
+except ImportError:
+    # the amazon provider (boto3) is optional
+    S3StorageAdapter = None
 
 
 class StorageAdapterFactory:
     _adapters = {
         'sftp': SFTPStorageAdapter,
+        'local': LocalStorageAdapter,
+        'memory': MemoryStorageAdapter,
     }
 
     @classmethod
-    def create_adapter(cls, adapter_type, conn_id):
+    def create_adapter(cls, adapter_type, conn_id, governor_config=None):
         adapter_class = cls._adapters.get(adapter_type.lower())
         if not adapter_class:
             supported = ', '.join(cls._adapters.keys())
             raise ValueError(f"unsupported adapter type: {adapter_type}")
-        return adapter_class(conn_id)
+        adapter = adapter_class(conn_id)
+
+        # limits of the connection, e.g. {"governor": {"max_channels": 4, "max_bytes_per_second": 52428800}}
+        # in its extras, shared by every task of the host using it
+        if governor_config is None:
+            governor_config = cls._get_governor_config(conn_id)
+        if governor_config:
+            adapter.set_governor(ConnectionGovernor.get_governor(conn_id, **governor_config))
+        return adapter
+
+    @staticmethod
+    def _get_governor_config(conn_id):
+        if not conn_id:
+            return None
+        try:
+            return BaseHook.get_connection(conn_id).extra_dejson.get('governor')
+        except AirflowNotFoundException:
+            # memory/local adapters don't need a connection
+            return None
 
     @classmethod
     def register_adapter(cls, adapter_type, adapter_class):
         cls._adapters[adapter_type.lower()] = adapter_class
+
+    # native async adapters, every other type goes through a ThreadBridgeAdapter
+    _async_adapters = {
+        'sftp': AsyncSFTPStorageAdapter,
+    }
+
+    @classmethod
+    def create_async_adapter(cls, adapter_type, conn_id, governor_config=None, max_threads=32):
+        adapter_class = cls._async_adapters.get(adapter_type.lower())
+        if governor_config is None:
+            governor_config = cls._get_governor_config(conn_id)
+        # the governor blocks (file locks, sleeps), it stays on the sync adapters running in threads
+        if adapter_class is not None and not governor_config:
+            try:
+                return adapter_class(conn_id)
+            except ImportError as e:
+                logging.getLogger(cls.__name__).info(f"{str(e)}, using the {adapter_type} adapter in threads")
+        return ThreadBridgeAdapter(
+            cls.create_adapter(adapter_type, conn_id, governor_config=governor_config), max_threads=max_threads
+        )
+
+    @classmethod
+    def register_async_adapter(cls, adapter_type, adapter_class):
+        cls._async_adapters[adapter_type.lower()] = adapter_class
+
+
+if S3StorageAdapter is not None:
+    StorageAdapterFactory.register_adapter('s3', S3StorageAdapter)
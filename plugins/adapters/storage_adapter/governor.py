@@ -0,0 +1,253 @@
+# airflow DAG
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+
+class BaseGovernorBackend(ABC):
+    """State shared by every process governing the same conn_id: channel slots and the token bucket"""
+
+    @abstractmethod
+    def try_acquire_slot(self, limit):
+        """Take one of the slots 0..limit-1, return a token for release_slot() or None when all are taken"""
+        pass
+
+    @abstractmethod
+    def release_slot(self, token):
+        pass
+
+    @abstractmethod
+    def update_state(self, update):
+        """Call update(state) -> new state atomically for every process, return the new state"""
+        pass
+
+
+class FileLockGovernorBackend(BaseGovernorBackend):
+    """Slots are flock()ed files and the state a JSON file updated under flock, for the processes of one host
+
+    The kernel drops the locks of a process that dies, so a killed worker never keeps a slot.
+    """
+
+    def __init__(self, name, state_dir=None):
+        self.state_dir = state_dir or os.environ.get('FILE_SYNC_GOVERNOR_DIR') or os.path.join(
+            tempfile.gettempdir(), 'file_sync_governor'
+        )
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.name = name
+        self._state_path = os.path.join(self.state_dir, f'{name}.state')
+        # flock() doesn't exclude threads sharing a file descriptor
+        self._state_lock = threading.Lock()
+
+    def try_acquire_slot(self, limit):
+        for index in range(limit):
+            fd = os.open(os.path.join(self.state_dir, f'{self.name}.slot{index}'), os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def release_slot(self, token):
+        # closing the file descriptor releases the lock
+        os.close(token)
+
+    def update_state(self, update):
+        with self._state_lock:
+            fd = os.open(self._state_path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                with os.fdopen(os.dup(fd), 'r+') as f:
+                    content = f.read()
+                    state = update(json.loads(content) if content else {})
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                return state
+            finally:
+                os.close(fd)
+
+
+class ConnectionGovernor:
+    """Limit what every task on this host does with one connection: channels in use and bytes per second
+
+    max_channels caps the channels used at the same time by all processes, max_bytes_per_second is a token
+    bucket (burst_bytes deep) shared by reads and writes. With adaptive_concurrency the channel limit moves
+    between min_channels and max_channels: +1 after every window of adapt_every observations without
+    error or slowdown, halved when a window sees an error or a latency over latency_tolerance times the
+    best window so far.
+
+    Waiting for a channel slot gives up after slot_timeout seconds with a TimeoutError, a task never
+    hangs on a limit that is too low for what it holds at the same time.
+    """
+
+    _governors = {}
+    _governors_lock = threading.Lock()
+    _backends = {
+        'file': FileLockGovernorBackend,
+    }
+
+    def __init__(self, conn_id, max_channels=None, max_bytes_per_second=None, burst_bytes=None,
+                 adaptive_concurrency=False, min_channels=1, adapt_every=32, latency_tolerance=1.5,
+                 backend='file', backend_options=None, slot_poll_interval=0.05, slot_timeout=300):
+        self.conn_id = conn_id
+        self.max_channels = max_channels
+        self.max_bytes_per_second = max_bytes_per_second
+        # one second worth of bytes by default, enough for one chunk at any sensible rate
+        self.burst_bytes = burst_bytes or max_bytes_per_second
+        self.adaptive_concurrency = adaptive_concurrency and bool(max_channels)
+        self.min_channels = max(1, min_channels)
+        self.adapt_every = adapt_every
+        self.latency_tolerance = latency_tolerance
+        self.slot_poll_interval = slot_poll_interval
+        self.slot_timeout = slot_timeout
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        backend_class = self._backends.get(backend)
+        if backend_class is None:
+            raise ValueError(f"unsupported governor backend: {backend}")
+        # conn ids may contain anything, the backend only gets a safe name
+        name = hashlib.sha256(conn_id.encode()).hexdigest()[:16]
+        self.backend = backend_class(name, **(backend_options or {}))
+
+        self._window_lock = threading.Lock()
+        self._window_seconds = 0.0
+        self._window_bytes = 0
+        self._window_count = 0
+        self._window_errors = 0
+        self._best_latency = None
+        # current channel limit, refreshed from the shared state when we adapt it
+        self._limit = max_channels
+        if self.adaptive_concurrency:
+            self._limit = self.backend.update_state(self._initial_limit).get('limit', max_channels)
+
+    @classmethod
+    def get_governor(cls, conn_id, **config):
+        # like the SFTP pools, one per process and conn_id, the first config given wins
+        key = (os.getpid(), conn_id)
+        with cls._governors_lock:
+            governor = cls._governors.get(key)
+            if governor is None:
+                governor = cls(conn_id, **config)
+                cls._governors[key] = governor
+            return governor
+
+    @classmethod
+    def register_backend(cls, name, backend_class):
+        cls._backends[name] = backend_class
+
+    def _initial_limit(self, state):
+        if 'limit' not in state:
+            # start in the middle, the first windows tell which way to go
+            state['limit'] = max(self.min_channels, self.max_channels // 2)
+        state['limit'] = min(state['limit'], self.max_channels)
+        return state
+
+    @contextmanager
+    def channel(self, timeout=None):
+        token = self.acquire(timeout=timeout)
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.release(token, error=error)
+
+    def acquire(self, timeout=None):
+        if not self.max_channels:
+            return None
+        timeout = self.slot_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        poll_interval = self.slot_poll_interval
+        while True:
+            token = self.backend.try_acquire_slot(self._limit)
+            if token is not None:
+                return token
+            if time.monotonic() >= deadline:
+                raise TimeoutError(
+                    f"no channel slot for {self.conn_id} after {timeout}s, all {self._limit} are in use by"
+                    f" this host's tasks; raise max_channels in the governor config of the connection"
+                )
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, 1)
+            if self.adaptive_concurrency:
+                # other processes adapt the limit too
+                self._limit = self.backend.update_state(lambda state: state).get('limit', self._limit)
+
+    def release(self, token, error=False):
+        if token is not None:
+            self.backend.release_slot(token)
+        if error:
+            self._observe(0, 0, error=True)
+
+    def consume(self, nbytes):
+        """Take nbytes from the shared bucket, sleeping as long as the rate requires"""
+        if not self.max_bytes_per_second or not nbytes:
+            return
+        rate = self.max_bytes_per_second
+
+        def take(state):
+            now = time.time()
+            tokens = state.get('tokens', self.burst_bytes)
+            elapsed = max(0.0, now - state.get('updated', now))
+            # going below zero is a debt the next callers wait for, so chunks bigger than the bucket pass
+            state['tokens'] = min(self.burst_bytes, tokens + elapsed * rate) - nbytes
+            state['updated'] = now
+            return state
+
+        tokens = self.backend.update_state(take)['tokens']
+        if tokens < 0:
+            time.sleep(-tokens / rate)
+
+    def observe(self, nbytes, seconds):
+        """Feed the time one read/write of nbytes took, for adaptive concurrency"""
+        self._observe(nbytes, seconds)
+
+    def _observe(self, nbytes, seconds, error=False):
+        if not self.adaptive_concurrency:
+            return
+        with self._window_lock:
+            self._window_count += 1
+            self._window_errors += error
+            self._window_seconds += seconds
+            self._window_bytes += nbytes
+            if self._window_count < self.adapt_every and not error:
+                return
+            errors = self._window_errors
+            # seconds per MB, so windows of different chunk sizes compare
+            latency = self._window_seconds / max(self._window_bytes, 1) * 1024 * 1024
+            self._window_count = self._window_errors = self._window_bytes = 0
+            self._window_seconds = 0.0
+            if not errors:
+                if self._best_latency is None or latency < self._best_latency:
+                    self._best_latency = latency
+            slow = not errors and latency > self._best_latency * self.latency_tolerance
+
+        def adapt(state):
+            limit = state.get('limit', self._limit)
+            if errors or slow:
+                state['limit'] = max(self.min_channels, limit // 2)
+            else:
+                state['limit'] = min(self.max_channels, limit + 1)
+            return state
+
+        limit = self.backend.update_state(adapt)['limit']
+        if limit != self._limit:
+            self.logger.info(
+                f"channel limit for {self.conn_id}: {self._limit} -> {limit}"
+                f" ({'errors' if errors else 'slow' if slow else 'ok'})"
+            )
+        self._limit = limit
+
+    @property
+    def limit(self):
+        return self._limit
@@ -0,0 +1,159 @@
+# airflow DAG
+from adapters.storage_adapter.base_adapter import BaseStorageAdapter, FileEntry
+from airflow.hooks.filesystem import FSHook
+import logging
+import mmap
+import os
+import shutil
+import stat
+
+
+class LocalStorageAdapter(BaseStorageAdapter):
+    supports_ranges = True
+
+    def __init__(self, conn_id=None, root_path=None, use_mmap=False):
+        self.conn_id = conn_id
+        # paths are resolved under root_path, by default the 'path' extra of an Airflow fs connection
+        # (no conn_id => paths are used as they are)
+        if root_path is None and conn_id:
+            root_path = FSHook(fs_conn_id=conn_id).get_path()
+        self.root_path = root_path or ''
+        # map files in memory and hand out views of the page cache instead of reading into buffers
+        self.use_mmap = use_mmap
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def _local_path(self, path):
+        if not self.root_path:
+            return path
+        return os.path.join(self.root_path, path.lstrip('/'))
+
+    def list_files(self, path):
+        return os.listdir(self._local_path(path))
+
+    def list_entries(self, path):
+        with os.scandir(self._local_path(path)) as it:
+            for dir_entry in it:
+                file_stat = dir_entry.stat()
+                yield FileEntry(dir_entry.name, file_stat.st_size, file_stat.st_mtime, stat.S_ISDIR(file_stat.st_mode))
+
+    def read_file_chunks(self, file_path, chunk_size):
+        yield from self.read_file_range(file_path, 0, None, chunk_size)
+
+    def read_file_range(self, file_path, offset, length, chunk_size):
+        with open(self._local_path(file_path), 'rb', buffering=0) as f:
+            end = os.fstat(f.fileno()).st_size
+            if length is not None:
+                end = min(end, offset + length)
+            if self.use_mmap:
+                yield from self._read_mmap(f, offset, end, chunk_size)
+                return
+
+            f.seek(offset)
+            # readinto a buffer (of the exact size, or from the buffer pool), no intermediate bytes object
+            yield from self._read_into_buffers(lambda buffer, _: f.readinto(buffer), offset, end, chunk_size)
+
+    def _read_mmap(self, f, offset, end, chunk_size):
+        if offset >= end:
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            while offset < end:
+                yield view[offset:min(offset + chunk_size, end)]
+                offset += chunk_size
+        finally:
+            view.release()
+            try:
+                mapped.close()
+            except BufferError:
+                # a consumer still holds a slice, the mapping goes away with it
+                pass
+
+    def write_file_chunks(self, file_path, chunks):
+        local_path = self._local_path(file_path)
+        self._create_parent_directory(local_path)
+
+        total_bytes = 0
+        with open(local_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                total_bytes += len(chunk)
+        return total_bytes
+
+    def create_file(self, file_path):
+        local_path = self._local_path(file_path)
+        self._create_parent_directory(local_path)
+        open(local_path, 'wb').close()
+
+    def write_file_at(self, file_path, offset, chunks):
+        total_bytes = 0
+        with open(self._local_path(file_path), 'r+b') as f:
+            f.seek(offset)
+            for chunk in chunks:
+                f.write(chunk)
+                total_bytes += len(chunk)
+        return total_bytes
+
+    def _create_parent_directory(self, local_path):
+        parent_dir = os.path.dirname(local_path)
+        if parent_dir:
+            os.makedirs(parent_dir, exist_ok=True)
+
+    def delete_file(self, file_path):
+        try:
+            os.remove(self._local_path(file_path))
+        except FileNotFoundError:
+            pass
+
+    def rename_file(self, old_path, new_path):
+        # os.replace overwrites atomically, no remove needed
+        os.replace(self._local_path(old_path), self._local_path(new_path))
+
+    def is_directory(self, path):
+        return stat.S_ISDIR(os.stat(self._local_path(path)).st_mode)
+
+    def get_file_size(self, file_path):
+        return os.stat(self._local_path(file_path)).st_size
+
+    def stat_file(self, file_path):
+        file_stat = os.stat(self._local_path(file_path))
+        name = file_path.rstrip('/').split('/')[-1]
+        return FileEntry(name, file_stat.st_size, file_stat.st_mtime, stat.S_ISDIR(file_stat.st_mode))
+
+    def can_copy_to(self, target_adapter):
+        return isinstance(target_adapter, LocalStorageAdapter)
+
+    def copy_file_to(self, target_adapter, source_path, target_path):
+        target_local_path = target_adapter._local_path(target_path)
+        self._create_parent_directory(target_local_path)
+
+        with open(self._local_path(source_path), 'rb') as src, open(target_local_path, 'wb') as dst:
+            size = os.fstat(src.fileno()).st_size
+            return self._copy_in_kernel(src, dst, size)
+
+    def _copy_in_kernel(self, src, dst, size):
+        # copy_file_range can even share extents (reflink) on filesystems that support it,
+        # sendfile still keeps the data in the kernel, the python loop is the last resort
+        for copy in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+            if copy is None:
+                continue
+            copied = 0
+            try:
+                while copied < size:
+                    if copy is os.sendfile:
+                        n = os.sendfile(dst.fileno(), src.fileno(), copied, size - copied)
+                    else:
+                        n = os.copy_file_range(src.fileno(), dst.fileno(), size - copied, copied, copied)
+                    if n == 0:
+                        break
+                    copied += n
+                return copied
+            except OSError as e:
+                if copied:
+                    raise
+                self.logger.debug(f"{copy.__name__} not available here ({str(e)}), trying the next method")
+
+        src.seek(0)
+        dst.seek(0)
+        shutil.copyfileobj(src, dst)
+        return dst.tell()
@@ -0,0 +1,142 @@
+# airflow DAG
+from adapters.storage_adapter.base_adapter import BaseStorageAdapter, FileEntry
+import posixpath
+import threading
+import time
+
+
+class MemoryStorageAdapter(BaseStorageAdapter):
+    """Files kept in process memory, one namespace per conn_id (tests, benchmarks, staging between tasks
+    of the same process)"""
+
+    supports_ranges = True
+
+    # conn_id => {path: [data, mtime]}, data is bytes once written so readers can share it without copies
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    def __init__(self, conn_id='default'):
+        self.conn_id = conn_id
+        with self._stores_lock:
+            self.files = self._stores.setdefault(conn_id, {})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def clear_all(cls):
+        with cls._stores_lock:
+            for files in cls._stores.values():
+                files.clear()
+
+    @staticmethod
+    def _normalize(path):
+        return posixpath.normpath('/' + path.strip('/'))
+
+    def _get(self, file_path):
+        try:
+            return self.files[self._normalize(file_path)]
+        except KeyError:
+            raise FileNotFoundError(file_path) from None
+
+    def _children(self, path):
+        prefix = self._normalize(path).rstrip('/') + '/'
+        children = {}
+        for file_path, (data, mtime) in list(self.files.items()):
+            if not file_path.startswith(prefix):
+                continue
+            name, sep, _ = file_path[len(prefix):].partition('/')
+            if sep:
+                children.setdefault(name, FileEntry(name, None, None, True))
+            else:
+                children[name] = FileEntry(name, len(data), mtime, False)
+        return children
+
+    def list_files(self, path):
+        return list(self._list(path))
+
+    def list_entries(self, path):
+        return list(self._list(path).values())
+
+    def _list(self, path):
+        children = self._children(path)
+        if not children and self._normalize(path) in self.files:
+            raise NotADirectoryError(path)
+        return children
+
+    def read_file_chunks(self, file_path, chunk_size):
+        yield from self.read_file_range(file_path, 0, None, chunk_size)
+
+    def read_file_range(self, file_path, offset, length, chunk_size):
+        data = bytes(self._get(file_path)[0])
+        end = len(data) if length is None else min(len(data), offset + length)
+        # slices of a view over immutable bytes, nothing is copied
+        view = memoryview(data)
+        while offset < end:
+            yield view[offset:min(offset + chunk_size, end)]
+            offset += chunk_size
+
+    def write_file_chunks(self, file_path, chunks):
+        # copied as they come, chunks may be views of buffers the reader reuses
+        data = bytearray()
+        for chunk in chunks:
+            data += chunk
+        self.files[self._normalize(file_path)] = [bytes(data), time.time()]
+        return len(data)
+
+    def create_file(self, file_path):
+        self.files[self._normalize(file_path)] = [b'', time.time()]
+
+    def write_file_at(self, file_path, offset, chunks):
+        # segments of one file are written from several threads
+        with self._lock:
+            record = self._get(file_path)
+            if not isinstance(record[0], bytearray):
+                record[0] = bytearray(record[0])
+        total_bytes = 0
+        for chunk in chunks:
+            with self._lock:
+                data = record[0]
+                end = offset + len(chunk)
+                if len(data) < end:
+                    data.extend(bytes(end - len(data)))
+                data[offset:end] = chunk
+            offset = end
+            total_bytes += len(chunk)
+        record[1] = time.time()
+        return total_bytes
+
+    def delete_file(self, file_path):
+        self.files.pop(self._normalize(file_path), None)
+
+    def rename_file(self, old_path, new_path):
+        record = self.files.pop(self._normalize(old_path), None)
+        if record is None:
+            raise FileNotFoundError(old_path)
+        if isinstance(record[0], bytearray):
+            record[0] = bytes(record[0])
+        self.files[self._normalize(new_path)] = record
+
+    def is_directory(self, path):
+        if self._normalize(path) in self.files:
+            return False
+        if self._children(path):
+            return True
+        raise FileNotFoundError(path)
+
+    def get_file_size(self, file_path):
+        return len(self._get(file_path)[0])
+
+    def stat_file(self, file_path):
+        name = file_path.rstrip('/').split('/')[-1]
+        if self._normalize(file_path) not in self.files and self.is_directory(file_path):
+            return FileEntry(name, None, None, True)
+        data, mtime = self._get(file_path)
+        return FileEntry(name, len(data), mtime, False)
+
+    def can_copy_to(self, target_adapter):
+        return isinstance(target_adapter, MemoryStorageAdapter)
+
+    def copy_file_to(self, target_adapter, source_path, target_path):
+        # bytes are immutable => both paths can point to the same object
+        data = bytes(self._get(source_path)[0])
+        target_adapter.files[target_adapter._normalize(target_path)] = [data, time.time()]
+        return len(data)
@@ -0,0 +1,246 @@
+# airflow DAG
+from adapters.storage_adapter.base_adapter import BaseStorageAdapter, FileEntry
+from airflow.providers.amazon.aws.hooks.s3 import S3Hook
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+
+
+class S3StorageAdapter(BaseStorageAdapter):
+    """S3 (or any S3 compatible store) through an Airflow AWS connection
+
+    The bucket comes from the 'bucket_name' extra of the connection, without it the first path
+    component is the bucket (/bucket/a/b/file.txt). Uploads are multipart with up to max_concurrency
+    parts in flight, reads are ranged GETs of part_size bytes issued max_concurrency at a time.
+    """
+
+    # an object only shows up once its upload is complete, so there is no need for temp file + rename
+    atomic_writes = True
+
+    # S3 refuses multipart parts under 5MB (except the last one)
+    min_part_size = 5 * 1024 * 1024
+
+    def __init__(self, conn_id='aws_default', bucket=None, part_size=16 * 1024 * 1024, max_concurrency=8):
+        self.conn_id = conn_id
+        self.part_size = max(self.min_part_size, part_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        hook = S3Hook(aws_conn_id=conn_id)
+        if bucket is None and conn_id:
+            extras = hook.get_connection(conn_id).extra_dejson
+            bucket = extras.get('bucket_name') or extras.get('service_config', {}).get('s3', {}).get('bucket_name')
+        self.bucket = bucket
+        # boto3 clients are thread safe, one is shared by every transfer of the task
+        self.client = hook.get_conn()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        # parts are uploaded and ranges fetched by a pool shared by all files using this adapter,
+        # callers only wait on it, so a busy pool can't deadlock
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='s3')
+            return self._executor
+
+    def _split_path(self, path):
+        path = path.strip('/')
+        if self.bucket:
+            return self.bucket, path
+        bucket, _, key = path.partition('/')
+        return bucket, key
+
+    @staticmethod
+    def _prefix(key):
+        return f"{key}/" if key else ''
+
+    def list_files(self, path):
+        return [entry.name for entry in self.list_entries(path)]
+
+    def list_entries(self, path):
+        # one level, "directories" are the common prefixes of the keys
+        bucket, key = self._split_path(path)
+        prefix = self._prefix(key)
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+            for common_prefix in page.get('CommonPrefixes', []):
+                yield FileEntry(common_prefix['Prefix'][len(prefix):].rstrip('/'), 0, None, True)
+            for obj in page.get('Contents', []):
+                name = obj['Key'][len(prefix):]
+                if name:
+                    yield FileEntry(name, obj['Size'], obj['LastModified'].timestamp(), False)
+
+    def walk(self, path, recursive=True, max_workers=1):
+        if not recursive:
+            yield from self.list_entries(path)
+            return
+        # keys are flat, one paginated listing of the prefix returns the whole tree (only the files)
+        bucket, key = self._split_path(path)
+        prefix = self._prefix(key)
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                name = obj['Key'][len(prefix):]
+                if name and not name.endswith('/'):
+                    yield FileEntry(name, obj['Size'], obj['LastModified'].timestamp(), False)
+
+    def read_file_chunks(self, file_path, chunk_size):
+        yield from self.read_file_range(file_path, 0, None, chunk_size)
+
+    def read_file_range(self, file_path, offset, length, chunk_size):
+        bucket, key = self._split_path(file_path)
+        end = self.get_file_size(file_path)
+        if length is not None:
+            end = min(end, offset + length)
+
+        # ranges smaller than a part would mostly pay the request latency
+        range_size = max(chunk_size, self.part_size)
+        executor = self._get_executor()
+        in_flight = deque()
+        try:
+            while offset < end or in_flight:
+                while offset < end and len(in_flight) < self.max_concurrency:
+                    last = min(offset + range_size, end) - 1
+                    in_flight.append(executor.submit(self._get_range, bucket, key, offset, last))
+                    offset = last + 1
+                yield in_flight.popleft().result()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def _get_range(self, bucket, key, first, last):
+        with self._governed():
+            started = time.monotonic()
+            response = self.client.get_object(Bucket=bucket, Key=key, Range=f'bytes={first}-{last}')
+            body = response['Body'].read()
+            self._account(len(body), time.monotonic() - started)
+        return body
+
+    def write_file_chunks(self, file_path, chunks):
+        bucket, key = self._split_path(file_path)
+        chunks = iter(chunks)
+        buffer = bytearray()
+        total_bytes = 0
+
+        # small objects go in a single PUT
+        for chunk in chunks:
+            buffer += chunk
+            total_bytes += len(chunk)
+            if len(buffer) >= self.part_size:
+                break
+        else:
+            with self._governed():
+                started = time.monotonic()
+                self.client.put_object(Bucket=bucket, Key=key, Body=bytes(buffer))
+                self._account(total_bytes, time.monotonic() - started)
+            return total_bytes
+
+        upload_id = self.client.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+        executor = self._get_executor()
+        in_flight = deque()
+        parts = []
+        try:
+            part_number = 1
+            while True:
+                # parts are cut at part_size whatever the chunk size, only the last one can be smaller
+                while len(buffer) >= self.part_size:
+                    body = bytes(buffer[:self.part_size])
+                    del buffer[:self.part_size]
+                    # at most max_concurrency parts held in memory
+                    if len(in_flight) >= self.max_concurrency:
+                        parts.append(in_flight.popleft().result())
+                    in_flight.append(executor.submit(self._upload_part, bucket, key, upload_id, part_number, body))
+                    part_number += 1
+
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                buffer += chunk
+                total_bytes += len(chunk)
+
+            if buffer:
+                in_flight.append(
+                    executor.submit(self._upload_part, bucket, key, upload_id, part_number, bytes(buffer))
+                )
+            while in_flight:
+                parts.append(in_flight.popleft().result())
+
+            self.client.complete_multipart_upload(
+                Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            for future in in_flight:
+                future.cancel()
+            try:
+                self.client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+            except Exception as e:
+                self.logger.warning(f"error aborting multipart upload of {file_path}: {str(e)}")
+            raise
+        return total_bytes
+
+    def _upload_part(self, bucket, key, upload_id, part_number, body):
+        with self._governed():
+            started = time.monotonic()
+            response = self.client.upload_part(
+                Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body
+            )
+            self._account(len(body), time.monotonic() - started)
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    def delete_file(self, file_path):
+        bucket, key = self._split_path(file_path)
+        # deleting a missing key is not an error on S3
+        self.client.delete_object(Bucket=bucket, Key=key)
+
+    def rename_file(self, old_path, new_path):
+        # no rename on S3: server side copy (multipart copy above 5GB, parts copied in parallel) then delete
+        old_bucket, old_key = self._split_path(old_path)
+        new_bucket, new_key = self._split_path(new_path)
+        self.client.copy(
+            {'Bucket': old_bucket, 'Key': old_key},
+            new_bucket,
+            new_key,
+            Config=TransferConfig(
+                multipart_threshold=self.part_size,
+                multipart_chunksize=self.part_size,
+                max_concurrency=self.max_concurrency
+            )
+        )
+        self.client.delete_object(Bucket=old_bucket, Key=old_key)
+
+    def is_directory(self, path):
+        bucket, key = self._split_path(path)
+        if key and self._head(bucket, key) is not None:
+            return False
+        response = self.client.list_objects_v2(Bucket=bucket, Prefix=self._prefix(key), MaxKeys=1)
+        if response.get('KeyCount', 0):
+            return True
+        raise FileNotFoundError(path)
+
+    def _head(self, bucket, key):
+        try:
+            return self.client.head_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def _head_file(self, file_path):
+        bucket, key = self._split_path(file_path)
+        head = self._head(bucket, key)
+        if head is None:
+            raise FileNotFoundError(file_path)
+        return head
+
+    def get_file_size(self, file_path):
+        return self._head_file(file_path)['ContentLength']
+
+    def stat_file(self, file_path):
+        head = self._head_file(file_path)
+        name = file_path.rstrip('/').split('/')[-1]
+        return FileEntry(name, head['ContentLength'], head['LastModified'].timestamp(), False)
@@ -4,50 +4,309 @@
 # sys.path.insert(0, str(plugins_dir))
 
 # airflow DAG
-from adapters.storage_adapter.base_adapter import BaseStorageAdapter
-from airflow.providers.sftp.hooks.sftp import SFTPHook
+from adapters.storage_adapter.base_adapter import BaseStorageAdapter, FileEntry
+from adapters.storage_adapter.sftp_pool import SFTPConnectionPool
+from contextlib import contextmanager
+from paramiko import SFTPAttributes
+from paramiko.sftp import CMD_ATTRS, CMD_DATA, CMD_MKDIR, CMD_READ, CMD_STAT, CMD_STATUS, SFTP_EOF, SFTP_OK, int64
+from collections import deque
 import logging
+import posixpath
 import stat
+import threading
+import time
+
+
+class _PipelinedRequests:
+    """Send several metadata requests on one channel before reading any reply
+
+    Same mechanism paramiko uses for prefetch: replies are dispatched to us by request number.
+    """
+
+    def __init__(self, sftp):
+        self.sftp = sftp
+        self._requests = {}
+        self._replies = {}
+
+    def send(self, key, t, *args):
+        self._requests[self.sftp._async_request(self, t, *args)] = key
+
+    def _async_response(self, t, msg, num):
+        self._replies[self._requests.pop(num)] = (t, msg)
+
+    def wait(self):
+        while self._requests:
+            self.sftp._read_response()
+        replies, self._replies = self._replies, {}
+        return replies
+
+
+class _PipelinedReader:
+    """readinto() for an open SFTP file: the range is split in read requests of block_size, up to max_requests
+    in flight, and every reply is copied straight into the caller's buffer
+
+    paramiko's read()/readv() assemble each chunk in a bytearray then copy it to a new bytes object, here the
+    only copy is the one out of the packet.
+    """
+
+    def __init__(self, sftp, handle, block_size=32768, max_requests=64):
+        self.sftp = sftp
+        self.handle = handle
+        self.block_size = block_size
+        self.max_requests = max_requests
+        self._requests = {}
+        self._replies = deque()
+
+    def _async_response(self, t, msg, num):
+        self._replies.append((self._requests.pop(num), t, msg))
+
+    def readinto(self, view, offset):
+        pending = deque(
+            (position, min(self.block_size, len(view) - position)) for position in range(0, len(view), self.block_size)
+        )
+        # shrinks to the end of the file when the server answers EOF
+        size = len(view)
+        while pending or self._requests:
+            while pending and len(self._requests) < self.max_requests:
+                position, length = pending.popleft()
+                if position < size:
+                    num = self.sftp._async_request(self, CMD_READ, self.handle, int64(offset + position), length)
+                    self._requests[num] = (position, length)
+            self.sftp._read_response()
+            while self._replies:
+                (position, length), t, msg = self._replies.popleft()
+                if t == CMD_DATA:
+                    data = msg.get_string()
+                    view[position:position + len(data)] = data
+                    if not data:
+                        size = min(size, position)
+                    elif len(data) < length:
+                        # servers may answer with less than asked, ask for the rest
+                        pending.appendleft((position + len(data), length - len(data)))
+                elif t == CMD_STATUS:
+                    # the request number was already read from the message by paramiko
+                    code = msg.get_int()
+                    if code != SFTP_EOF:
+                        msg.rewind()
+                        msg.get_int()
+                        self.sftp._convert_status(msg)
+                    size = min(size, position)
+                else:
+                    raise IOError(f"unexpected SFTP response {t} to a read request")
+        return size
 
 
 class SFTPStorageAdapter(BaseStorageAdapter):
-    def __init__(self, conn_id: str):
+    supports_ranges = True
+
+    def __init__(self, conn_id: str, max_channels: int = 8, idle_timeout: int = 300,
+                 read_ahead_chunks: int = 2, max_concurrent_requests: int = 64):
         self.conn_id = conn_id
-        self.hook = SFTPHook(ssh_conn_id=conn_id)
+        # number of chunks requested ahead of the consumer and number of outstanding SFTP read requests
+        self.read_ahead_chunks = max(1, read_ahead_chunks)
+        self.max_concurrent_requests = max_concurrent_requests
+        # channels are checked out from a per-process pool, so every adapter (and every thread)
+        # using the same connection shares one SSH transport instead of paying the handshake again
+        self.pool = SFTPConnectionPool.get_pool(conn_id, max_channels=max_channels, idle_timeout=idle_timeout)
         self.logger = logging.getLogger(self.__class__.__name__)
+        # directories known to exist on the server, so writing a file doesn't stat its whole path again
+        self._known_directories = set()
+        self._directories_lock = threading.Lock()
+        # whether the server does posix-rename@openssh.com, None until the first rename tells us
+        self._posix_rename = None
+        # hash algorithms the server refused for check-file (most servers don't implement the extension)
+        self._unsupported_checksums = set()
+
+    @contextmanager
+    def _channel(self):
+        # the governor slot is taken before the pool channel, so tasks waiting on it hold no channel
+        with self._governed(), self.pool.channel() as sftp:
+            yield sftp
 
     def list_files(self, path):
-        sftp = self.hook.get_conn()
-        return sftp.listdir(path)
+        with self._channel() as sftp:
+            return sftp.listdir(path)
+
+    def list_entries(self, path):
+        # the attributes come back in the same round trip as the names, listdir_iter keeps several READDIR
+        # requests in flight. The listing is read fully before the first entry goes out: callers (walk feeding
+        # the transfers) read files between two entries, and holding the channel and governor slot meanwhile
+        # deadlocks once max_channels is 1
+        with self._channel() as sftp:
+            entries = [
+                FileEntry(attr.filename, attr.st_size or 0, attr.st_mtime, stat.S_ISDIR(attr.st_mode or 0))
+                for attr in sftp.listdir_iter(path)
+            ]
+        yield from entries
 
     def read_file_chunks(self, file_path, chunk_size):
-        sftp = self.hook.get_conn()
-        with sftp.open(file_path, 'rb') as f:
-            while True:
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                yield chunk
+        with self._channel() as sftp:
+            with sftp.open(file_path, 'rb') as f:
+                file_size = f.stat().st_size
+                yield from self._read_range(f, 0, file_size, chunk_size)
+
+    def read_file_range(self, file_path, offset, length, chunk_size):
+        with self._channel() as sftp:
+            with sftp.open(file_path, 'rb') as f:
+                end = min(offset + length, f.stat().st_size)
+                yield from self._read_range(f, offset, end, chunk_size)
+
+    def _read_range(self, f, offset, end, chunk_size):
+        if self.buffer_pool is not None:
+            # requests answered straight into pooled buffers
+            reader = _PipelinedReader(f.sftp, f.handle, max_requests=self.max_concurrent_requests)
+            yield from self._governed_chunks(self._read_into_buffers(reader.readinto, offset, end, chunk_size))
+            return
+
+        # a plain read() waits for one 32KB request at a time, readv() keeps many requests
+        # in flight on the channel; we only ask for read_ahead_chunks at once to bound memory
+        while offset < end:
+            ranges = []
+            while offset < end and len(ranges) < self.read_ahead_chunks:
+                length = min(chunk_size, end - offset)
+                ranges.append((offset, length))
+                offset += length
+            yield from self._governed_chunks(
+                f.readv(ranges, max_concurrent_prefetch_requests=self.max_concurrent_requests)
+            )
+
+    def get_file_size(self, file_path):
+        with self._channel() as sftp:
+            return sftp.stat(file_path).st_size
+
+    def get_checksum(self, file_path, algorithm):
+        if algorithm in self._unsupported_checksums:
+            return None
+        with self._channel() as sftp:
+            with sftp.open(file_path, 'rb') as f:
+                try:
+                    return f.check(algorithm).hex()
+                except IOError as e:
+                    # same as posix-rename, a missing extension or algorithm is a failure without errno
+                    if e.errno is not None:
+                        raise
+        self._unsupported_checksums.add(algorithm)
+        self.logger.info(f"check-file with {algorithm} not supported by {self.conn_id}")
+        return None
+
+    def stat_file(self, file_path):
+        with self._channel() as sftp:
+            attr = sftp.stat(file_path)
+        name = file_path.rstrip('/').split('/')[-1]
+        return FileEntry(name, attr.st_size or 0, attr.st_mtime, stat.S_ISDIR(attr.st_mode or 0))
 
     def write_file_chunks(self, file_path: str, chunks):
-        sftp = self.hook.get_conn()
+        with self._channel() as sftp:
+            # suppose the source directory is /source/data/file.txt
+            # we need to ensure /source/data/ exists in the target SFTP server
+            with self._open_for_write(sftp, file_path) as f:
+                return self._write_chunks(f, chunks)
 
-        # suppose the source directory is /source/data/file.txt
-        # we need to ensure /source/data/ exists in the target SFTP server
-        parent_dir = '/'.join(file_path.split('/')[:-1])
-        if parent_dir:
-            self._create_directory_if_not_exists(sftp, parent_dir)
+    def create_file(self, file_path):
+        with self._channel() as sftp:
+            with self._open_for_write(sftp, file_path):
+                pass
+
+    def _open_for_write(self, sftp, file_path):
+        self._create_parent_directory(sftp, file_path)
+        try:
+            return sftp.open(file_path, 'wb')
+        except FileNotFoundError:
+            # the cached parent was removed behind our back, forget it and create it again
+            self._forget_directory(posixpath.dirname(file_path))
+            self._create_parent_directory(sftp, file_path)
+            return sftp.open(file_path, 'wb')
+
+    def write_file_at(self, file_path, offset, chunks):
+        with self._channel() as sftp:
+            # r+b keeps what other segments already wrote into the file
+            with sftp.open(file_path, 'r+b') as f:
+                f.seek(offset)
+                return self._write_chunks(f, chunks)
 
+    def _write_chunks(self, f, chunks):
+        # don't wait for the server ack of every write request, errors are raised on close
+        f.set_pipelined(True)
         total_bytes = 0
-        with sftp.open(file_path, 'wb') as f:
-            for chunk in chunks:
-                f.write(chunk)
-                total_bytes += len(chunk)
+        for chunk in chunks:
+            started = time.monotonic()
+            f.write(chunk)
+            self._account(len(chunk), time.monotonic() - started)
+            total_bytes += len(chunk)
         return total_bytes
 
+    def _create_parent_directory(self, sftp, file_path):
+        parent_dir = '/'.join(file_path.split('/')[:-1])
+        if parent_dir and not self._is_known_directory(parent_dir):
+            self._create_directory_if_not_exists(sftp, parent_dir)
+
+    def _is_known_directory(self, directory):
+        with self._directories_lock:
+            return directory in self._known_directories
+
+    def _remember_directory(self, directory):
+        with self._directories_lock:
+            # the parents of an existing directory exist as well
+            while directory and directory != '/' and directory not in self._known_directories:
+                self._known_directories.add(directory)
+                directory = posixpath.dirname(directory)
+
+    def _forget_directory(self, directory):
+        with self._directories_lock:
+            self._known_directories = {
+                known for known in self._known_directories
+                if known != directory and not known.startswith(directory.rstrip('/') + '/')
+            }
+
+    def ensure_directories(self, directories):
+        """Create the missing directories (and parents) with pipelined requests
+
+        One round trip to stat every unknown directory, then one round trip per missing level of mkdir,
+        instead of a stat per path level per file.
+        """
+        pending = set()
+        for directory in directories:
+            while directory and directory != '/' and not self._is_known_directory(directory):
+                pending.add(directory)
+                directory = posixpath.dirname(directory)
+        if not pending:
+            return
+
+        with self._channel() as sftp:
+            requests = _PipelinedRequests(sftp)
+            for directory in pending:
+                requests.send(directory, CMD_STAT, directory)
+            missing = set()
+            for directory, (t, msg) in requests.wait().items():
+                if t == CMD_ATTRS:
+                    if not stat.S_ISDIR(SFTPAttributes._from_msg(msg).st_mode or 0):
+                        raise NotADirectoryError(directory)
+                    self._remember_directory(directory)
+                else:
+                    missing.add(directory)
+
+            # parents before children, every directory of one depth in the same round trip
+            for depth in sorted({directory.count('/') for directory in missing}):
+                level = [directory for directory in missing if directory.count('/') == depth]
+                for directory in level:
+                    attr = SFTPAttributes()
+                    attr.st_mode = 0o777
+                    requests.send(directory, CMD_MKDIR, directory, attr)
+                for directory, (t, msg) in requests.wait().items():
+                    if t == CMD_STATUS and msg.get_int() != SFTP_OK:
+                        # most likely created by someone else in the meantime, the stat tells
+                        if not stat.S_ISDIR(sftp.stat(directory).st_mode):
+                            raise NotADirectoryError(directory)
+                    self._remember_directory(directory)
+            if missing:
+                self.logger.info(f"Created {len(missing)} directories")
+
     def _create_directory_if_not_exists(self, sftp, directory):
+        if self._is_known_directory(directory):
+            return
         try:
             sftp.stat(directory)
+            self._remember_directory(directory)
         except FileNotFoundError:
             # we need to recursively create parent directories because SFTP has no mkdir -p
             parent_dir = '/'.join(directory.split('/')[:-1])
@@ -62,30 +321,45 @@ class SFTPStorageAdapter(BaseStorageAdapter):
                     sftp.stat(directory)
                 except FileNotFoundError:
                     raise
+            self._remember_directory(directory)
 
     def delete_file(self, file_path):
-        sftp = self.hook.get_conn()
-        try:
-            sftp.remove(file_path)
-        except FileNotFoundError:
-            pass
+        with self._channel() as sftp:
+            try:
+                sftp.remove(file_path)
+            except FileNotFoundError:
+                pass
     
     def rename_file(self, old_path: str, new_path: str) -> None:
-        sftp = self.hook.get_conn()
+        with self._channel() as sftp:
+            if self._posix_rename is not False:
+                # posix-rename@openssh.com overwrites atomically in one round trip
+                try:
+                    sftp.posix_rename(old_path, new_path)
+                    self._posix_rename = True
+                    return
+                except IOError as e:
+                    # errno is only set for real errors (no such file, permission...), an unsupported
+                    # extension comes back as a bare failure
+                    if e.errno is not None or self._posix_rename:
+                        raise
 
-        try:
-            sftp.remove(new_path)
-        except FileNotFoundError:
-            pass
-        sftp.rename(old_path, new_path)
+            try:
+                sftp.remove(new_path)
+            except FileNotFoundError:
+                pass
+            sftp.rename(old_path, new_path)
+            if self._posix_rename is None:
+                self._posix_rename = False
+                self.logger.info(f"posix-rename not supported by {self.conn_id}, using remove + rename")
 
     def is_directory(self, path):
-        sftp = self.hook.get_conn()
-        try:
-            file_stat = sftp.stat(path)
-            return stat.S_ISDIR(file_stat.st_mode)
-        except Exception as e:
-            raise
+        with self._channel() as sftp:
+            try:
+                file_stat = sftp.stat(path)
+                return stat.S_ISDIR(file_stat.st_mode)
+            except Exception as e:
+                raise
 
 
 # if __name__ == "__main__":
@@ -0,0 +1,159 @@
+# airflow DAG
+from airflow.providers.ssh.hooks.ssh import SSHHook
+from contextlib import contextmanager
+import logging
+import os
+import paramiko
+import threading
+import time
+
+
+class SFTPConnectionPool:
+    """Share one SSH transport per conn_id and multiplex SFTP channels over it
+
+    A checkout waits at most checkout_timeout seconds for a free channel. Channels (and the transport)
+    are opened outside the pool lock, a slow SSH handshake doesn't hold up the other threads.
+    """
+
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, conn_id, max_channels=8, idle_timeout=300, checkout_timeout=300):
+        self.conn_id = conn_id
+        self.max_channels = max_channels
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._ssh_client = None
+        self._idle = []  # list of (sftp, released_at)
+        self._in_use = 0
+        self._last_used = time.monotonic()
+        self._cond = threading.Condition()
+        # one thread opens the transport, the others wait for it instead of opening their own
+        self._transport_lock = threading.Lock()
+
+    @classmethod
+    def get_pool(cls, conn_id, max_channels=8, idle_timeout=300, checkout_timeout=300):
+        # transports can't be shared with a forked child, so pools are also keyed by process
+        key = (os.getpid(), conn_id)
+        with cls._pools_lock:
+            pool = cls._pools.get(key)
+            if pool is None:
+                pool = cls(
+                    conn_id, max_channels=max_channels, idle_timeout=idle_timeout, checkout_timeout=checkout_timeout
+                )
+                cls._pools[key] = pool
+            return pool
+
+    @classmethod
+    def close_all(cls):
+        with cls._pools_lock:
+            pools = list(cls._pools.values())
+            cls._pools.clear()
+        for pool in pools:
+            pool.close()
+
+    @contextmanager
+    def channel(self, timeout=None):
+        sftp = self.checkout(timeout=timeout)
+        try:
+            yield sftp
+        finally:
+            self.checkin(sftp)
+
+    def checkout(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                self._evict_idle()
+                while self._idle:
+                    sftp, _ = self._idle.pop()
+                    if self._is_healthy(sftp):
+                        self._in_use += 1
+                        return sftp
+                    self._close_channel(sftp)
+
+                if self._in_use < self.max_channels:
+                    # the slot is ours, the channel is opened once the lock is released
+                    self._in_use += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"no SFTP channel for {self.conn_id} after {timeout}s, all {self.max_channels} are in use"
+                    )
+                self._cond.wait(remaining)
+
+        try:
+            return paramiko.SFTPClient.from_transport(self._get_transport())
+        except BaseException:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def checkin(self, sftp):
+        with self._cond:
+            self._in_use -= 1
+            self._last_used = time.monotonic()
+            if self._is_healthy(sftp):
+                self._idle.append((sftp, self._last_used))
+            else:
+                self._close_channel(sftp)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            for sftp, _ in self._idle:
+                self._close_channel(sftp)
+            self._idle = []
+            self._close_transport()
+
+    def _get_transport(self):
+        with self._transport_lock:
+            transport = self._ssh_client.get_transport() if self._ssh_client else None
+            if transport is None or not transport.is_active():
+                # the transport is broken or never opened, idle channels on it fail _is_healthy() and are dropped
+                self._close_transport()
+
+                self._ssh_client = SSHHook(ssh_conn_id=self.conn_id).get_conn()
+                transport = self._ssh_client.get_transport()
+                self.logger.info(f"opened SSH transport for {self.conn_id}")
+            return transport
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        keep = []
+        for sftp, released_at in self._idle:
+            if now - released_at > self.idle_timeout:
+                self._close_channel(sftp)
+            else:
+                keep.append((sftp, released_at))
+        self._idle = keep
+
+        # nothing checked out and nothing left to reuse => drop the transport as well
+        if not self._idle and self._in_use == 0 and now - self._last_used > self.idle_timeout:
+            self._close_transport()
+
+    def _is_healthy(self, sftp):
+        channel = sftp.get_channel()
+        if channel is None or channel.closed:
+            return False
+        transport = channel.get_transport()
+        return transport is not None and transport.is_active()
+
+    def _close_channel(self, sftp):
+        try:
+            sftp.close()
+        except Exception as e:
+            self.logger.warning(f"error closing SFTP channel for {self.conn_id}: {str(e)}")
+
+    def _close_transport(self):
+        if self._ssh_client is not None:
+            try:
+                self._ssh_client.close()
+            except Exception as e:
+                self.logger.warning(f"error closing SSH transport for {self.conn_id}: {str(e)}")
+            self._ssh_client = None
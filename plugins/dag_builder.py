@@ -1,5 +1,104 @@
 import airflow
+from airflow.utils.module_loading import import_string
+from jinja2 import Template
+import yaml
+import functools
+import hashlib
+import json
 import logging
+import os
+import pickle
+import stat
+import tempfile
+
+try:
+    # libyaml parser, same python tags as yaml.Loader
+    from yaml import CLoader as Loader
+except ImportError:
+    from yaml import Loader
+
+
+# parsed configs of this process, key => configs
+_config_cache = {}
+
+
+def load_dag_config(template_path, config=None, cache_dir=None):
+    """Render the Jinja config template with config and parse the YAML, cached by template content + inputs
+
+    The scheduler parses DAG files in short lived processes, so besides the in-process cache the parsed
+    config is pickled under cache_dir (DAG_BUILDER_CACHE_DIR, default a per user directory in the temp dir);
+    a new template or new inputs give a new key, stale files of the same template are removed.
+    Loading a pickle runs code, so the cache is only used when cache_dir is a directory of the current
+    user that nobody else can write to, otherwise the config is rendered every time.
+    """
+    with open(template_path, 'r') as infile:
+        template_text = infile.read()
+
+    key = hashlib.sha256(
+        '\0'.join([
+            template_text,
+            json.dumps(config, sort_keys=True, default=str),
+            Loader.__name__,
+            yaml.__version__,
+        ]).encode()
+    ).hexdigest()
+    if key in _config_cache:
+        return _config_cache[key]
+
+    cache_dir = cache_dir or os.environ.get('DAG_BUILDER_CACHE_DIR') or os.path.join(
+        tempfile.gettempdir(), f'dag_builder_cache-{os.getuid()}'
+    )
+    name = hashlib.sha256(os.path.abspath(template_path).encode()).hexdigest()[:16]
+    cache_file = os.path.join(cache_dir, f'{name}-{key}.pickle')
+    use_cache = _private_cache_dir(cache_dir)
+    try:
+        if not use_cache:
+            raise FileNotFoundError(cache_file)
+        with open(cache_file, 'rb') as f:
+            configs = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        rendered_config = Template(template_text).render(config=config)
+        configs = yaml.load(rendered_config, Loader=Loader)
+        if use_cache:
+            _write_cache(cache_dir, name, cache_file, configs)
+
+    _config_cache[key] = configs
+    return configs
+
+
+def _private_cache_dir(cache_dir):
+    # whoever can write to cache_dir can plant a pickle, only trust a directory of ours closed to others
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        st = os.lstat(cache_dir)
+    except OSError as e:
+        logging.getLogger(__name__).warning(f"DAG config cache disabled, can't create {cache_dir}: {str(e)}")
+        return False
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o022:
+        logging.getLogger(__name__).warning(
+            f"DAG config cache disabled, {cache_dir} is not a directory owned by this user and only writable by it"
+        )
+        return False
+    return True
+
+
+def _write_cache(cache_dir, name, cache_file, configs):
+    try:
+        for old_file in os.listdir(cache_dir):
+            if old_file.startswith(f'{name}-'):
+                os.remove(os.path.join(cache_dir, old_file))
+        temp_file = f'{cache_file}.{os.getpid()}.tmp'
+        with os.fdopen(os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            pickle.dump(configs, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, cache_file)
+    except (OSError, pickle.PicklingError) as e:
+        # no cache is only slower
+        logging.getLogger(__name__).warning(f"could not cache DAG config in {cache_dir}: {str(e)}")
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve_operator(operator):
+    return import_string(operator)
 
 
 class DagBuilder():
@@ -12,7 +111,7 @@ class DagBuilder():
         dag_id = self.configs['DAG']['dag_id']
         self.logger = logging.getLogger(dag_id)
 
-        dag_kwargs = self.configs['DAG']['args']
+        dag_kwargs = dict(self.configs['DAG']['args'])
         dag_kwargs['dag_id'] = dag_id
         dag = airflow.models.DAG(**dag_kwargs)
         with dag:
@@ -21,8 +120,12 @@ class DagBuilder():
             # build tasks
             for task_id in cfg_all_tasks:
                 operator = cfg_all_tasks[task_id]['operator']
+                # operators can be given as a dotted path instead of !!python/name, the YAML then loads
+                # without importing anything
+                if isinstance(operator, str):
+                    operator = _resolve_operator(operator)
                 if 'args' in cfg_all_tasks[task_id]:
-                    task_kwargs = cfg_all_tasks[task_id]['args']
+                    task_kwargs = dict(cfg_all_tasks[task_id]['args'])
                 else:
                     task_kwargs = {}
                 task_kwargs['task_id'] = task_id
@@ -35,4 +138,4 @@ class DagBuilder():
                         tasks[ups] for ups in cfg['upstream']
                     ]
                     tasks[task_id].set_upstream(upstream)
-        return dag
\ No newline at end of file
+        return dag
@@ -1,4 +1,6 @@
 # airflow operators
 from operators.file_sync_operator import FileSyncOperator
+from operators.shard_plan_operator import ShardPlanOperator
+from operators.sync_completion_operator import SyncCompletionOperator
 
-__all__ = ['FileSyncOperator']
+__all__ = ['FileSyncOperator', 'ShardPlanOperator', 'SyncCompletionOperator']
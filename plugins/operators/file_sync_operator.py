@@ -1,20 +1,57 @@
 # airflow DAG
 from airflow.models import BaseOperator
 from airflow.exceptions import AirflowException
+from airflow.stats import Stats
+from airflow.utils.module_loading import import_string
+from adapters.storage_adapter.async_adapter import iterate_from_loop, iterate_in_thread
+from adapters.storage_adapter.base_adapter import FileEntry
+from adapters.storage_adapter.buffer_pool import BufferPool
 from adapters.storage_adapter.factory import StorageAdapterFactory
+from transfer.checkpoint_store import create_checkpoint_store
+from transfer.codecs import CompressionStats, compress_chunks, get_codec
+from transfer.manifest import create_manifest
+from transfer.metrics import TransferMetrics
+from transfer.parallel_transform import ordered_pool_map
+from transfer.partitions import (
+    check_marker_path, date_partitions, in_partitions, pending_partitions, rerun_requested, walk_partitions
+)
+from transfer.pipeline import PipelinedStream
+from transfer.transforms import stream_transform
+from transfer.work_queue import create_work_queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, FIRST_EXCEPTION, wait
+from contextlib import nullcontext
 import logging
 from datetime import datetime
 import os
 import hashlib
+import functools
+import asyncio
+import multiprocessing
+import threading
+import time
+
+
+_NO_MORE_FILES = object()
+_NOT_TIMED = nullcontext()
 
 
 class FileSyncOperator(BaseOperator):
-    template_fields = ['source_path']
+    template_fields = ['source_path', 'partition_root', 'backfill_start', 'backfill_end']
 
     def __init__(
         self, source_type, target_type, source_conn_id, target_conn_id,
         source_path, modulo_id, num_batches, chunk_size = 10 * 1024 * 1024,  # 10MB default
-        transformation_func = None, **kwargs):
+        transformation_func = None, max_parallel_files = 1, pipeline_depth = 0, pipeline_max_bytes = None,
+        segment_threshold = None, segment_size = 256 * 1024 * 1024, max_parallel_segments = 4,
+        plan_task_id = None, list_workers = 1, incremental = None, incremental_hash = False,
+        checkpoint_backend = 'xcom', checkpoint_path = None, checkpoint_commit_every = 100,
+        checkpoint_commit_interval = 30, resumable = False, compression = None, compression_level = None,
+        compressed_suffix = True, transform_workers = 0, transform_max_in_flight = None, collect_metrics = True,
+        metrics_prefix = 'file_sync', dispatch = 'modulo', work_queue_backend = 'sqlite', work_queue_path = None,
+        work_queue_lease_seconds = 300, integrity = None, integrity_algorithm = 'sha256', execution_mode = 'threads',
+        max_concurrent_transfers = 64, buffer_pool_bytes = None, partition_root = None, backfill_start = None,
+        backfill_end = None, partition_format = '%Y-%m-%d', completion_marker_path = None, manifest_path = None,
+        **kwargs):
         super().__init__(**kwargs)
         self.source_type = source_type
         self.target_type = target_type
@@ -25,10 +62,152 @@ class FileSyncOperator(BaseOperator):
         self.modulo_id = modulo_id
         self.num_batches = num_batches
         self.chunk_size = chunk_size
+        # a callable/StreamTransform, or its dotted path ('package.module.name')
         self.transformation_func = transformation_func
+        # number of files transferred at the same time inside this batch task, 1 means sequential
+        self.max_parallel_files = max(1, int(max_parallel_files))
+        # number of chunks buffered between read => transform => write stages running in their own threads,
+        # 0 keeps the plain generator chain
+        self.pipeline_depth = pipeline_depth
+        self.pipeline_max_bytes = pipeline_max_bytes
+        # files bigger than segment_threshold bytes are split into byte ranges of segment_size
+        # and transferred over max_parallel_segments channels, None disables it
+        self.segment_threshold = segment_threshold
+        self.segment_size = segment_size
+        self.max_parallel_segments = max(1, int(max_parallel_segments))
+        # task id of a ShardPlanOperator, when set we take our shard from its plan instead of listing + modulo
+        self.plan_task_id = plan_task_id
+        # number of sub directories listed concurrently while walking the source
+        self.list_workers = list_workers
+        # skip files already up to date on the target:
+        # 'manifest' => compare size/mtime (and a sha256 of the source with incremental_hash) with the manifest
+        # 'target' => compare the source size with the target file size, only valid without transformation
+        self.incremental = incremental
+        self.incremental_hash = incremental_hash
+        # local directory of the 'manifest' records (temp dir by default, a shared volume when the batches run
+        # on several hosts), never written into the target tree
+        self.manifest_path = manifest_path
+        # where progress is kept ('xcom', 'sqlite' or 'journal') and how often it is committed while syncing
+        self.checkpoint_backend = checkpoint_backend
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_commit_every = checkpoint_commit_every
+        self.checkpoint_commit_interval = checkpoint_commit_interval
+        # keep the temp file of a failed transfer and continue it from the last committed byte offset
+        # (or the last completed segment) on retry, only for untransformed files between range capable adapters
+        self.resumable = resumable
+        # compress the stream after the transformation ('gzip', 'zstd' or 'lz4'), target files get the codec
+        # suffix (file.txt.gz) unless compressed_suffix is False
+        self.compression = compression
+        self.compression_level = compression_level
+        self.compressed_suffix = compressed_suffix
+        # run transformation blocks on a pool of transform_workers processes (0 or 1 => inline),
+        # at most transform_max_in_flight blocks per file are handed to the pool at once
+        self.transform_workers = transform_workers
+        self.transform_max_in_flight = transform_max_in_flight or 2 * max(1, transform_workers)
+        # time spent per stage (list, read, transform, write, rename, checkpoint...) and per-file histograms,
+        # returned under stats['metrics'] and sent to StatsD as <metrics_prefix>.*
+        self.collect_metrics = collect_metrics
+        self.metrics_prefix = metrics_prefix
+        # how files are split between batch tasks: 'modulo' => fixed shards (hash of the name or the shard plan),
+        # 'queue' => every batch leases the next file from a work queue shared by the DAG run until it is drained,
+        # the queue must be reachable by every worker (sqlite => work_queue_path on a shared volume, required)
+        self.dispatch = dispatch
+        self.work_queue_backend = work_queue_backend
+        self.work_queue_path = work_queue_path
+        self.work_queue_lease_seconds = work_queue_lease_seconds
+        # hash the source stream (and the transformed/compressed stream written to the target) while it flows,
+        # digests go to the checkpoint and manifest: 'stream' => only that, 'server' => also compare them with
+        # the hash the source/target server computes itself (SFTP check-file) when it supports it.
+        # Like incremental_hash it needs the sequential stream: no direct copy, segments or resume
+        self.integrity = integrity
+        self.integrity_algorithm = integrity_algorithm
+        # 'threads' => the files run on max_parallel_files threads, 'asyncio' => up to max_concurrent_transfers
+        # files run as coroutines of one event loop on async adapters (asyncssh for SFTP, the sync adapters in
+        # threads otherwise), transformation and compression run in threads. Meant for many small files, it
+        # doesn't do segments, resume, pipeline stages, the work queue or the manifest
+        self.execution_mode = execution_mode
+        self.max_concurrent_transfers = max(1, int(max_concurrent_transfers))
+        # memory budget (bytes) of the chunk buffers of every transfer of the worker process: source reads go
+        # into reused buffers (SFTP and local adapters) and wait while the chunks in flight use up the budget,
+        # None allocates every chunk
+        self.buffer_pool_bytes = buffer_pool_bytes
+        # backfill: with backfill_start (and backfill_end, both included) the run syncs every date partition
+        # partition_root/<date> of the range instead of source_path, the files of all the dates are sharded
+        # across the batches together. Empty values (e.g. rendered from a dag_run.conf without them) mean a
+        # normal run of source_path
+        self.partition_root = partition_root
+        self.backfill_start = backfill_start
+        self.backfill_end = backfill_end
+        self.partition_format = partition_format
+        # directory of the target, outside the synced tree, where SyncCompletionOperator records the partitions
+        # it saw synced; later runs and backfills skip them, unless the marker is from this run or it was cleared
+        self.completion_marker_path = completion_marker_path
         self.logger = logging.getLogger(self.__class__.__name__)
 
     def execute(self, context):
+        # guards checkpoint and stats when files are synced in parallel (locks can't be deepcopied with the operator)
+        self._lock = threading.Lock()
+        if isinstance(self.transformation_func, str):
+            # dotted path, imported only here so parsing the DAG doesn't import the transformation
+            self.transformation_func = import_string(self.transformation_func)
+        self._metrics = TransferMetrics() if self.collect_metrics else None
+
+        if self.incremental not in (None, 'manifest', 'target'):
+            raise AirflowException(f"unsupported incremental mode: {self.incremental}")
+        if self.checkpoint_backend not in ('xcom', 'sqlite', 'journal'):
+            raise AirflowException(f"unsupported checkpoint backend: {self.checkpoint_backend}")
+        if self.dispatch not in ('modulo', 'queue'):
+            raise AirflowException(f"unsupported dispatch mode: {self.dispatch}")
+        if self.dispatch == 'queue' and self.work_queue_backend == 'sqlite' and not self.work_queue_path:
+            raise AirflowException("dispatch='queue' needs work_queue_path, a file on a volume shared by every worker")
+        if self.integrity not in (None, 'stream', 'server'):
+            raise AirflowException(f"unsupported integrity mode: {self.integrity}")
+        if self.integrity and self.integrity_algorithm not in hashlib.algorithms_available:
+            raise AirflowException(f"unsupported integrity algorithm: {self.integrity_algorithm}")
+        if self.incremental == 'target' and (self.transformation_func or self.compression):
+            raise AirflowException(
+                "incremental='target' compares sizes and can't be used with a transformation or compression"
+            )
+        if self.backfill_start and not self.partition_root:
+            raise AirflowException("a backfill needs partition_root, the directory holding the date partitions")
+        if self.completion_marker_path:
+            try:
+                check_marker_path(self.completion_marker_path, self.source_path, self.partition_root)
+            except ValueError as e:
+                raise AirflowException(str(e))
+        if self.execution_mode not in ('threads', 'asyncio'):
+            raise AirflowException(f"unsupported execution mode: {self.execution_mode}")
+        if self.execution_mode == 'asyncio':
+            unsupported = [
+                option for option, value in (
+                    ('segment_threshold', self.segment_threshold),
+                    ('resumable', self.resumable),
+                    ('pipeline_depth', self.pipeline_depth),
+                    ("dispatch='queue'", self.dispatch == 'queue'),
+                    ("incremental='manifest'", self.incremental == 'manifest'),
+                    ('backfill', self.backfill_start),
+                    ('completion_marker_path', self.completion_marker_path),
+                ) if value
+            ]
+            if unsupported:
+                raise AirflowException(f"execution_mode='asyncio' doesn't support {', '.join(unsupported)}")
+        self._codec = None
+        self._compression_stats = None
+        if self.compression:
+            try:
+                self._codec = get_codec(self.compression, self.compression_level)
+            except (ValueError, ImportError) as e:
+                raise AirflowException(str(e))
+            self._compression_stats = CompressionStats()
+        # files whose digest was confirmed by a server side hash
+        self._verified_files = 0
+        self._work_queue = None
+        self._partitions = None
+        self._buffer_pool = BufferPool.get_pool(int(self.buffer_pool_bytes)) if self.buffer_pool_bytes else None
+
+        if self.execution_mode == 'asyncio':
+            return asyncio.run(self._execute_async(context))
+
         source_adapter = StorageAdapterFactory.create_adapter(
             self.source_type,
             self.source_conn_id
@@ -37,153 +216,959 @@ class FileSyncOperator(BaseOperator):
             self.target_type,
             self.target_conn_id
         )
+        if self._buffer_pool is not None:
+            source_adapter.set_buffer_pool(self._buffer_pool)
 
-        # Get file list and filter by modulo
-        all_files, actual_source_path = self._get_file_list(source_adapter)
-        source_files = self._filter_files_by_modulo(all_files)
+        # Get file list and filter by modulo, or take our shard from the planning task
+        # the listing is streamed, so transfers start while the rest of the source is still being walked
+        with self._stage('list'):
+            self._partitions = self._get_pending_partitions(context, target_adapter)
+            if self.dispatch == 'queue':
+                source_files, actual_source_path = self._get_queued_files(context, source_adapter)
+            elif self.plan_task_id:
+                source_files, actual_source_path = self._get_planned_files(context)
+            else:
+                all_files, actual_source_path = self._get_file_list(source_adapter)
+                source_files = self._filter_files_by_modulo(all_files)
+        if self.plan_task_id and self._work_queue is None:
+            # the whole shard is known up front => create the target directories in one go
+            with self._stage('mkdir'):
+                self._prepare_target_directories(target_adapter, actual_source_path, source_files)
+        source_files = self._timed(source_files, 'list')
 
         checkpoint = self._load_checkpoint(context)
-        stats = {
-            'total_files': len(source_files),
+        self._manifest = None
+        if self.incremental == 'manifest':
+            self._manifest = create_manifest(
+                self.target_conn_id, actual_source_path, self.task_id, path=self.manifest_path
+            ).load()
+        stats = self._new_stats()
+        source_files = self._count_files(source_files, stats)
+
+        self._transform_pool = self._create_transform_pool()
+        heartbeat = self._start_lease_heartbeat()
+        try:
+            if self.max_parallel_files > 1:
+                self._sync_files_parallel(
+                    context, source_adapter, target_adapter, actual_source_path, source_files, checkpoint, stats
+                )
+            else:
+                self._sync_files_sequential(
+                    context, source_adapter, target_adapter, actual_source_path, source_files, checkpoint, stats
+                )
+        finally:
+            if heartbeat is not None:
+                heartbeat.set()
+            if self._transform_pool is not None:
+                self._transform_pool.shutdown(cancel_futures=True)
+
+        return self._finish_batch(context, stats)
+
+    def _new_stats(self):
+        return {
+            'total_files': 0,
             'synced': 0,
             'skipped': 0,
             'failed': 0,
             'total_bytes': 0
         }
 
+    def _finish_batch(self, context, stats):
+        if self._manifest is not None:
+            self._manifest.save()
+        if self._compression_stats is not None:
+            stats.update(self._compression_stats.as_dict())
+        if self.integrity == 'server':
+            stats['verified'] = self._verified_files
+        if self._buffer_pool is not None:
+            # counters of the worker process, shared with the other tasks it ran
+            stats['buffer_pool'] = self._buffer_pool.stats()
+        if self._metrics is not None:
+            stats['metrics'] = self._metrics.as_dict()
+            self._publish_metrics()
+
         # handle empty file list
-        if not source_files:
+        if not stats['total_files']:
             self.logger.info("No files to sync in this batch")
             self._clear_checkpoint(context)
             return stats
 
-        for file_name in source_files:
+        # if all files synced, clear checkpoint for rerun when needed
+        self._clear_checkpoint(context)
+        self.logger.info(f"all files synced successfully: {stats}")
+        return stats
+
+    def _count_files(self, files, stats):
+        for entry in files:
+            stats['total_files'] += 1
+            yield entry
+
+    def _sync_files_sequential(self, context, source_adapter, target_adapter, actual_source_path, source_files,
+                               checkpoint, stats):
+        files = iter(source_files)
+        while True:
+            # the listing is consumed lazily, so it can fail in the middle of the batch as well
+            try:
+                entry = next(files, _NO_MORE_FILES)
+            except Exception as e:
+                self._fail_batch(context, checkpoint, self.source_path, e)
+            if entry is _NO_MORE_FILES:
+                break
+
             try:
-                # check checkpoint => we skip if already synced
-                if self._is_file_synced(checkpoint, file_name):
-                    stats['skipped'] += 1
-                    continue
-
-                source_file = f"{actual_source_path}/{file_name}"
-                target_file = f"{actual_source_path}/{file_name}"
-                temp_file = f"{target_file}.tmp"
-
-                bytes_transferred = self._transfer_file(
-                    source_adapter,
-                    target_adapter,
-                    source_file,
-                    temp_file,
-                    target_file
+                self._sync_entry(
+                    source_adapter, target_adapter, actual_source_path, entry, checkpoint, stats
                 )
-                self._mark_file_synced(checkpoint, file_name, bytes_transferred)
-                stats['synced'] += 1
-                stats['total_bytes'] += bytes_transferred
+            except Exception as e:
+                self._fail_batch(context, checkpoint, entry.name, e)
 
-                self.logger.info(f"successfully synced {file_name} ({bytes_transferred} bytes)")
+    def _sync_files_parallel(self, context, source_adapter, target_adapter, actual_source_path, source_files,
+                             checkpoint, stats):
+        # keep a bounded number of files in flight, so we stop submitting new files as soon as one fails
+        max_in_flight = self.max_parallel_files * 2
+        in_flight = {}
+        errors = []
+        files = iter(source_files)
 
-            except Exception as e:
-                self.logger.error(f"failed to sync {file_name}: {str(e)}")
-                stats['failed'] += 1
+        with ThreadPoolExecutor(max_workers=self.max_parallel_files, thread_name_prefix=self.task_id) as executor:
+            while True:
+                while not errors and len(in_flight) < max_in_flight:
+                    try:
+                        entry = next(files, _NO_MORE_FILES)
+                    except Exception as e:
+                        errors.append((self.source_path, e))
+                        break
+                    if entry is _NO_MORE_FILES:
+                        break
+                    future = executor.submit(
+                        self._sync_entry,
+                        source_adapter, target_adapter, actual_source_path, entry, checkpoint, stats
+                    )
+                    in_flight[future] = entry.name
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_name = in_flight.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        errors.append((file_name, error))
+
+        # the running transfers are finished (and cleaned up when failed) before we save the checkpoint
+        if errors:
+            file_name, error = errors[0]
+            self._fail_batch(context, checkpoint, file_name, error)
+
+    def _sync_entry(self, source_adapter, target_adapter, actual_source_path, entry, checkpoint, stats):
+        if self._work_queue is None:
+            return self._sync_file(source_adapter, target_adapter, actual_source_path, entry, checkpoint, stats)
+        try:
+            self._sync_file(source_adapter, target_adapter, actual_source_path, entry, checkpoint, stats)
+        except Exception:
+            self._work_queue.fail(entry.name, self.task_id)
+            raise
+        self._work_queue.complete(entry.name, self.task_id)
+
+    def _sync_file(self, source_adapter, target_adapter, actual_source_path, entry, checkpoint, stats):
+        file_name = entry.name
+        # check checkpoint => we skip if already synced
+        if self._is_file_synced(checkpoint, file_name):
+            self._update_stats(stats, skipped=1)
+            return
+
+        source_file, target_file, temp_file = self._get_file_paths(target_adapter, actual_source_path, file_name)
 
-                # cleanup/rollback
+        if self.incremental and self._is_up_to_date(source_adapter, target_adapter, source_file, target_file, entry):
+            self.logger.info(f"skipped {file_name}, already up to date on target")
+            self._update_stats(stats, skipped=1)
+            return
+
+        digest, output_digest = self._new_file_digests()
+        # a digest of the source must see the whole stream, so it can't be resumed in the middle
+        resumable = digest is None and self._can_resume(source_adapter, target_adapter, entry)
+        resume = None
+        on_progress = None
+        if resumable:
+            resume = self._get_resume_state(target_adapter, temp_file, entry, checkpoint.get(file_name))
+            on_progress = functools.partial(self._mark_file_partial, checkpoint, entry)
+
+        start = time.perf_counter()
+        try:
+            bytes_transferred = self._transfer_file(
+                source_adapter,
+                target_adapter,
+                source_file,
+                temp_file,
+                target_file,
+                entry.size,
+                digest,
+                resume,
+                on_progress,
+                output_digest
+            )
+        except Exception as e:
+            self.logger.error(f"failed to sync {file_name}: {str(e)}")
+            self._update_stats(stats, failed=1)
+
+            # cleanup/rollback, a resumable temp file is kept for the retry
+            if resumable:
+                self._cleanup_failed_transfer(target_adapter, None, target_file)
+            else:
                 self._cleanup_failed_transfer(target_adapter, temp_file, target_file)
-                self._save_checkpoint(context, checkpoint)
+            raise
 
-                raise AirflowException(f"file sync failed at '{file_name}': {str(e)}\n")
+        self._mark_file_synced(checkpoint, file_name, bytes_transferred, **self._file_digests(digest, output_digest))
+        if self._manifest is not None:
+            self._manifest.record(
+                entry, bytes_transferred, self._format_digest(digest), self._format_digest(output_digest)
+            )
+        self._update_stats(stats, synced=1, total_bytes=bytes_transferred)
+        self._record_file(bytes_transferred, time.perf_counter() - start)
 
-        # if all files synced, clear checkpoint for rerun when needed
-        self._clear_checkpoint(context)
-        self.logger.info(f"all files synced successfully: {stats}")
-        return stats
+        self.logger.info(f"successfully synced {file_name} ({bytes_transferred} bytes)")
+
+    def _get_file_paths(self, target_adapter, actual_source_path, file_name):
+        source_file = f"{actual_source_path}/{file_name}"
+        target_file = f"{actual_source_path}/{file_name}"
+        if self._codec is not None and self.compressed_suffix:
+            target_file = f"{target_file}{self._codec.suffix}"
+        # a store where partial writes are never visible doesn't need the temp file + rename
+        temp_file = target_file if target_adapter.atomic_writes else f"{target_file}.tmp"
+        return source_file, target_file, temp_file
 
-    def _transfer_file(self, source_adapter, target_adapter, source_file, temp_file, target_file):
-        chunks = source_adapter.read_file_chunks(source_file, self.chunk_size)
+    def _new_file_digests(self):
+        digest = None
+        if self.integrity or (self._manifest is not None and self.incremental_hash):
+            digest = self._new_digest()
+        # what is written differs from the source only once transformed or compressed
+        output_digest = None
+        if self.integrity and (self.transformation_func or self._codec is not None):
+            output_digest = self._new_digest()
+        return digest, output_digest
+
+    def _file_digests(self, digest, output_digest):
+        if not self.integrity:
+            return {}
+        # without transformation or compression the target has the source bytes
+        source_digest = self._format_digest(digest)
+        return {'source_digest': source_digest, 'target_digest': self._format_digest(output_digest) or source_digest}
+
+    def _is_up_to_date(self, source_adapter, target_adapter, source_file, target_file, entry):
+        if self.incremental == 'target':
+            # without transformation a complete target file has exactly the source size
+            try:
+                return target_adapter.get_file_size(target_file) == entry.size
+            except OSError:
+                return False
+
+        if not self._manifest.is_up_to_date(entry):
+            return False
+        if self.incremental_hash:
+            # size and mtime match, the content hash tells whether the file was rewritten in place
+            digest = self._new_digest()
+            for chunk in source_adapter.read_file_chunks(source_file, self.chunk_size):
+                digest.update(chunk)
+            return self._manifest.is_up_to_date(entry, self._format_digest(digest))
+        return True
+
+    def _new_digest(self):
+        # sha256 unless integrity asks for another algorithm, the manifest records which one was used
+        return hashlib.new(self.integrity_algorithm if self.integrity else 'sha256')
+
+    def _format_digest(self, digest):
+        if digest is None:
+            return None
+        return f"{digest.name}:{digest.hexdigest()}"
+
+    def _fail_batch(self, context, checkpoint, file_name, error):
+        self._save_checkpoint(context, checkpoint)
+        if self._work_queue is not None:
+            # what we leased but didn't finish goes to the other batches
+            self._work_queue.release(self.task_id)
+        self._publish_metrics()
+        if self._manifest is not None:
+            try:
+                self._manifest.save()
+            except Exception as e:
+                self.logger.error(f"error saving sync manifest: {str(e)}")
+        raise AirflowException(f"file sync failed at '{file_name}': {str(error)}\n")
+
+    def _update_stats(self, stats, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                stats[key] += value
+
+    def _stage(self, stage):
+        if self._metrics is None:
+            return _NOT_TIMED
+        return self._metrics.stage(stage)
+
+    def _timed(self, chunks, stage):
+        if self._metrics is None:
+            return chunks
+        return self._metrics.timed(chunks, stage)
+
+    def _record_file(self, bytes_transferred, seconds):
+        if self._metrics is None:
+            return
+        self._metrics.record_file(bytes_transferred, seconds)
+        tags = {'dag_id': self.dag_id, 'task_id': self.task_id}
+        Stats.timing(f'{self.metrics_prefix}.file_duration', seconds * 1000, tags=tags)
+        Stats.incr(f'{self.metrics_prefix}.bytes', count=bytes_transferred, tags=tags)
+
+    def _publish_metrics(self):
+        if self._metrics is None:
+            return
+        try:
+            self._metrics.publish(Stats, self.metrics_prefix, tags={'dag_id': self.dag_id, 'task_id': self.task_id})
+        except Exception as e:
+            # metrics never fail the sync
+            self.logger.warning(f"error publishing metrics: {str(e)}")
+
+    def _transfer_file(self, source_adapter, target_adapter, source_file, temp_file, target_file, file_size=None,
+                       digest=None, resume=None, on_progress=None, output_digest=None):
+        if digest is None and self._can_copy_directly(source_adapter, target_adapter):
+            # same kind of storage on both sides and nothing to change in the data => the adapter copies
+            # it itself (copy_file_range/sendfile for local files), the bytes never reach Python
+            with self._stage('copy'):
+                bytes_transferred = source_adapter.copy_file_to(target_adapter, source_file, temp_file)
+            self._publish_file(target_adapter, temp_file, target_file)
+            return bytes_transferred
+
+        # segments are read out of order, so a source digest needs the sequential stream
+        if digest is None and self._can_segment(source_adapter, target_adapter):
+            if file_size is None:
+                file_size = source_adapter.get_file_size(source_file)
+            if file_size >= self.segment_threshold:
+                return self._transfer_file_segmented(
+                    source_adapter, target_adapter, source_file, temp_file, target_file, file_size,
+                    resume, on_progress
+                )
+
+        resume_offset = self._get_resume_offset(resume)
+        stages = []
+        if resume_offset:
+            self.logger.info(f"resuming {source_file} from byte {resume_offset}")
+            chunks = source_adapter.read_file_range(
+                source_file, resume_offset, file_size - resume_offset, self.chunk_size
+            )
+        else:
+            chunks = source_adapter.read_file_chunks(source_file, self.chunk_size)
+        chunks = self._timed(chunks, 'read')
+        if digest is not None:
+            chunks = self._update_digest(chunks, digest)
+        chunks = self._pipelined(chunks, stages, 'read')
 
         # apply transformation if provided
+        # (a StreamTransform sees the whole file: per file header/footer, records framed across chunks)
         if self.transformation_func:
-            chunks = (self.transformation_func(chunk) for chunk in chunks)
+            chunks = self._timed(stream_transform(self.transformation_func, chunks, self._map_blocks), 'transform')
+            chunks = self._pipelined(chunks, stages, 'transform')
 
-        # write chunks to temp file
-        total_bytes = target_adapter.write_file_chunks(temp_file, chunks)
+        # compress what goes on the wire, after the transformation so it still sees plain bytes
+        if self._codec is not None:
+            chunks = self._timed(compress_chunks(chunks, self._codec, self._compression_stats), 'compress')
+            chunks = self._pipelined(chunks, stages, 'compress')
+
+        if output_digest is not None:
+            chunks = self._update_digest(chunks, output_digest)
+
+        if on_progress is not None:
+            chunks = self._track_offset(chunks, resume_offset, on_progress)
+
+        try:
+            # write chunks to temp file, or append to what a previous attempt already wrote
+            with self._stage('write'):
+                if resume_offset:
+                    total_bytes = resume_offset + target_adapter.write_file_at(temp_file, resume_offset, chunks)
+                else:
+                    total_bytes = target_adapter.write_file_chunks(temp_file, chunks)
+        finally:
+            # stop the downstream stages first so nothing keeps pulling from the source
+            for stage in reversed(stages):
+                stage.close()
+
+        if self.integrity == 'server' and digest is not None:
+            # before the rename, a corrupted file never shows up under its real name
+            with self._stage('verify'):
+                self._verify_checksums(
+                    source_adapter, target_adapter, source_file, temp_file, digest, output_digest or digest
+                )
 
         # if all chunks successful => we rename temp file to target file in SFTP target server
-        target_adapter.rename_file(temp_file, target_file)
+        self._publish_file(target_adapter, temp_file, target_file)
 
         return total_bytes
 
+    def _verify_checksums(self, source_adapter, target_adapter, source_file, temp_file, digest, output_digest):
+        # one hash request per side, the data is not read a second time; servers without it are trusted
+        self._compare_checksums(
+            source_file, temp_file, digest, output_digest,
+            source_adapter.get_checksum(source_file, digest.name),
+            target_adapter.get_checksum(temp_file, output_digest.name)
+        )
+
+    def _compare_checksums(self, source_file, temp_file, digest, output_digest, source_checksum, target_checksum):
+        if source_checksum is not None and source_checksum != digest.hexdigest():
+            raise AirflowException(
+                f"integrity check failed for {source_file}: read {digest.hexdigest()}, "
+                f"source server has {source_checksum} (changed while syncing?)"
+            )
+        if target_checksum is not None and target_checksum != output_digest.hexdigest():
+            raise AirflowException(
+                f"integrity check failed for {temp_file}: wrote {output_digest.hexdigest()}, "
+                f"target server has {target_checksum}"
+            )
+        if source_checksum is not None or target_checksum is not None:
+            with self._lock:
+                self._verified_files += 1
+
+    def _publish_file(self, target_adapter, temp_file, target_file):
+        if temp_file == target_file:
+            return
+        with self._stage('rename'):
+            target_adapter.rename_file(temp_file, target_file)
+
+    def _create_transform_pool(self):
+        if not self.transformation_func or self.transform_workers <= 1:
+            return None
+        # spawn, not fork: the task process already runs SSH transport and pipeline threads
+        return ProcessPoolExecutor(
+            max_workers=self.transform_workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+
+    def _map_blocks(self, func, blocks):
+        if self._transform_pool is None:
+            return map(func, blocks)
+        return ordered_pool_map(self._transform_pool, func, blocks, self.transform_max_in_flight)
+
+    def _track_offset(self, chunks, offset, on_progress):
+        for chunk in chunks:
+            yield chunk
+            # the writer asks for the next chunk only once this one is written
+            offset += len(chunk)
+            on_progress(offset=offset)
+
+    def _can_resume(self, source_adapter, target_adapter, entry):
+        # transformed or compressed bytes don't map back to a source offset
+        return (
+            self.resumable
+            and not self.transformation_func
+            and not self.compression
+            and entry.size is not None
+            and source_adapter.supports_ranges
+            and target_adapter.supports_ranges
+        )
+
+    def _get_resume_state(self, target_adapter, temp_file, entry, record):
+        if not record or not record.get('partial'):
+            return None
+        # the source must be the one the temp file was started from
+        if record['size'] != entry.size or record['mtime'] != entry.mtime:
+            self.logger.info(f"{entry.name} changed since the last attempt, transferring it from scratch")
+            return None
+        try:
+            temp_size = target_adapter.get_file_size(temp_file)
+        except OSError:
+            return None
+        return dict(record, temp_size=temp_size)
+
+    def _get_resume_offset(self, resume):
+        if not resume or 'offset' not in resume:
+            return 0
+        # writes are pipelined, trust only what both the checkpoint and the temp file agree on
+        return min(resume['offset'], resume['temp_size'])
+
+    def _update_digest(self, chunks, digest):
+        for chunk in chunks:
+            digest.update(chunk)
+            yield chunk
+
+    def _can_copy_directly(self, source_adapter, target_adapter):
+        return (
+            self.transformation_func is None
+            and self._codec is None
+            and source_adapter.can_copy_to(target_adapter)
+        )
+
+    def _can_segment(self, source_adapter, target_adapter):
+        # a chunk transformation may depend on what came before it (headers, records split across chunks...)
+        # so transformed (and compressed) files are always streamed sequentially
+        return (
+            self.segment_threshold is not None
+            and not self.transformation_func
+            and not self.compression
+            and source_adapter.supports_ranges
+            and target_adapter.supports_ranges
+        )
+
+    def _transfer_file_segmented(self, source_adapter, target_adapter, source_file, temp_file, target_file,
+                                 file_size, resume=None, on_progress=None):
+        segments = [
+            (offset, min(self.segment_size, file_size - offset))
+            for offset in range(0, file_size, self.segment_size)
+        ]
+
+        # segments completed by a previous attempt are already in the temp file
+        done_segments = set()
+        if resume and resume.get('segment_size') == self.segment_size:
+            done_segments = set(resume.get('segments', []))
+        resumed_bytes = sum(length for offset, length in segments if offset in done_segments)
+        if done_segments:
+            self.logger.info(f"resuming {source_file}, {len(done_segments)}/{len(segments)} segments already done")
+        else:
+            target_adapter.create_file(temp_file)
+        self.logger.info(f"transferring {source_file} ({file_size} bytes) in {len(segments)} segments")
+
+        segment_lock = threading.Lock()
+
+        def transfer_segment(offset, length):
+            written = self._transfer_segment(source_adapter, target_adapter, source_file, temp_file, offset, length)
+            if on_progress is not None:
+                with segment_lock:
+                    done_segments.add(offset)
+                    on_progress(segment_size=self.segment_size, segments=sorted(done_segments))
+            return written
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel_segments) as executor:
+            futures = [
+                executor.submit(transfer_segment, offset, length)
+                for offset, length in segments
+                if offset not in done_segments
+            ]
+            done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in not_done:
+                future.cancel()
+            total_bytes = resumed_bytes + sum(future.result() for future in futures if not future.cancelled())
+
+        if total_bytes != file_size:
+            raise AirflowException(f"segmented transfer of {source_file} wrote {total_bytes}/{file_size} bytes")
+
+        self._publish_file(target_adapter, temp_file, target_file)
+        return total_bytes
+
+    def _transfer_segment(self, source_adapter, target_adapter, source_file, temp_file, offset, length):
+        chunks = source_adapter.read_file_range(source_file, offset, length, self.chunk_size)
+        try:
+            with self._stage('write'):
+                return target_adapter.write_file_at(temp_file, offset, self._timed(chunks, 'read'))
+        finally:
+            chunks.close()
+
+    def _pipelined(self, chunks, stages, stage_name):
+        if not self.pipeline_depth:
+            return chunks
+        stage = PipelinedStream(
+            chunks,
+            max_chunks=self.pipeline_depth,
+            max_bytes=self.pipeline_max_bytes,
+            name=f"{self.task_id}-{stage_name}"
+        )
+        stages.append(stage)
+        # time the consumer spends waiting on the stage thread
+        return self._timed(iter(stage), 'pipeline_wait')
+
+    async def _execute_async(self, context):
+        source_adapter = StorageAdapterFactory.create_async_adapter(self.source_type, self.source_conn_id)
+        target_adapter = StorageAdapterFactory.create_async_adapter(self.target_type, self.target_conn_id)
+        if self._buffer_pool is not None:
+            source_adapter.set_buffer_pool(self._buffer_pool)
+        # blocking stages (transformation, compression) of the transfers, one thread per file being transformed
+        self._stage_executor = ThreadPoolExecutor(
+            max_workers=min(32, self.max_concurrent_transfers), thread_name_prefix=f"{self.task_id}-stage"
+        )
+        self._transform_pool = self._create_transform_pool()
+        try:
+            with self._stage('list'):
+                if self.plan_task_id:
+                    planned_files, actual_source_path = self._get_planned_files(context)
+                    source_files = self._iterate_async(planned_files)
+                else:
+                    source_files, actual_source_path = await self._get_file_list_async(source_adapter)
+
+            checkpoint = self._load_checkpoint(context)
+            self._manifest = None
+            stats = self._new_stats()
+            await self._sync_files_async(
+                context, source_adapter, target_adapter, actual_source_path, source_files, checkpoint, stats
+            )
+        finally:
+            self._stage_executor.shutdown(wait=False)
+            if self._transform_pool is not None:
+                self._transform_pool.shutdown(cancel_futures=True)
+            await source_adapter.close()
+            await target_adapter.close()
+
+        return self._finish_batch(context, stats)
+
+    async def _iterate_async(self, items):
+        for item in items:
+            yield item
+
+    async def _get_file_list_async(self, source_adapter):
+        if await source_adapter.is_directory(self.source_path):
+            return self._walk_source_async(source_adapter), self.source_path
+        # single file case
+        entry = await source_adapter.stat_file(self.source_path)
+        files = [entry] if self._get_modulo(entry.name) == self.modulo_id else []
+        return self._iterate_async(files), os.path.dirname(self.source_path)
+
+    async def _walk_source_async(self, source_adapter):
+        try:
+            async for entry in source_adapter.walk(self.source_path):
+                if not entry.is_dir and self._get_modulo(entry.name) == self.modulo_id:
+                    yield entry
+        except Exception as e:
+            raise AirflowException(f"failed to list files from {self.source_path}: {str(e)}")
+
+    async def _sync_files_async(self, context, source_adapter, target_adapter, actual_source_path, source_files,
+                                checkpoint, stats):
+        # same as _sync_files_parallel with coroutines: bounded number of files in flight, no new file
+        # once one failed
+        in_flight = {}
+        errors = []
+        files = source_files.__aiter__()
+        while True:
+            while not errors and len(in_flight) < self.max_concurrent_transfers:
+                try:
+                    entry = await files.__anext__()
+                except StopAsyncIteration:
+                    break
+                except Exception as e:
+                    errors.append((self.source_path, e))
+                    break
+                stats['total_files'] += 1
+                task = asyncio.ensure_future(self._sync_file_async(
+                    source_adapter, target_adapter, actual_source_path, entry, checkpoint, stats
+                ))
+                in_flight[task] = entry.name
+
+            if not in_flight:
+                break
+
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                file_name = in_flight.pop(task)
+                if task.exception() is not None:
+                    errors.append((file_name, task.exception()))
+
+        if errors:
+            file_name, error = errors[0]
+            self._fail_batch(context, checkpoint, file_name, error)
+
+    async def _sync_file_async(self, source_adapter, target_adapter, actual_source_path, entry, checkpoint, stats):
+        file_name = entry.name
+        if self._is_file_synced(checkpoint, file_name):
+            self._update_stats(stats, skipped=1)
+            return
+
+        source_file, target_file, temp_file = self._get_file_paths(target_adapter, actual_source_path, file_name)
+        if self.incremental == 'target':
+            try:
+                up_to_date = await target_adapter.get_file_size(target_file) == entry.size
+            except OSError:
+                up_to_date = False
+            if up_to_date:
+                self.logger.info(f"skipped {file_name}, already up to date on target")
+                self._update_stats(stats, skipped=1)
+                return
+
+        digest, output_digest = self._new_file_digests()
+        start = time.perf_counter()
+        try:
+            bytes_transferred = await self._transfer_file_async(
+                source_adapter, target_adapter, source_file, temp_file, target_file, digest, output_digest
+            )
+        except Exception as e:
+            self.logger.error(f"failed to sync {file_name}: {str(e)}")
+            self._update_stats(stats, failed=1)
+            try:
+                await target_adapter.delete_file(temp_file)
+                await target_adapter.delete_file(target_file)
+            except Exception as cleanup_error:
+                self.logger.error(f"error during cleanup: {str(cleanup_error)}")
+            raise
+
+        self._mark_file_synced(checkpoint, file_name, bytes_transferred, **self._file_digests(digest, output_digest))
+        self._update_stats(stats, synced=1, total_bytes=bytes_transferred)
+        self._record_file(bytes_transferred, time.perf_counter() - start)
+        self.logger.info(f"successfully synced {file_name} ({bytes_transferred} bytes)")
+
+    async def _transfer_file_async(self, source_adapter, target_adapter, source_file, temp_file, target_file,
+                                   digest=None, output_digest=None):
+        reader = chunks = source_adapter.read_file_chunks(source_file, self.chunk_size)
+        if digest is not None:
+            chunks = self._update_digest_async(chunks, digest)
+        if self.transformation_func or self._codec is not None:
+            chunks = self._blocking_stages(chunks)
+        if output_digest is not None:
+            chunks = self._update_digest_async(chunks, output_digest)
+        try:
+            total_bytes = await target_adapter.write_file_chunks(temp_file, chunks)
+        finally:
+            # async generators aren't closed by the ones consuming them, close the source read explicitly
+            await chunks.aclose()
+            await reader.aclose()
+
+        if self.integrity == 'server' and digest is not None:
+            output_digest = output_digest or digest
+            self._compare_checksums(
+                source_file, temp_file, digest, output_digest,
+                await source_adapter.get_checksum(source_file, digest.name),
+                await target_adapter.get_checksum(temp_file, output_digest.name)
+            )
+
+        if temp_file != target_file:
+            await target_adapter.rename_file(temp_file, target_file)
+        return total_bytes
+
+    def _blocking_stages(self, chunks):
+        # transformation and compression are plain generators, they run in a thread pulling the chunks
+        # from the loop, the loop gets their output back as an async iterator
+        blocking_chunks = iterate_from_loop(chunks, asyncio.get_running_loop())
+        if self.transformation_func:
+            blocking_chunks = stream_transform(self.transformation_func, blocking_chunks, self._map_blocks)
+        if self._codec is not None:
+            blocking_chunks = compress_chunks(blocking_chunks, self._codec, self._compression_stats)
+        return iterate_in_thread(blocking_chunks, self._stage_executor)
+
+    async def _update_digest_async(self, chunks, digest):
+        async for chunk in chunks:
+            digest.update(chunk)
+            yield chunk
+
     def _cleanup_failed_transfer(self, target_adapter, temp_file, target_file):
         try:
-            target_adapter.delete_file(temp_file)
+            if temp_file is not None:
+                target_adapter.delete_file(temp_file)
             target_adapter.delete_file(target_file)
         except Exception as e:
             self.logger.error(f"error during cleanup: {str(e)}")
 
     def _load_checkpoint(self, context):
-        # We will use XCom to store checkpoint for each DAG run separately
-        task_instance = context['task_instance']
-        dag_run_id = context['dag_run'].run_id
-
-        checkpoint = task_instance.xcom_pull(
-            task_ids=self.task_id,
-            key=f'file_sync_checkpoint_{dag_run_id}'
+        # checkpoint of each DAG run is kept separately, in XCom by default or in a SQLite db / journal file
+        self._checkpoint_store = create_checkpoint_store(
+            self.checkpoint_backend,
+            context,
+            self.task_id,
+            path=self.checkpoint_path,
+            commit_every=self.checkpoint_commit_every,
+            commit_interval=self.checkpoint_commit_interval
         )
-        return checkpoint if checkpoint else {}
+        return self._checkpoint_store.load()
 
     def _save_checkpoint(self, context, checkpoint):
-        task_instance = context['task_instance']
-        dag_run_id = context['dag_run'].run_id
-
-        task_instance.xcom_push(
-            key=f'file_sync_checkpoint_{dag_run_id}',
-            value=checkpoint
-        )
+        # records are already handed to the store by _mark_file_synced, only the pending batch is left
+        with self._stage('checkpoint'):
+            self._checkpoint_store.flush()
 
     def _clear_checkpoint(self, context):
-        task_instance = context['task_instance']
-        dag_run_id = context['dag_run'].run_id
-
-        task_instance.xcom_push(
-            key=f'file_sync_checkpoint_{dag_run_id}',
-            value=None
-        )
+        with self._stage('checkpoint'):
+            self._checkpoint_store.clear()
 
     def _is_file_synced(self, checkpoint, file_name):
-        return file_name in checkpoint
+        record = checkpoint.get(file_name)
+        return record is not None and not record.get('partial')
+
+    def _mark_file_partial(self, checkpoint, entry, **progress):
+        # progress of an unfinished transfer, replaced by the final record once the file is synced
+        record = {
+            'partial': True,
+            'size': entry.size,
+            'mtime': entry.mtime,
+            'updated_at': datetime.utcnow().isoformat(),
+            **progress
+        }
+        with self._lock:
+            checkpoint[entry.name] = record
+        with self._stage('checkpoint'):
+            self._checkpoint_store.mark(entry.name, record)
 
-    def _mark_file_synced(self, checkpoint, file_name, bytes_transferred):
-        checkpoint[file_name] = {
+    def _mark_file_synced(self, checkpoint, file_name, bytes_transferred, source_digest=None, target_digest=None):
+        record = {
             'synced_at': datetime.utcnow().isoformat(),
             'bytes': bytes_transferred
         }
+        if source_digest is not None:
+            record['source_digest'] = source_digest
+            record['target_digest'] = target_digest
+        with self._lock:
+            checkpoint[file_name] = record
+        with self._stage('checkpoint'):
+            self._checkpoint_store.mark(file_name, record)
+
+    def _get_pending_partitions(self, context, target_adapter):
+        # date partitions of the backfill, or the one of a normal run (''), without those already complete;
+        # None when the run doesn't deal with partitions
+        dag_run = context['dag_run']
+        marker_path = None if rerun_requested(dag_run) else self.completion_marker_path
+        if self.backfill_start:
+            try:
+                partitions = date_partitions(self.backfill_start, self.backfill_end, self.partition_format)
+            except ValueError as e:
+                raise AirflowException(f"invalid backfill range: {str(e)}")
+            pending = pending_partitions(target_adapter, self.partition_root, partitions, marker_path, dag_run.run_id)
+            self.logger.info(
+                f"backfill of {len(pending)}/{len(partitions)} partitions from {partitions[0]} to {partitions[-1]}"
+            )
+            return pending
+        if marker_path:
+            return pending_partitions(target_adapter, self.source_path, [''], marker_path, dag_run.run_id)
+        return None
+
+    def _pending_entries(self, entries):
+        if self._partitions is None:
+            return entries
+        return (entry for entry in entries if in_partitions(entry.name, self._partitions))
 
     def _get_file_list(self, source_adapter):
+        if self.backfill_start:
+            return self._walk_partitions(source_adapter), self.partition_root
+        if self._partitions == []:
+            # already synced
+            return [], self.source_path
+
         is_dir = source_adapter.is_directory(self.source_path)
 
         if is_dir:
-            try:
-                files = source_adapter.list_files(self.source_path)
-                return files, self.source_path
-            except Exception as e:
-                raise AirflowException(f"failed to list files from {self.source_path}")
+            return self._walk_source(source_adapter), self.source_path
         else:
             # single file case
-            file_name = os.path.basename(self.source_path)
             directory_path = os.path.dirname(self.source_path)
-            return [file_name], directory_path
+            return [source_adapter.stat_file(self.source_path)], directory_path
+
+    def _walk_source(self, source_adapter):
+        # sub directories are walked too, names keep the hierarchy (a/b/c/file.txt) so it is preserved on target
+        try:
+            for entry in source_adapter.walk(self.source_path, max_workers=self.list_workers):
+                if not entry.is_dir:
+                    yield entry
+        except Exception as e:
+            raise AirflowException(f"failed to list files from {self.source_path}: {str(e)}")
+
+    def _walk_partitions(self, source_adapter):
+        try:
+            yield from walk_partitions(source_adapter, self.partition_root, self._partitions, self.list_workers)
+        except Exception as e:
+            raise AirflowException(f"failed to list partitions from {self.partition_root}: {str(e)}")
+
+    def _prepare_target_directories(self, target_adapter, actual_source_path, files):
+        directories = {os.path.dirname(f"{actual_source_path}/{entry.name}") for entry in files}
+        target_adapter.ensure_directories(directories)
+
+    def _get_planned_files(self, context):
+        plan = self._pull_plan(context)
+        shard = plan['shards'][self.modulo_id]
+        # files are already ordered largest first, so big files start early when syncing in parallel
+        files = list(self._pending_entries(self._planned_entries(shard)))
+        self.logger.info(f"{len(files)} files ({shard['bytes']} bytes) planned for this batch")
+        return files, plan['source_path']
+
+    def _pull_plan(self, context):
+        plan = context['task_instance'].xcom_pull(task_ids=self.plan_task_id)
+        if not plan:
+            raise AirflowException(f"no shard plan found from task {self.plan_task_id}")
+        if plan['num_batches'] != self.num_batches:
+            raise AirflowException(
+                f"shard plan has {plan['num_batches']} batches but this task expects {self.num_batches}"
+            )
+        return plan
+
+    def _planned_entries(self, shard):
+        return [
+            FileEntry(file[0], file[1], file[2] if len(file) > 2 else None, False)
+            for file in shard['files']
+        ]
+
+    def _get_queued_files(self, context, source_adapter):
+        self._work_queue = create_work_queue(
+            self.work_queue_backend,
+            context,
+            path=self.work_queue_path,
+            lease_seconds=self.work_queue_lease_seconds
+        )
+        # files still leased by a previous try of this task are ours to redo
+        self._work_queue.release(self.task_id)
+        if context['task_instance'].try_number > 1:
+            # an Airflow retry retries the files that used up their attempts too
+            self._work_queue.retry_failed()
+
+        if self.plan_task_id:
+            # the plan already lists the whole run, no need to walk the source again
+            plan = self._pull_plan(context)
+            all_files = self._pending_entries(
+                entry for shard in plan['shards'] for entry in self._planned_entries(shard)
+            )
+            actual_source_path = plan['source_path']
+        else:
+            all_files, actual_source_path = self._get_file_list(source_adapter)
+
+        # one batch fills the queue in the background while every batch (itself included) leases from it
+        populate_errors = []
+
+        def populate():
+            try:
+                while not self._work_queue.populate(all_files, self.task_id):
+                    # another batch fills it, we take over if it dies before the end
+                    if self._work_queue.is_populated():
+                        return
+                    time.sleep(min(10, self.work_queue_lease_seconds / 3))
+            except Exception as e:
+                populate_errors.append(e)
+
+        threading.Thread(target=populate, name=f"{self.task_id}-populate", daemon=True).start()
+        return self._lease_files(populate_errors), actual_source_path
+
+    def _lease_files(self, populate_errors, poll_interval=1):
+        while True:
+            if populate_errors:
+                raise populate_errors[0]
+            leased = self._work_queue.lease(self.task_id)
+            if leased:
+                name, size, mtime = leased[0]
+                yield FileEntry(name, size, mtime, False)
+                continue
+            if self._work_queue.is_drained():
+                failed = self._work_queue.failed_files()
+                if failed:
+                    # the run is not complete, no batch may succeed without these files
+                    raise AirflowException(
+                        f"{len(failed)} files failed {self._work_queue.max_attempts} times in the work queue:"
+                        f" {', '.join(failed[:10])}"
+                    )
+                return
+            # the queue is still being filled, or the last files are leased by other batches: we wait for
+            # them in case a batch dies and its leases expire
+            time.sleep(poll_interval)
+
+    def _start_lease_heartbeat(self):
+        if self._work_queue is None:
+            return None
+        stopped = threading.Event()
+
+        def renew():
+            # leases of long transfers must not expire while we are still on them
+            while not stopped.wait(self.work_queue_lease_seconds / 3):
+                try:
+                    self._work_queue.renew(self.task_id)
+                except Exception as e:
+                    self.logger.warning(f"error renewing work queue leases: {str(e)}")
+
+        threading.Thread(target=renew, name=f"{self.task_id}-lease", daemon=True).start()
+        return stopped
 
     def _filter_files_by_modulo(self, files):
         # so I will use modulo for splitting files into batches
         if self.num_batches <= 0:
             raise AirflowException(f"num_batches must be positive")
 
-        filtered_files = []
-        for file_name in files:
-            # hash the filename using MD5 and convert to integer
-            hash_hex = hashlib.md5(file_name.encode()).hexdigest()
-            hash_int = int(hash_hex, 16)
-            modulo_value = abs(hash_int) % self.num_batches
-
-            if modulo_value == self.modulo_id:
-                filtered_files.append(file_name)
-        self.logger.info(f"{len(filtered_files)}/{len(files)} files assigned to this batch")
-        return filtered_files
+        return (entry for entry in files if self._get_modulo(entry.name) == self.modulo_id)
+
+    def _get_modulo(self, file_name):
+        # hash the filename using MD5 and convert to integer
+        hash_hex = hashlib.md5(file_name.encode()).hexdigest()
+        hash_int = int(hash_hex, 16)
+        return abs(hash_int) % self.num_batches
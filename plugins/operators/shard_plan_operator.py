@@ -0,0 +1,107 @@
+# airflow DAG
+from airflow.models import BaseOperator
+from airflow.exceptions import AirflowException
+from adapters.storage_adapter.factory import StorageAdapterFactory
+from transfer.partitions import (
+    check_marker_path, date_partitions, pending_partitions, rerun_requested, walk_partitions
+)
+from transfer.shard_planner import plan_shards
+import logging
+import os
+
+
+class ShardPlanOperator(BaseOperator):
+    """List the source once with sizes and publish a byte-balanced plan for the FileSyncOperator batches"""
+
+    template_fields = ['source_path', 'partition_root', 'backfill_start', 'backfill_end']
+
+    def __init__(self, source_type, source_conn_id, source_path, num_batches, list_workers=1, partition_root=None,
+                 backfill_start=None, backfill_end=None, partition_format='%Y-%m-%d', target_type=None,
+                 target_conn_id=None, completion_marker_path=None, **kwargs):
+        super().__init__(**kwargs)
+        self.source_type = source_type
+        self.source_conn_id = source_conn_id
+        self.source_path = source_path
+        self.num_batches = num_batches
+        self.list_workers = list_workers
+        # same backfill options as FileSyncOperator, the target is only needed to skip complete partitions
+        self.partition_root = partition_root
+        self.backfill_start = backfill_start
+        self.backfill_end = backfill_end
+        self.partition_format = partition_format
+        self.target_type = target_type
+        self.target_conn_id = target_conn_id
+        self.completion_marker_path = completion_marker_path
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def execute(self, context):
+        source_adapter = StorageAdapterFactory.create_adapter(
+            self.source_type,
+            self.source_conn_id
+        )
+        files, actual_source_path = self._get_file_list(context, source_adapter)
+
+        try:
+            shards = plan_shards(files, self.num_batches)
+        except ValueError as e:
+            raise AirflowException(str(e))
+
+        for shard_id, shard in enumerate(shards):
+            self.logger.info(f"shard {shard_id}: {len(shard['files'])} files, {shard['bytes']} bytes")
+
+        # the return value is pushed to XCom and pulled by each FileSyncOperator with plan_task_id
+        return {
+            'source_path': actual_source_path,
+            'num_batches': self.num_batches,
+            'shards': shards
+        }
+
+    def _get_pending_partitions(self, context, partitions, root):
+        if not self.completion_marker_path or not self.target_type or rerun_requested(context['dag_run']):
+            return partitions
+        try:
+            check_marker_path(self.completion_marker_path, self.source_path, self.partition_root)
+        except ValueError as e:
+            raise AirflowException(str(e))
+        target_adapter = StorageAdapterFactory.create_adapter(self.target_type, self.target_conn_id)
+        return pending_partitions(
+            target_adapter, root, partitions, self.completion_marker_path, context['dag_run'].run_id
+        )
+
+    def _get_file_list(self, context, source_adapter):
+        if self.backfill_start:
+            if not self.partition_root:
+                raise AirflowException("a backfill needs partition_root, the directory holding the date partitions")
+            try:
+                partitions = date_partitions(self.backfill_start, self.backfill_end, self.partition_format)
+            except ValueError as e:
+                raise AirflowException(f"invalid backfill range: {str(e)}")
+            partitions = self._get_pending_partitions(context, partitions, self.partition_root)
+            try:
+                files = [
+                    (entry.name, entry.size or 0, entry.mtime)
+                    for entry in walk_partitions(source_adapter, self.partition_root, partitions, self.list_workers)
+                ]
+            except Exception as e:
+                raise AirflowException(f"failed to list partitions from {self.partition_root}: {str(e)}")
+            return files, self.partition_root
+
+        if not self._get_pending_partitions(context, [''], self.source_path):
+            # already synced, the batches have nothing to do
+            return [], self.source_path
+
+        if source_adapter.is_directory(self.source_path):
+            try:
+                files = [
+                    (entry.name, entry.size or 0, entry.mtime)
+                    for entry in source_adapter.walk(self.source_path, max_workers=self.list_workers)
+                    if not entry.is_dir
+                ]
+            except Exception as e:
+                raise AirflowException(f"failed to list files from {self.source_path}: {str(e)}")
+            return files, self.source_path
+        else:
+            # single file case
+            entry = source_adapter.stat_file(self.source_path)
+            directory_path = os.path.dirname(self.source_path)
+            return [(entry.name, entry.size or 0, entry.mtime)], directory_path
@@ -0,0 +1,80 @@
+# airflow DAG
+from airflow.models import BaseOperator
+from airflow.exceptions import AirflowException
+from adapters.storage_adapter.factory import StorageAdapterFactory
+from transfer.partitions import (
+    check_marker_path, date_partitions, is_partition_complete, mark_partition_complete, partition_path,
+    rerun_requested
+)
+import logging
+
+
+class SyncCompletionOperator(BaseOperator):
+    """Write the completion marker of every partition synced by the batches, runs after all of them succeeded
+
+    Markers go to completion_marker_path on the target, outside the synced directories. The next runs (daily or
+    backfill) skip the partitions having one, a cleared run syncs and marks them again.
+    """
+
+    template_fields = ['source_path', 'partition_root', 'backfill_start', 'backfill_end']
+
+    def __init__(self, source_type, target_type, source_conn_id, target_conn_id, source_path, completion_marker_path,
+                 partition_root=None, backfill_start=None, backfill_end=None, partition_format='%Y-%m-%d', **kwargs):
+        super().__init__(**kwargs)
+        self.source_type = source_type
+        self.target_type = target_type
+        self.source_conn_id = source_conn_id
+        self.target_conn_id = target_conn_id
+        self.source_path = source_path
+        self.completion_marker_path = completion_marker_path
+        self.partition_root = partition_root
+        self.backfill_start = backfill_start
+        self.backfill_end = backfill_end
+        self.partition_format = partition_format
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def execute(self, context):
+        try:
+            check_marker_path(self.completion_marker_path, self.source_path, self.partition_root)
+        except ValueError as e:
+            raise AirflowException(str(e))
+        source_adapter = StorageAdapterFactory.create_adapter(self.source_type, self.source_conn_id)
+        target_adapter = StorageAdapterFactory.create_adapter(self.target_type, self.target_conn_id)
+
+        if self.backfill_start:
+            if not self.partition_root:
+                raise AirflowException("a backfill needs partition_root, the directory holding the date partitions")
+            try:
+                partitions = date_partitions(self.backfill_start, self.backfill_end, self.partition_format)
+            except ValueError as e:
+                raise AirflowException(f"invalid backfill range: {str(e)}")
+            root = self.partition_root
+        else:
+            partitions = ['']
+            root = self.source_path
+
+        task_instance = context['task_instance']
+        rerun = rerun_requested(context['dag_run'])
+        marked = []
+        for partition in partitions:
+            path = partition_path(root, partition)
+            if not rerun and is_partition_complete(target_adapter, self.completion_marker_path, path,
+                                                   task_instance.run_id):
+                continue
+            try:
+                is_dir = source_adapter.is_directory(path)
+            except OSError:
+                is_dir = False
+            if not is_dir:
+                # nothing was synced, a partition landing late on the source is picked up by a later run
+                self.logger.warning(f"partition {path} not found on the source, not marking it complete")
+                continue
+            mark_partition_complete(
+                target_adapter, self.completion_marker_path, path,
+                dag_id=task_instance.dag_id, run_id=task_instance.run_id
+            )
+            self.logger.info(f"marked {path} as synced")
+            marked.append(partition or path)
+
+        self.logger.info(f"{len(marked)} partitions marked complete")
+        return marked
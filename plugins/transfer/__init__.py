@@ -0,0 +1,46 @@
+# transfer stages used by FileSyncOperator between the source and target adapters
+from transfer.checkpoint_store import (
+    BaseCheckpointStore, JournalCheckpointStore, SQLiteCheckpointStore, XComCheckpointStore, create_checkpoint_store
+)
+from transfer.codecs import CompressionStats, compress_chunks, get_codec
+from transfer.manifest import SyncManifest, create_manifest
+from transfer.metrics import Histogram, TransferMetrics
+from transfer.parallel_transform import ordered_pool_map
+from transfer.partitions import date_partitions, mark_partition_complete, pending_partitions, walk_partitions
+from transfer.pipeline import PipelinedStream
+from transfer.shard_planner import plan_shards
+from transfer.work_queue import BaseWorkQueue, SQLiteWorkQueue, create_work_queue
+from transfer.transforms import (
+    ChainTransform, FunctionTransform, LineTransform, StreamTransform, as_stream_transform, stream_transform
+)
+
+__all__ = [
+    'BaseCheckpointStore',
+    'BaseWorkQueue',
+    'ChainTransform',
+    'CompressionStats',
+    'FunctionTransform',
+    'Histogram',
+    'JournalCheckpointStore',
+    'LineTransform',
+    'PipelinedStream',
+    'SQLiteCheckpointStore',
+    'SQLiteWorkQueue',
+    'StreamTransform',
+    'SyncManifest',
+    'TransferMetrics',
+    'XComCheckpointStore',
+    'as_stream_transform',
+    'compress_chunks',
+    'create_checkpoint_store',
+    'create_manifest',
+    'create_work_queue',
+    'date_partitions',
+    'get_codec',
+    'mark_partition_complete',
+    'ordered_pool_map',
+    'pending_partitions',
+    'plan_shards',
+    'stream_transform',
+    'walk_partitions',
+]
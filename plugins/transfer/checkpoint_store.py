@@ -0,0 +1,179 @@
+# airflow DAG
+from abc import ABC, abstractmethod
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class BaseCheckpointStore(ABC):
+    """Durable record of the files already synced by one task of one DAG run
+
+    mark() only buffers the record, pending records are committed every commit_every files
+    or commit_interval seconds (whichever comes first) and on flush().
+    """
+
+    def __init__(self, commit_every=100, commit_interval=30):
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._pending = {}
+        self._last_commit = time.monotonic()
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def load(self):
+        """Return a dict of file name => record"""
+        pass
+
+    @abstractmethod
+    def _commit(self, records):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    def mark(self, file_name, record):
+        with self._lock:
+            self._pending[file_name] = record
+            if (
+                len(self._pending) >= self.commit_every
+                or time.monotonic() - self._last_commit >= self.commit_interval
+            ):
+                self._flush_pending()
+
+    def flush(self):
+        with self._lock:
+            self._flush_pending()
+
+    def _flush_pending(self):
+        if self._pending:
+            self._commit(self._pending)
+            self._pending = {}
+        self._last_commit = time.monotonic()
+
+
+class XComCheckpointStore(BaseCheckpointStore):
+    """Whole checkpoint dict pushed to XCom, keyed by the DAG run"""
+
+    def __init__(self, task_instance, task_id, run_id, **kwargs):
+        super().__init__(**kwargs)
+        self.task_instance = task_instance
+        self.task_id = task_id
+        self.key = f'file_sync_checkpoint_{run_id}'
+        self._records = {}
+
+    def load(self):
+        checkpoint = self.task_instance.xcom_pull(task_ids=self.task_id, key=self.key)
+        self._records = dict(checkpoint) if checkpoint else {}
+        return dict(self._records)
+
+    def _commit(self, records):
+        # XCom has no partial update, so a commit rewrites the whole dict => keep commits batched
+        self._records.update(records)
+        self.task_instance.xcom_push(key=self.key, value=self._records)
+
+    def clear(self):
+        with self._lock:
+            self._pending = {}
+            self._records = {}
+            self.task_instance.xcom_push(key=self.key, value=None)
+
+
+class SQLiteCheckpointStore(BaseCheckpointStore):
+    """One row per synced file in a SQLite database, put it on a shared volume to survive a worker change"""
+
+    def __init__(self, path, scope, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.scope = scope
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_sync_checkpoint ("
+            " scope TEXT NOT NULL, file_name TEXT NOT NULL, record TEXT NOT NULL,"
+            " PRIMARY KEY (scope, file_name))"
+        )
+        self._conn.commit()
+
+    def load(self):
+        rows = self._conn.execute(
+            "SELECT file_name, record FROM file_sync_checkpoint WHERE scope = ?", (self.scope,)
+        )
+        return {file_name: json.loads(record) for file_name, record in rows}
+
+    def _commit(self, records):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO file_sync_checkpoint (scope, file_name, record) VALUES (?, ?, ?)",
+                [(self.scope, file_name, json.dumps(record)) for file_name, record in records.items()]
+            )
+
+    def clear(self):
+        with self._lock:
+            self._pending = {}
+            with self._conn:
+                self._conn.execute("DELETE FROM file_sync_checkpoint WHERE scope = ?", (self.scope,))
+
+
+class JournalCheckpointStore(BaseCheckpointStore):
+    """Append-only JSON lines journal, a commit is one append + fsync whatever the size of the checkpoint"""
+
+    def __init__(self, directory, scope, **kwargs):
+        super().__init__(**kwargs)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, re.sub(r'[^A-Za-z0-9_.-]', '_', scope) + '.jsonl')
+
+    def load(self):
+        checkpoint = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # torn last line after a crash, everything before it is valid
+                        self.logger.warning(f"ignoring partial line in checkpoint journal {self.path}")
+                        break
+                    checkpoint[entry['file']] = entry['record']
+        except FileNotFoundError:
+            pass
+        return checkpoint
+
+    def _commit(self, records):
+        lines = ''.join(
+            json.dumps({'file': file_name, 'record': record}) + '\n' for file_name, record in records.items()
+        )
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self):
+        with self._lock:
+            self._pending = {}
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def create_checkpoint_store(backend, context, task_id, path=None, **kwargs):
+    dag_run = context['dag_run']
+    if backend == 'xcom':
+        return XComCheckpointStore(context['task_instance'], task_id, dag_run.run_id, **kwargs)
+
+    scope = f"{dag_run.dag_id}/{task_id}/{dag_run.run_id}"
+    if backend == 'sqlite':
+        path = path or os.path.join(tempfile.gettempdir(), 'file_sync_checkpoint.db')
+        return SQLiteCheckpointStore(path, scope, **kwargs)
+    if backend == 'journal':
+        path = path or os.path.join(tempfile.gettempdir(), 'file_sync_checkpoint')
+        return JournalCheckpointStore(path, scope, **kwargs)
+    raise ValueError(f"unsupported checkpoint backend: {backend}")
@@ -0,0 +1,127 @@
+# airflow DAG
+import importlib
+import threading
+import time
+import zlib
+
+
+def _import_optional(module_name, codec_name, package):
+    # imported on first use, not when the DAG file (and so this module) is parsed
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        raise ImportError(f"{codec_name} compression requires the {package} package")
+
+
+class GzipCodec:
+    name = 'gzip'
+    suffix = '.gz'
+    default_level = 6
+
+    def __init__(self, level=None):
+        self.level = self.default_level if level is None else level
+
+    def compressor(self):
+        # wbits=31 => gzip header and trailer, the output is a regular .gz file
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+
+class ZstdCodec:
+    name = 'zstd'
+    suffix = '.zst'
+    default_level = 3
+
+    def __init__(self, level=None):
+        self._zstandard = _import_optional('zstandard', 'zstd', 'zstandard')
+        self.level = self.default_level if level is None else level
+
+    def compressor(self):
+        return self._zstandard.ZstdCompressor(level=self.level).compressobj()
+
+
+class Lz4Codec:
+    name = 'lz4'
+    suffix = '.lz4'
+    default_level = 0
+
+    def __init__(self, level=None):
+        self._lz4_frame = _import_optional('lz4.frame', 'lz4', 'lz4')
+        self.level = self.default_level if level is None else level
+
+    def compressor(self):
+        return _Lz4Compressor(self._lz4_frame, self.level)
+
+
+class _Lz4Compressor:
+    # same compress()/flush() interface as zlib, the frame header goes out with the first block
+    def __init__(self, lz4_frame, level):
+        self._compressor = lz4_frame.LZ4FrameCompressor(compression_level=level)
+        self._header = self._compressor.begin()
+
+    def compress(self, data):
+        out = self._header + self._compressor.compress(data)
+        self._header = b''
+        return out
+
+    def flush(self):
+        return self._header + self._compressor.flush()
+
+
+CODECS = {
+    'gzip': GzipCodec,
+    'zstd': ZstdCodec,
+    'lz4': Lz4Codec,
+}
+
+
+def get_codec(name, level=None):
+    codec_class = CODECS.get(name.lower())
+    if not codec_class:
+        raise ValueError(f"unsupported compression: {name}")
+    return codec_class(level)
+
+
+class CompressionStats:
+    """Bytes in/out and time spent compressing, shared by the files of one task"""
+
+    def __init__(self):
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, raw_bytes, wire_bytes, seconds):
+        with self._lock:
+            self.raw_bytes += raw_bytes
+            self.wire_bytes += wire_bytes
+            self.seconds += seconds
+
+    def as_dict(self):
+        return {
+            'raw_bytes': self.raw_bytes,
+            'wire_bytes': self.wire_bytes,
+            'compression_seconds': round(self.seconds, 3),
+            'compression_ratio': round(self.raw_bytes / self.wire_bytes, 2) if self.wire_bytes else None
+        }
+
+
+def compress_chunks(chunks, codec, stats):
+    compressor = codec.compressor()
+    raw_bytes = wire_bytes = 0
+    seconds = 0.0
+    for chunk in chunks:
+        start = time.perf_counter()
+        out = compressor.compress(chunk)
+        seconds += time.perf_counter() - start
+        raw_bytes += len(chunk)
+        if out:
+            wire_bytes += len(out)
+            yield out
+
+    start = time.perf_counter()
+    out = compressor.flush()
+    seconds += time.perf_counter() - start
+    # only complete streams are counted, a failed transfer is retried and counted then
+    stats.add(raw_bytes, wire_bytes + len(out), seconds)
+    if out:
+        yield out
@@ -0,0 +1,107 @@
+# airflow DAG
+from adapters.storage_adapter.local_adapter import LocalStorageAdapter
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+
+
+class SyncManifest:
+    """What was last synced for each file of one target directory, kept as JSON files in manifest_dir
+
+    manifest_dir is kept out of the synced tree, the target only ever gets the synced files. Every task owns
+    one file in it so batch tasks never write the same object; on load all of them are merged and the most
+    recent record of a file wins, so files can move between shards.
+    """
+
+    def __init__(self, adapter, manifest_dir, owner):
+        self.adapter = adapter
+        self.manifest_dir = manifest_dir.rstrip('/')
+        self.owner = owner
+        self.records = {}
+        self._own_records = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def load(self):
+        try:
+            names = self.adapter.list_files(self.manifest_dir)
+        except OSError:
+            # nothing synced into this directory yet
+            return self
+
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            data = b''.join(self.adapter.read_file_chunks(f"{self.manifest_dir}/{name}", 1024 * 1024))
+            records = json.loads(data.decode('utf-8'))
+            if name == f"{self.owner}.json":
+                self._own_records = dict(records)
+            for file_name, record in records.items():
+                current = self.records.get(file_name)
+                if current is None or current['synced_at'] < record['synced_at']:
+                    self.records[file_name] = record
+
+        self.logger.info(f"loaded {len(self.records)} manifest records from {self.manifest_dir}")
+        return self
+
+    def is_up_to_date(self, entry, digest=None):
+        record = self.records.get(entry.name)
+        if record is None or entry.size is None or entry.mtime is None:
+            return False
+        if record['size'] != entry.size or record['mtime'] != entry.mtime:
+            return False
+        return digest is None or record.get('digest') == digest
+
+    def record(self, entry, bytes_written, digest=None, target_digest=None):
+        record = {
+            'size': entry.size,
+            'mtime': entry.mtime,
+            'bytes': bytes_written,
+            'synced_at': datetime.utcnow().isoformat()
+        }
+        if digest is not None:
+            record['digest'] = digest
+        if target_digest is not None:
+            # digest of what was written, when a transformation/compression made it differ from the source
+            record['target_digest'] = target_digest
+        with self._lock:
+            self.records[entry.name] = record
+            self._own_records[entry.name] = record
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._own_records, sort_keys=True).encode('utf-8')
+            self._dirty = False
+
+        # write then rename, a reader never sees a half written manifest
+        manifest_file = f"{self.manifest_dir}/{self.owner}.json"
+        try:
+            self.adapter.write_file_chunks(f"{manifest_file}.tmp", [data])
+            self.adapter.rename_file(f"{manifest_file}.tmp", manifest_file)
+        except Exception:
+            with self._lock:
+                self._dirty = True
+            raise
+
+
+def create_manifest(conn_id, root_path, owner, path=None):
+    """Manifest of root_path on the target conn_id, in a local directory next to the checkpoint state
+
+    Put path on a volume shared by the workers when batch tasks run on several hosts, otherwise a host
+    only knows the files synced on it (the others are synced again, nothing is skipped wrongly).
+    """
+    path = path or os.path.join(tempfile.gettempdir(), 'file_sync_manifest')
+    # one directory per target connection and synced directory, readable and without collisions
+    key = f"{conn_id}:{root_path.rstrip('/')}"
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', key)[-80:]
+    manifest_dir = os.path.join(path, f"{name}-{hashlib.sha256(key.encode()).hexdigest()[:12]}")
+    return SyncManifest(LocalStorageAdapter(), manifest_dir, owner)
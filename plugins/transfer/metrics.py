@@ -0,0 +1,122 @@
+# airflow DAG
+from contextlib import contextmanager
+import threading
+import time
+
+
+STAGES = (
+    'list', 'mkdir', 'read', 'transform', 'compress', 'write', 'copy', 'verify', 'rename', 'checkpoint', 'pipeline_wait'
+)
+
+# per-file histogram bucket upper bounds, the last bucket (None) takes everything above
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(12))  # 1KB .. 4GB
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        index = len(self.bounds)
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def as_dict(self):
+        bounds = list(self.bounds) + [None]
+        return {
+            'count': self.count,
+            'sum': round(self.total, 6),
+            'min': self.min,
+            'max': self.max,
+            # [upper bound, count], only non empty buckets
+            'buckets': [[bound, count] for bound, count in zip(bounds, self.counts) if count],
+        }
+
+
+class TransferMetrics:
+    """Time spent in each stage of the transfers of one task, plus per-file bytes/duration histograms
+
+    Stage times are exclusive: the time a stage waits on the stage feeding it (timed in the same thread)
+    is counted for that one, so read/transform/write add up instead of nesting.
+    """
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.calls = dict.fromkeys(STAGES, 0)
+        self.file_bytes = Histogram(BYTES_BUCKETS)
+        self.file_seconds = Histogram(DURATION_BUCKETS)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _enter(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        # [time spent in nested stages]
+        frame = [0.0]
+        stack.append(frame)
+        return stack, frame, time.perf_counter()
+
+    def _exit(self, stage, stack, frame, start):
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        if stack:
+            stack[-1][0] += elapsed
+        with self._lock:
+            self.seconds[stage] += elapsed - frame[0]
+            self.calls[stage] += 1
+
+    @contextmanager
+    def stage(self, stage):
+        stack, frame, start = self._enter()
+        try:
+            yield
+        finally:
+            self._exit(stage, stack, frame, start)
+
+    def timed(self, chunks, stage):
+        """Iterate chunks, the time spent producing each one is counted for stage"""
+        chunks = iter(chunks)
+        while True:
+            stack, frame, start = self._enter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                self._exit(stage, stack, frame, start)
+            yield chunk
+
+    def record_file(self, bytes_transferred, seconds):
+        with self._lock:
+            self.file_bytes.add(bytes_transferred)
+            self.file_seconds.add(seconds)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'stage_seconds': {stage: round(seconds, 6) for stage, seconds in self.seconds.items() if self.calls[stage]},
+                'stage_calls': {stage: calls for stage, calls in self.calls.items() if calls},
+                'file_bytes': self.file_bytes.as_dict(),
+                'file_seconds': self.file_seconds.as_dict(),
+            }
+
+    def publish(self, stats_client, prefix, tags=None):
+        """Send the stage totals to a StatsD style client (airflow.stats.Stats)"""
+        with self._lock:
+            stage_seconds = {stage: seconds for stage, seconds in self.seconds.items() if self.calls[stage]}
+        for stage, seconds in stage_seconds.items():
+            stats_client.timing(f'{prefix}.stage.{stage}', seconds * 1000, tags=tags)
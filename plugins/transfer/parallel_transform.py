@@ -0,0 +1,21 @@
+# airflow DAG
+from collections import deque
+
+
+def ordered_pool_map(executor, func, blocks, max_in_flight):
+    """map() on an executor that yields results in input order with at most max_in_flight blocks submitted
+
+    Exceptions raised by a worker are re-raised here, in the transfer thread, when their block is reached.
+    """
+    pending = deque()
+    try:
+        for block in blocks:
+            pending.append(executor.submit(func, block))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # the transfer failed or stopped early, don't leave work behind in the pool
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,114 @@
+# airflow DAG
+from datetime import date, datetime, timedelta
+import json
+import logging
+import posixpath
+
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_date(value, partition_format):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, partition_format).date()
+
+
+def date_partitions(start, end, partition_format='%Y-%m-%d'):
+    """Names of the daily partitions from start to end, both included (dates or strings in partition_format)"""
+    start = _parse_date(start, partition_format)
+    end = _parse_date(end or start, partition_format)
+    if end < start:
+        raise ValueError(f"backfill end {end} is before its start {start}")
+    return [
+        (start + timedelta(days=day)).strftime(partition_format)
+        for day in range((end - start).days + 1)
+    ]
+
+
+def partition_path(root, partition):
+    # '' is the root itself (the partition of a daily run)
+    return f"{root.rstrip('/')}/{partition}" if partition else root
+
+
+def marker_file(marker_path, path):
+    # markers mirror the synced paths: /data/source/2024-03-01 => <marker_path>/data/source/2024-03-01.complete
+    return f"{marker_path.rstrip('/')}/{path.strip('/')}.complete"
+
+
+def check_marker_path(marker_path, *roots):
+    """Raise ValueError when marker_path is inside one of the synced directories, markers stay out of the data"""
+    marker = posixpath.normpath(marker_path)
+    for root in roots:
+        if not root:
+            continue
+        root = posixpath.normpath(root)
+        if marker == root or marker.startswith(root.rstrip('/') + '/'):
+            raise ValueError(f"completion_marker_path {marker_path} is inside the synced directory {root}")
+
+
+def rerun_requested(dag_run):
+    # a cleared run (clear in the UI, backfill --reset-dagruns) has to sync again whatever the markers say
+    return bool(getattr(dag_run, 'clear_number', 0))
+
+
+def is_partition_complete(adapter, marker_path, path, run_id=None):
+    try:
+        data = b''.join(adapter.read_file_chunks(marker_file(marker_path, path), 64 * 1024))
+    except OSError:
+        return False
+    try:
+        record = json.loads(data.decode('utf-8'))
+    except ValueError:
+        # not one of ours, still a marker
+        return True
+    if run_id is not None and isinstance(record, dict) and record.get('run_id') == run_id:
+        # marked by this very run, which only runs again when it was cleared
+        logger.info(f"{path} was marked complete by this run, syncing it again")
+        return False
+    return True
+
+
+def pending_partitions(adapter, root, partitions, marker_path, run_id=None):
+    """The partitions of root without completion marker under marker_path (all of them without marker_path)"""
+    if not marker_path:
+        return list(partitions)
+    pending = []
+    for partition in partitions:
+        if is_partition_complete(adapter, marker_path, partition_path(root, partition), run_id):
+            logger.info(f"{partition_path(root, partition)} already synced, skipping it")
+        else:
+            pending.append(partition)
+    return pending
+
+
+def mark_partition_complete(adapter, marker_path, path, **info):
+    record = dict(info, completed_at=datetime.utcnow().isoformat())
+    adapter.write_file_chunks(marker_file(marker_path, path), [json.dumps(record).encode('utf-8')])
+
+
+def in_partitions(name, partitions):
+    # names listed under the partitions root start with their partition ('2024-03-01/a/b.txt')
+    return '' in partitions or name.split('/', 1)[0] in partitions
+
+
+def walk_partitions(adapter, root, partitions, max_workers=1):
+    """FileEntry of every file of the partitions, named partition/a/b/file.txt relative to root
+
+    Partitions are walked one after the other but streamed, so the first files are transferred while the
+    next partitions are still being listed. Partitions missing on the source are skipped.
+    """
+    for partition in partitions:
+        path = partition_path(root, partition)
+        try:
+            is_dir = adapter.is_directory(path)
+        except OSError:
+            is_dir = False
+        if not is_dir:
+            logger.warning(f"partition {path} not found on the source, skipping it")
+            continue
+        for entry in adapter.walk(path, max_workers=max_workers):
+            if not entry.is_dir:
+                yield entry._replace(name=f"{partition}/{entry.name}")
@@ -0,0 +1,85 @@
+# airflow DAG
+from collections import deque
+import threading
+
+
+_END = object()
+
+
+class PipelinedStream:
+    """Run an upstream chunk iterator in a background thread behind a bounded queue
+
+    At most max_chunks chunks (and max_bytes bytes when set) are buffered, so memory stays
+    around depth * chunk_size while the producer and the consumer overlap their latency.
+    """
+
+    def __init__(self, chunks, max_chunks=4, max_bytes=None, name=None):
+        self.chunks = chunks
+        self.max_chunks = max(1, max_chunks)
+        self.max_bytes = max_bytes
+        self.name = name
+        self._queue = deque()
+        self._queued_bytes = 0
+        self._error = None
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def __iter__(self):
+        self._thread = threading.Thread(target=self._produce, name=self.name, daemon=True)
+        self._thread.start()
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                chunk = self._queue.popleft()
+                if chunk is not _END:
+                    self._queued_bytes -= len(chunk)
+                self._cond.notify_all()
+
+            if chunk is _END:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield chunk
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            self._close_upstream()
+
+    def _produce(self):
+        try:
+            for chunk in self.chunks:
+                with self._cond:
+                    while not self._stopped and self._is_full(len(chunk)):
+                        self._cond.wait()
+                    if self._stopped:
+                        return
+                    self._queue.append(chunk)
+                    self._queued_bytes += len(chunk)
+                    self._cond.notify_all()
+        except BaseException as e:
+            self._error = e
+        finally:
+            # the upstream generator is closed in the thread that runs it, so e.g. SFTP channels are released
+            self._close_upstream()
+            with self._cond:
+                self._queue.append(_END)
+                self._cond.notify_all()
+
+    def _is_full(self, size):
+        if not self._queue:
+            return False
+        if len(self._queue) >= self.max_chunks:
+            return True
+        return self.max_bytes is not None and self._queued_bytes + size > self.max_bytes
+
+    def _close_upstream(self):
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
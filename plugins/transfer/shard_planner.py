@@ -0,0 +1,23 @@
+# airflow DAG
+import heapq
+
+
+def plan_shards(files, num_batches):
+    """Split (name, size, ...) tuples into num_batches shards with about the same number of bytes
+
+    Largest files are placed first on the currently lightest shard (LPT scheduling), so one shard
+    can't end up with all the big files like with a hash of the name.
+    """
+    if num_batches <= 0:
+        raise ValueError("num_batches must be positive")
+
+    shards = [{'files': [], 'bytes': 0} for _ in range(num_batches)]
+    # (total bytes, number of files, shard id) => ties go to the shard with less files, then the lowest id
+    heap = [(0, 0, shard_id) for shard_id in range(num_batches)]
+    for file in sorted(files, key=lambda f: (-f[1], f[0])):
+        size = file[1]
+        total_bytes, num_files, shard_id = heapq.heappop(heap)
+        shards[shard_id]['files'].append(list(file))
+        shards[shard_id]['bytes'] += size
+        heapq.heappush(heap, (total_bytes + size, num_files + 1, shard_id))
+    return shards
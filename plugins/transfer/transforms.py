@@ -0,0 +1,142 @@
+# airflow DAG
+
+
+class StreamTransform:
+    """Transformation applied to the whole chunk stream of one file
+
+    header()/footer() run once per file (setup/teardown) and transform_block() once per block.
+    Nothing per file is kept on the instance, so one instance can serve files transferred in parallel.
+    """
+
+    def header(self):
+        return b''
+
+    def footer(self):
+        return b''
+
+    def transform_block(self, block):
+        return block
+
+    def blocks(self, chunks):
+        # how the stream is cut before transform_block, chunks as they come by default
+        return chunks
+
+    def stream(self, chunks, map_blocks=map):
+        # map_blocks lets the caller run transform_block somewhere else (e.g. a process pool), in order
+        header = self.header()
+        if header:
+            yield header
+        blocks = self.blocks(chunks)
+        if type(self).transform_block is not StreamTransform.transform_block:
+            blocks = map_blocks(self.transform_block, blocks)
+        # else nothing to run per block (header/footer only), the blocks don't go through map_blocks
+        for out in blocks:
+            if out:
+                yield out
+        footer = self.footer()
+        if footer:
+            yield footer
+
+    def __call__(self, chunk):
+        # plain callable use => the chunk is handled as a whole file
+        return b''.join(self.stream([chunk]))
+
+
+class LineTransform(StreamTransform):
+    """Hand only complete records to transform_block, the partial record at the end of a chunk is
+    carried over to the next one so a record (or a multi-byte character) is never split
+
+    Memory stays bounded on files without delimiter: a record growing past max_record_size is handed over
+    in pieces, cut between two UTF-8 characters.
+    """
+
+    delimiter = b'\n'
+    max_record_size = 16 * 1024 * 1024
+
+    def blocks(self, chunks):
+        carry = bytearray()
+        for chunk in chunks:
+            if not isinstance(chunk, (bytes, bytearray)):
+                chunk = bytes(chunk)
+            end = chunk.rfind(self.delimiter)
+            if end < 0:
+                carry += chunk
+                if len(carry) > self.max_record_size:
+                    cut = _utf8_boundary(carry)
+                    yield bytes(carry[:cut])
+                    del carry[:cut]
+                continue
+
+            end += len(self.delimiter)
+            if carry:
+                carry += chunk[:end]
+                block = bytes(carry)
+            elif end == len(chunk):
+                # chunk already ends on a record boundary => pass it through without slicing
+                block = chunk
+            else:
+                block = chunk[:end]
+            carry = bytearray(chunk[end:])
+            yield block
+
+        if carry:
+            yield bytes(carry)
+
+
+def _utf8_boundary(data):
+    # length of data without the multi-byte character its last bytes start, if it is incomplete
+    end = len(data)
+    for i in range(end - 1, max(end - 4, -1), -1):
+        byte = data[i]
+        if byte < 0x80:
+            return end
+        if byte >= 0xC0:
+            length = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return i if i + length > end else end
+    return end
+
+
+class FunctionTransform(StreamTransform):
+    """Wrap a plain chunk => bytes callable"""
+
+    def __init__(self, func):
+        self.func = func
+
+    def transform_block(self, block):
+        return self.func(block)
+
+
+class ChainTransform(StreamTransform):
+    """Run transforms one after the other, each stage streams into the next one
+
+    A stage only allocates when it changes the data, header/footer of a stage go through the later stages.
+    """
+
+    def __init__(self, *transforms):
+        self.transforms = [as_stream_transform(transform) for transform in transforms]
+
+    def stream(self, chunks, map_blocks=map):
+        for transform in self.transforms:
+            chunks = transform.stream(chunks, map_blocks)
+        return chunks
+
+
+def as_stream_transform(transform):
+    if isinstance(transform, StreamTransform):
+        return transform
+    return FunctionTransform(transform)
+
+
+def _bytes_chunks(chunks):
+    # readers may hand out memoryviews of pooled buffers or mapped files, transformations get bytes: views
+    # don't pickle to a process pool, have no decode() and are overwritten once the buffer is reused
+    for chunk in chunks:
+        yield chunk if isinstance(chunk, (bytes, bytearray)) else bytes(chunk)
+
+
+def stream_transform(transform, chunks, map_blocks=map):
+    """Apply a StreamTransform or a plain chunk callable to the chunks of one file"""
+    chunks = _bytes_chunks(chunks)
+    if isinstance(transform, StreamTransform):
+        return transform.stream(chunks, map_blocks)
+    return map_blocks(transform, chunks)
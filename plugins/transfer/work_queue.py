@@ -0,0 +1,285 @@
+# airflow DAG
+from abc import ABC, abstractmethod
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+class BaseWorkQueue(ABC):
+    """Files of one DAG run shared by all its batch tasks, each task leases the next file when it has room
+
+    One worker populates the queue (populate() returns False for the others), leases expire after
+    lease_seconds unless renewed so the files of a crashed worker go back to the others, and a file is
+    completed at most once: complete() is True only for the worker holding its lease.
+    """
+
+    def __init__(self, lease_seconds=300, max_attempts=3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @abstractmethod
+    def populate(self, files, worker_id):
+        pass
+
+    @abstractmethod
+    def lease(self, worker_id, max_items=1):
+        """Return up to max_items (name, size, mtime) tuples, largest files first"""
+        pass
+
+    @abstractmethod
+    def complete(self, name, worker_id):
+        pass
+
+    @abstractmethod
+    def fail(self, name, worker_id):
+        pass
+
+    @abstractmethod
+    def renew(self, worker_id):
+        pass
+
+    @abstractmethod
+    def release(self, worker_id):
+        """Give back every file leased by worker_id (failed batch, or left over by a previous try)"""
+        pass
+
+    @abstractmethod
+    def retry_failed(self):
+        """Put the files that failed max_attempts times back to pending with their attempts reset"""
+        pass
+
+    @abstractmethod
+    def failed_files(self):
+        """Names of the files that failed max_attempts times"""
+        pass
+
+    @abstractmethod
+    def is_populated(self):
+        pass
+
+    @abstractmethod
+    def is_drained(self):
+        """Populated and every file done or failed, while files are leased their lease may still expire"""
+        pass
+
+
+class SQLiteWorkQueue(BaseWorkQueue):
+    """Work queue in a SQLite database, every batch task must see the same file (shared volume)
+
+    SQLite relies on POSIX file locks of the volume: NFSv4 (or v3 with a lock manager, not mounted with
+    nolock) works, SMB shares and many FUSE file systems don't lock reliably and can corrupt the queue.
+    """
+
+    # files inserted per transaction while populating, leasing goes on in between
+    populate_batch_size = 1000
+
+    def __init__(self, path, scope, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.scope = scope
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # isolation_level=None => we issue BEGIN IMMEDIATE ourselves, the write lock is taken before the
+        # select so two workers can't lease the same file
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        # rollback journal, WAL keeps its index in shared memory that workers on other hosts don't see
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._lock = threading.Lock()
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS work_queue ("
+                " scope TEXT NOT NULL, name TEXT NOT NULL, size INTEGER, mtime REAL,"
+                " state TEXT NOT NULL DEFAULT 'pending', owner TEXT, lease_expires REAL,"
+                " attempts INTEGER NOT NULL DEFAULT 0, completed_at REAL,"
+                " PRIMARY KEY (scope, name))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS work_queue_state ON work_queue (scope, state, size)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS work_queue_population ("
+                " scope TEXT PRIMARY KEY, state TEXT NOT NULL, owner TEXT, expires REAL)"
+            )
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._conn, self._lock)
+
+    def populate(self, files, worker_id):
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO work_queue_population (scope, state, owner, expires) "
+                "VALUES (?, 'populating', ?, ?)",
+                (self.scope, worker_id, now + self.lease_seconds)
+            )
+            if not cursor.rowcount:
+                # somebody else claimed it, take over only when its claim expired without finishing
+                cursor = conn.execute(
+                    "UPDATE work_queue_population SET owner = ?, expires = ? "
+                    "WHERE scope = ? AND state = 'populating' AND (expires < ? OR owner = ?)",
+                    (worker_id, now + self.lease_seconds, self.scope, now, worker_id)
+                )
+                if not cursor.rowcount:
+                    return False
+
+        self.logger.info(f"populating work queue {self.scope}")
+        batch = []
+        total = 0
+        for entry in files:
+            batch.append((self.scope, entry.name, entry.size, entry.mtime))
+            if len(batch) >= self.populate_batch_size:
+                total += self._insert(batch, worker_id)
+                batch = []
+        total += self._insert(batch, worker_id)
+
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE work_queue_population SET state = 'ready', expires = NULL WHERE scope = ?", (self.scope,)
+            )
+        self.logger.info(f"work queue {self.scope} populated with {total} files")
+        return True
+
+    def _insert(self, batch, worker_id):
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO work_queue (scope, name, size, mtime) VALUES (?, ?, ?, ?)", batch
+            )
+            # still alive => keep the population claim
+            conn.execute(
+                "UPDATE work_queue_population SET expires = ? WHERE scope = ? AND owner = ?",
+                (time.time() + self.lease_seconds, self.scope, worker_id)
+            )
+        return len(batch)
+
+    def lease(self, worker_id, max_items=1):
+        now = time.time()
+        with self._transaction() as conn:
+            # largest first: the big files start early and the small ones fill the gaps at the end
+            rows = conn.execute(
+                "SELECT name, size, mtime FROM work_queue "
+                "WHERE scope = ? AND (state = 'pending' OR (state = 'leased' AND lease_expires < ?)) "
+                "ORDER BY size IS NULL, size DESC LIMIT ?",
+                (self.scope, now, max_items)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE work_queue SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE scope = ? AND name = ?",
+                [(worker_id, now + self.lease_seconds, self.scope, row[0]) for row in rows]
+            )
+        return rows
+
+    def complete(self, name, worker_id):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE work_queue SET state = 'done', completed_at = ?, lease_expires = NULL "
+                "WHERE scope = ? AND name = ? AND state = 'leased' AND owner = ?",
+                (time.time(), self.scope, name, worker_id)
+            )
+        if not cursor.rowcount:
+            self.logger.warning(f"{name} was not leased by {worker_id} anymore, completion not recorded")
+        return bool(cursor.rowcount)
+
+    def fail(self, name, worker_id):
+        # back to the others, unless it already failed max_attempts times
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE work_queue SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+                " owner = NULL, lease_expires = NULL "
+                "WHERE scope = ? AND name = ? AND state = 'leased' AND owner = ?",
+                (self.max_attempts, self.scope, name, worker_id)
+            )
+
+    def renew(self, worker_id):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE work_queue SET lease_expires = ? WHERE scope = ? AND state = 'leased' AND owner = ?",
+                (time.time() + self.lease_seconds, self.scope, worker_id)
+            )
+
+    def release(self, worker_id):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE work_queue SET state = 'pending', owner = NULL, lease_expires = NULL "
+                "WHERE scope = ? AND state = 'leased' AND owner = ?",
+                (self.scope, worker_id)
+            )
+        if cursor.rowcount:
+            self.logger.info(f"released {cursor.rowcount} files leased by {worker_id}")
+
+    def retry_failed(self):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE work_queue SET state = 'pending', attempts = 0 WHERE scope = ? AND state = 'failed'",
+                (self.scope,)
+            )
+        if cursor.rowcount:
+            self.logger.info(f"{cursor.rowcount} failed files back in the work queue {self.scope}")
+        return cursor.rowcount
+
+    def failed_files(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name FROM work_queue WHERE scope = ? AND state = 'failed' ORDER BY name", (self.scope,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def is_populated(self):
+        with self._lock:
+            population = self._conn.execute(
+                "SELECT state FROM work_queue_population WHERE scope = ?", (self.scope,)
+            ).fetchone()
+        return population is not None and population[0] == 'ready'
+
+    def is_drained(self):
+        if not self.is_populated():
+            return False
+        with self._lock:
+            remaining = self._conn.execute(
+                "SELECT 1 FROM work_queue WHERE scope = ? AND state IN ('pending', 'leased') LIMIT 1", (self.scope,)
+            ).fetchone()
+        return remaining is None
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*) FROM work_queue WHERE scope = ? GROUP BY state", (self.scope,)
+            ).fetchall()
+        return dict(rows)
+
+
+class _ImmediateTransaction:
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+
+
+def create_work_queue(backend, context, path=None, **kwargs):
+    # shared by every batch task of the DAG run, a cleared run gets a new queue and syncs everything again
+    dag_run = context['dag_run']
+    scope = f"{dag_run.dag_id}/{dag_run.run_id}"
+    clear_number = getattr(dag_run, 'clear_number', 0)
+    if clear_number:
+        scope = f"{scope}/clear{clear_number}"
+    if backend == 'sqlite':
+        # no local default: batch tasks on other hosts would each get their own queue and sync everything
+        if not path:
+            raise ValueError("the sqlite work queue needs a path on a volume shared by every worker")
+        return SQLiteWorkQueue(path, scope, **kwargs)
+    raise ValueError(f"unsupported work queue backend: {backend}")
@@ -0,0 +1,79 @@
+"""Benchmark datasets, date-partitioned text files like create_test_files.sh generates
+
+Every profile is a list of (count, min_size, max_size, subdirectory) groups. scale multiplies the
+counts and size_scale the sizes, the content is random base64 text so transformations see real lines.
+"""
+import base64
+import os
+import random
+
+KB = 1024
+MB = 1024 * KB
+
+PROFILES = {
+    # many small files: listing, per-file round trips, checkpoint commits
+    'small': [
+        (5000, 1 * KB, 16 * KB, ''),
+    ],
+    # few huge files: raw throughput, segmentation, memory use
+    'huge': [
+        (2, 256 * MB, 256 * MB, ''),
+    ],
+    'mixed': [
+        (2000, 1 * KB, 64 * KB, ''),
+        (500, 64 * KB, 1 * MB, 'medium'),
+        (40, 1 * MB, 16 * MB, 'large'),
+        (2, 128 * MB, 128 * MB, 'large/huge'),
+    ],
+}
+
+_BLOCK_SIZE = 4 * MB
+
+
+def _write_random_text(f, size, rnd):
+    header = f"Test File: {os.path.basename(f.name)}\n{'-' * 40}\n".encode()
+    f.write(header[:size])
+    remaining = size - min(size, len(header))
+    while remaining > 0:
+        # encodebytes wraps lines at 76 characters, 3 raw bytes => 4 text bytes
+        raw = rnd.randbytes(min(_BLOCK_SIZE, remaining) * 3 // 4 + 3)
+        text = base64.encodebytes(raw)[:remaining]
+        f.write(text)
+        remaining -= len(text)
+
+
+def generate_dataset(root, profile, scale=1.0, size_scale=1.0, partition='2024-03-01', seed=0):
+    """Write the dataset under root/source/<partition>/ and return its description
+
+    Generation is skipped when a dataset with the same parameters is already there.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"unknown dataset profile: {profile}")
+
+    source_path = f"/source/{partition}"
+    base_dir = os.path.join(root, 'source', partition)
+    marker = os.path.join(root, f'.dataset-{profile}-{scale}-{size_scale}-{seed}')
+
+    rnd = random.Random(seed)
+    files = []
+    for count, min_size, max_size, subdirectory in PROFILES[profile]:
+        for i in range(max(1, int(count * scale))):
+            size = max(1, int(rnd.randint(min_size, max_size) * size_scale))
+            files.append((os.path.join(subdirectory, f'file_{len(files):06d}.txt'), size))
+
+    if not os.path.exists(marker):
+        for name, size in files:
+            path = os.path.join(base_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                _write_random_text(f, size, rnd)
+        open(marker, 'w').close()
+
+    return {
+        'profile': profile,
+        'scale': scale,
+        'size_scale': size_scale,
+        'source_path': source_path,
+        'files': len(files),
+        'bytes': sum(size for _, size in files),
+    }
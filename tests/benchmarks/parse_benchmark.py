@@ -0,0 +1,104 @@
+"""DAG parse time of a DagBuilder DAG file, with and without the parsed config cache
+
+    python tests/benchmarks/parse_benchmark.py --dag-file dags/dag_transfer_files/dag.py --iterations 50
+
+Modes:
+- render+yaml.Loader: Jinja render and the pure Python loader, how the DAG files parsed before the cache
+- cold: load_dag_config with empty caches (render, C loader when available, pickle written)
+- disk cache: new process, the pickle written by an earlier parse is there (what the scheduler sees)
+- memory cache: same process parsing the file again
+- dag file: the whole DAG file (load + DagBuilder.build) with the disk cache warm
+"""
+import argparse
+import json
+import os
+import runpy
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(os.path.dirname(BENCHMARKS_DIR))
+for path in (os.path.join(REPO_DIR, 'plugins'), os.path.join(REPO_DIR, 'dags')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def measure(func, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'min_ms': round(timings[0], 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dag-file', default=os.path.join(REPO_DIR, 'dags', 'dag_transfer_files', 'dag.py'))
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--output', help="save the timings as JSON")
+    args = parser.parse_args(argv)
+
+    cache_dir = tempfile.mkdtemp(prefix='dag_builder_cache_')
+    os.environ['DAG_BUILDER_CACHE_DIR'] = cache_dir
+
+    import yaml
+    from jinja2 import Template
+    import dag_builder
+    from dag_builder import DagBuilder, load_dag_config
+
+    dag_file = os.path.abspath(args.dag_file)
+    template_path = os.path.join(os.path.dirname(dag_file), 'config.yaml')
+    # the render inputs are whatever the DAG file passes in
+    config = runpy.run_path(dag_file).get('config')
+
+    def uncached():
+        with open(template_path) as f:
+            yaml.load(Template(f.read()).render(config=config), Loader=yaml.Loader)
+
+    def cold():
+        dag_builder._config_cache.clear()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        load_dag_config(template_path, config=config)
+
+    def disk_cache():
+        dag_builder._config_cache.clear()
+        load_dag_config(template_path, config=config)
+
+    def memory_cache():
+        load_dag_config(template_path, config=config)
+
+    def dag_file_parse():
+        dag_builder._config_cache.clear()
+        runpy.run_path(dag_file)
+
+    results = {
+        'loader': dag_builder.Loader.__name__,
+        'render+yaml.Loader': measure(uncached, args.iterations),
+        'cold': measure(cold, args.iterations),
+        'disk cache': measure(disk_cache, args.iterations),
+        'memory cache': measure(memory_cache, args.iterations),
+        'build': measure(lambda: DagBuilder(load_dag_config(template_path, config=config)).build(), args.iterations),
+        'dag file': measure(dag_file_parse, args.iterations),
+    }
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print(f"{dag_file} ({results['loader']})")
+    for mode, timing in results.items():
+        if mode != 'loader':
+            print(f"  {mode:<20} median {timing['median_ms']:>9} ms   p95 {timing['p95_ms']:>9} ms")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+"""FileSyncOperator throughput benchmark against in-process SFTP servers
+
+    python tests/benchmarks/run_benchmarks.py --datasets small,mixed --chunk-sizes 1MB,10MB \
+        --num-batches 1,3 --transformations none,timestamp_and_uppercase --output results.json
+
+Every batch of a case runs in its own process, like the Celery workers do, and the case reports
+files/s, MB/s, p50/p99 per-file latency and the peak RSS of the busiest batch.
+"""
+import argparse
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(os.path.dirname(BENCHMARKS_DIR))
+for path in (BENCHMARKS_DIR, os.path.join(REPO_DIR, 'plugins'), os.path.join(REPO_DIR, 'dags')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from datasets import PROFILES, generate_dataset  # noqa: E402
+from sftp_server import SFTPTestServer  # noqa: E402
+
+SOURCE_CONN_ID = 'bench_source_sftp'
+TARGET_CONN_ID = 'bench_target_sftp'
+TRANSFORMATIONS = 'dag_transfer_files.transformation.transformations'
+
+_UNITS = {'': 1, 'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+
+def parse_size(value):
+    value = value.strip().upper()
+    number = value.rstrip('KMGB')
+    return int(float(number) * _UNITS[value[len(number):]])
+
+
+def parse_option(value):
+    import yaml
+
+    key, sep, raw = value.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected key=value, got {value}")
+    return key, yaml.safe_load(raw)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # nearest rank
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def resolve_transformation(name):
+    if name in (None, 'none'):
+        return None
+    import importlib
+
+    dotted = name if '.' in name else f'{TRANSFORMATIONS}.{name}_transform'
+    module_name, attr = dotted.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), attr)
+
+
+class _FakeTaskInstance:
+    def __init__(self):
+        self.xcom = {}
+
+    def xcom_pull(self, task_ids=None, key=None):
+        return self.xcom.get(key)
+
+    def xcom_push(self, key, value):
+        self.xcom[key] = value
+
+
+class _FakeDagRun:
+    def __init__(self, dag_id, run_id):
+        self.dag_id = dag_id
+        self.run_id = run_id
+
+
+def run_batch(case, modulo_id):
+    """Run one batch of a case in the current (fresh) process and report its measurements"""
+    import resource
+    from operators.file_sync_operator import FileSyncOperator
+
+    class TimedFileSyncOperator(FileSyncOperator):
+        def execute(self, context):
+            self.latencies = []
+            return super().execute(context)
+
+        def _sync_file(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return super()._sync_file(*args, **kwargs)
+            finally:
+                self.latencies.append(time.perf_counter() - start)
+
+    operator = TimedFileSyncOperator(
+        task_id=f'sync_batch_{modulo_id}',
+        source_type='sftp',
+        target_type='sftp',
+        source_conn_id=SOURCE_CONN_ID,
+        target_conn_id=TARGET_CONN_ID,
+        source_path=case['source_path'],
+        modulo_id=modulo_id,
+        num_batches=case['num_batches'],
+        chunk_size=case['chunk_size'],
+        transformation_func=resolve_transformation(case['transformation']),
+        checkpoint_backend='sqlite',
+        checkpoint_path=case['checkpoint_path'],
+        **case['options']
+    )
+    context = {
+        'task_instance': _FakeTaskInstance(),
+        'dag_run': _FakeDagRun('benchmark', case['run_id']),
+    }
+
+    started_at = time.time()
+    stats = operator.execute(context)
+    finished_at = time.time()
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak_rss_bytes = max_rss if sys.platform == 'darwin' else max_rss * 1024
+    return {
+        'stats': stats,
+        'latencies': operator.latencies,
+        'started_at': started_at,
+        'finished_at': finished_at,
+        'peak_rss_bytes': peak_rss_bytes,
+    }
+
+
+def run_case(case):
+    # a fresh process per batch => imports don't count and the peak RSS is the one of this batch only
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=case['num_batches'], mp_context=context) as executor:
+        futures = [executor.submit(run_batch, case, modulo_id) for modulo_id in range(case['num_batches'])]
+        batches = [future.result() for future in futures]
+
+    wall_seconds = max(b['finished_at'] for b in batches) - min(b['started_at'] for b in batches)
+    latencies = [latency for b in batches for latency in b['latencies']]
+    synced = sum(b['stats']['synced'] for b in batches)
+    total_bytes = sum(b['stats']['total_bytes'] for b in batches)
+    return {
+        'files': synced,
+        'failed': sum(b['stats']['failed'] for b in batches),
+        'bytes': total_bytes,
+        'wall_seconds': round(wall_seconds, 3),
+        'files_per_second': round(synced / wall_seconds, 2) if wall_seconds else None,
+        'mb_per_second': round(total_bytes / 1e6 / wall_seconds, 2) if wall_seconds else None,
+        'latency_p50_ms': _ms(percentile(latencies, 50)),
+        'latency_p99_ms': _ms(percentile(latencies, 99)),
+        'peak_rss_mb': round(max(b['peak_rss_bytes'] for b in batches) / 1e6, 1),
+        'stage_seconds': _sum_stage_seconds(batches),
+    }
+
+
+def _sum_stage_seconds(batches):
+    # from the operator metrics, summed over batches (and over files synced in parallel)
+    total = {}
+    for b in batches:
+        for stage, seconds in b['stats'].get('metrics', {}).get('stage_seconds', {}).items():
+            total[stage] = round(total.get(stage, 0) + seconds, 3)
+    return total
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(result):
+    return (
+        result['dataset'], result['chunk_size'], result['num_batches'], result['transformation'],
+        json.dumps(result['options'], sort_keys=True)
+    )
+
+
+def compare(previous_path, results):
+    with open(previous_path) as f:
+        previous = {case_key(r): r for r in json.load(f)['results']}
+
+    print(f"\ncompared to {previous_path}:")
+    for result in results:
+        before = previous.get(case_key(result))
+        if not before or not before['mb_per_second'] or not result['mb_per_second']:
+            continue
+        change = (result['mb_per_second'] / before['mb_per_second'] - 1) * 100
+        print(
+            f"  {_describe(result)}: {before['mb_per_second']} => {result['mb_per_second']} MB/s ({change:+.1f}%), "
+            f"p99 {before['latency_p99_ms']} => {result['latency_p99_ms']} ms"
+        )
+
+
+def _describe(result):
+    options = ' '.join(f'{k}={v}' for k, v in sorted(result['options'].items()))
+    return (
+        f"{result['dataset']} chunk={result['chunk_size']} batches={result['num_batches']} "
+        f"transform={result['transformation']} {options}"
+    ).rstrip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--datasets', default='small,huge,mixed', help=f"among {', '.join(PROFILES)}")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplies the number of files of the datasets")
+    parser.add_argument('--size-scale', type=float, default=1.0, help="multiplies the file sizes of the datasets")
+    parser.add_argument('--chunk-sizes', default='10MB')
+    parser.add_argument('--num-batches', default='1')
+    parser.add_argument('--transformations', default='none',
+                        help="'none', a name from transformations.py (e.g. uppercase) or a dotted path")
+    parser.add_argument('--option', action='append', type=parse_option, default=[], metavar='KEY=VALUE',
+                        help="extra FileSyncOperator argument applied to every case, e.g. max_parallel_files=4")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per case, the median run by wall time is kept")
+    parser.add_argument('--work-dir', help="datasets are generated once and reused from here")
+    parser.add_argument('--output', default=f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    parser.add_argument('--compare', metavar='PREVIOUS_JSON', help="print the change against an earlier run")
+    args = parser.parse_args(argv)
+
+    work_dir = os.path.abspath(args.work_dir or os.path.join(tempfile.gettempdir(), 'file_sync_benchmark'))
+    os.makedirs(work_dir, exist_ok=True)
+    # keep the Airflow config and its database out of the user's AIRFLOW_HOME
+    os.environ.setdefault('AIRFLOW_HOME', os.path.join(work_dir, 'airflow'))
+    os.environ['PYTHONPATH'] = os.pathsep.join(
+        [os.path.join(REPO_DIR, 'plugins'), os.path.join(REPO_DIR, 'dags'), os.environ.get('PYTHONPATH', '')]
+    ).rstrip(os.pathsep)
+
+    options = dict(args.option)
+    grid = list(itertools.product(
+        args.datasets.split(','),
+        [parse_size(size) for size in args.chunk_sizes.split(',')],
+        [int(n) for n in args.num_batches.split(',')],
+        args.transformations.split(','),
+    ))
+
+    datasets = {}
+    for dataset_name in args.datasets.split(','):
+        dataset_dir = os.path.join(work_dir, 'datasets', dataset_name)
+        print(f"preparing dataset {dataset_name} in {dataset_dir}")
+        datasets[dataset_name] = (
+            dataset_dir, generate_dataset(dataset_dir, dataset_name, scale=args.scale, size_scale=args.size_scale)
+        )
+
+    results = []
+    for dataset_name, chunk_size, num_batches, transformation in grid:
+        dataset_dir, dataset = datasets[dataset_name]
+
+        runs = []
+        for run in range(args.repeat):
+            target_dir = os.path.join(work_dir, 'target')
+            shutil.rmtree(target_dir, ignore_errors=True)
+            os.makedirs(target_dir)
+            checkpoint_path = os.path.join(work_dir, 'checkpoint.db')
+            if os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
+
+            with SFTPTestServer(dataset_dir) as source, SFTPTestServer(target_dir) as target:
+                os.environ[f'AIRFLOW_CONN_{SOURCE_CONN_ID.upper()}'] = source.connection_uri()
+                os.environ[f'AIRFLOW_CONN_{TARGET_CONN_ID.upper()}'] = target.connection_uri()
+                runs.append(run_case({
+                    'source_path': dataset['source_path'],
+                    'chunk_size': chunk_size,
+                    'num_batches': num_batches,
+                    'transformation': transformation,
+                    'options': options,
+                    'checkpoint_path': checkpoint_path,
+                    'run_id': f'benchmark_{run}',
+                }))
+
+        measured = sorted(runs, key=lambda r: r['wall_seconds'])[len(runs) // 2]
+        result = {
+            'dataset': dataset_name,
+            'dataset_files': dataset['files'],
+            'dataset_bytes': dataset['bytes'],
+            'chunk_size': chunk_size,
+            'num_batches': num_batches,
+            'transformation': transformation,
+            'options': options,
+            'runs': len(runs),
+            **measured,
+        }
+        if result['files'] != dataset['files'] or result['failed']:
+            print(f"  warning: {result['files']}/{dataset['files']} files synced, {result['failed']} failed")
+        print(
+            f"  {_describe(result)}: {result['files_per_second']} files/s, {result['mb_per_second']} MB/s, "
+            f"p50 {result['latency_p50_ms']} ms, p99 {result['latency_p99_ms']} ms, peak RSS {result['peak_rss_mb']} MB"
+        )
+        results.append(result)
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'scale': args.scale,
+        'size_scale': args.size_scale,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"results saved to {args.output}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
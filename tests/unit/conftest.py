@@ -0,0 +1,70 @@
+"""Shared fixtures of the unit tests, plugins/ and dags/ are importable like on an Airflow worker"""
+import os
+import sys
+
+import pytest
+
+UNIT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(os.path.dirname(UNIT_DIR))
+BENCHMARKS_DIR = os.path.join(REPO_DIR, 'tests', 'benchmarks')
+for path in (os.path.join(REPO_DIR, 'plugins'), os.path.join(REPO_DIR, 'dags'), BENCHMARKS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+class FakeTaskInstance:
+    def __init__(self, dag_id='test_dag', run_id='test_run', try_number=1):
+        self.dag_id = dag_id
+        self.run_id = run_id
+        self.try_number = try_number
+        self.xcom = {}
+
+    def xcom_pull(self, task_ids=None, key=None):
+        # the return value of a task is pulled by task id (shard plan), the rest by key (checkpoint)
+        return self.xcom.get(key if key is not None else task_ids)
+
+    def xcom_push(self, key, value):
+        self.xcom[key] = value
+
+
+class FakeDagRun:
+    def __init__(self, dag_id='test_dag', run_id='test_run', conf=None):
+        self.dag_id = dag_id
+        self.run_id = run_id
+        self.conf = conf or {}
+
+
+def make_context(run_id='test_run', task_instance=None):
+    task_instance = task_instance or FakeTaskInstance(run_id=run_id)
+    return {'task_instance': task_instance, 'dag_run': FakeDagRun(run_id=task_instance.run_id)}
+
+
+@pytest.fixture
+def context():
+    return make_context()
+
+
+@pytest.fixture
+def memory_store():
+    from adapters.storage_adapter.memory_adapter import MemoryStorageAdapter
+
+    MemoryStorageAdapter.clear_all()
+    yield MemoryStorageAdapter
+    MemoryStorageAdapter.clear_all()
+
+
+@pytest.fixture
+def sftp_server(tmp_path, monkeypatch):
+    """In-process SFTP server serving tmp_path/sftp, reachable as the 'test_sftp' connection"""
+    pytest.importorskip('airflow.providers.ssh')
+    from sftp_server import SFTPTestServer
+    from adapters.storage_adapter.sftp_pool import SFTPConnectionPool
+
+    root = tmp_path / 'sftp'
+    root.mkdir()
+    with SFTPTestServer(str(root)) as server:
+        monkeypatch.setenv('AIRFLOW_CONN_TEST_SFTP', server.connection_uri())
+        server.local_root = root
+        yield server
+        # pools are per process and conn_id, the next test gets a new server on another port
+        SFTPConnectionPool.close_all()
@@ -0,0 +1,109 @@
+"""Backfill of date partitions and completion markers, kept out of the synced directories"""
+import os
+import runpy
+
+import pytest
+
+pytest.importorskip('airflow')
+
+from airflow.exceptions import AirflowException  # noqa: E402
+
+from conftest import REPO_DIR, make_context  # noqa: E402
+from operators.file_sync_operator import FileSyncOperator  # noqa: E402
+from operators.shard_plan_operator import ShardPlanOperator  # noqa: E402
+from operators.sync_completion_operator import SyncCompletionOperator  # noqa: E402
+
+MARKERS = '/markers'
+COMMON = {
+    'source_type': 'memory', 'target_type': 'memory', 'source_conn_id': 'backfill_source',
+    'target_conn_id': 'backfill_target', 'partition_root': '/data',
+}
+
+
+def _sync(run_id, source_path='/data/2024-03-04', backfill=None, clear_number=0, **kwargs):
+    context = make_context(run_id=run_id)
+    context['dag_run'].clear_number = clear_number
+    backfill_start, backfill_end = backfill or ('', '')
+    args = dict(COMMON, source_path=source_path, backfill_start=backfill_start, backfill_end=backfill_end,
+                completion_marker_path=MARKERS)
+    stats = FileSyncOperator(
+        task_id='sync_batch_0', modulo_id=0, num_batches=1, **args, **kwargs
+    ).execute(context)
+    marked = SyncCompletionOperator(task_id='mark_complete', **args).execute(context)
+    return stats['synced'], marked
+
+
+@pytest.fixture
+def source(memory_store):
+    source = memory_store('backfill_source')
+    for day in ('2024-03-01', '2024-03-02', '2024-03-04'):
+        for i in range(2):
+            source.write_file_chunks(f'/data/{day}/sub/f{i}.txt', [f'{day} {i}'.encode()])
+    return source
+
+
+def test_backfill_marks_partitions_outside_the_data(source, memory_store):
+    # 2024-03-03 is missing on the source, it is neither synced nor marked
+    marked = ['2024-03-01', '2024-03-02', '2024-03-04']
+    assert _sync('backfill_run', backfill=('2024-03-01', '2024-03-04')) == (6, marked)
+
+    target = memory_store('backfill_target')
+    data_files = sorted(entry.name for entry in target.walk('/data') if not entry.is_dir)
+    assert data_files == sorted(f'{day}/sub/f{i}.txt' for day in ('2024-03-01', '2024-03-02', '2024-03-04')
+                                for i in range(2))
+    markers = sorted(entry.name for entry in target.walk(MARKERS) if not entry.is_dir)
+    assert markers == ['data/2024-03-01.complete', 'data/2024-03-02.complete', 'data/2024-03-04.complete']
+
+    # the daily run of a backfilled date has nothing left to do
+    assert _sync('scheduled__2024-03-04') == (0, [])
+    # a later backfill only syncs the dates without marker
+    source.write_file_chunks('/data/2024-03-03/a.txt', [b'late'])
+    assert _sync('backfill_run_2', backfill=('2024-03-01', '2024-03-04')) == (1, ['2024-03-03'])
+
+
+def test_cleared_runs_sync_again(source):
+    assert _sync('backfill_run', backfill=('2024-03-04', '2024-03-04')) == (2, ['2024-03-04'])
+    assert _sync('scheduled__2024-03-04') == (0, [])
+
+    # cleared after a backfill marked its date, the daily run syncs and marks it anyway
+    assert _sync('scheduled__2024-03-04', clear_number=1) == (2, ['/data/2024-03-04'])
+    # started again with the same run_id, its own marker doesn't hold it back
+    assert _sync('scheduled__2024-03-04') == (2, ['/data/2024-03-04'])
+    # any other run still skips it
+    assert _sync('scheduled__2024-03-05', source_path='/data/2024-03-04') == (0, [])
+
+
+def test_shard_plan_skips_complete_partitions(source):
+    _sync('backfill_run', backfill=('2024-03-01', '2024-03-01'))
+
+    context = make_context(run_id='backfill_run_2')
+    plan = ShardPlanOperator(
+        task_id='plan_shards', source_type='memory', source_conn_id='backfill_source', source_path='/data/2024-03-04',
+        num_batches=2, partition_root='/data', backfill_start='2024-03-01', backfill_end='2024-03-02',
+        target_type='memory', target_conn_id='backfill_target', completion_marker_path=MARKERS
+    ).execute(context)
+
+    planned = sorted(name for shard in plan['shards'] for name, _, _ in shard['files'])
+    assert planned == ['2024-03-02/sub/f0.txt', '2024-03-02/sub/f1.txt']
+
+
+@pytest.mark.parametrize('marker_path', ['/data', '/data/2024-03-04/.markers', '/data/markers'])
+def test_marker_path_inside_the_synced_directories(source, marker_path):
+    operator = FileSyncOperator(
+        task_id='sync_batch_0', modulo_id=0, num_batches=1, source_path='/data/2024-03-04',
+        completion_marker_path=marker_path, **COMMON
+    )
+    with pytest.raises(AirflowException, match='inside the synced directory'):
+        operator.execute(make_context())
+
+
+def test_production_dag_keeps_the_baseline_shape(monkeypatch, tmp_path):
+    monkeypatch.setenv('DAG_BUILDER_CACHE_DIR', str(tmp_path))
+    dag_module = runpy.run_path(os.path.join(REPO_DIR, 'dags', 'dag_transfer_files', 'dag.py'))
+
+    # backfill, markers and the optional transfer modes are opt-in
+    for option in ('partition_root', 'completion_marker_path', 'max_parallel_files', 'pipeline_depth',
+                   'shard_planning'):
+        assert option not in dag_module['config']
+    tasks = dag_module['configs']['DAG']['tasks']
+    assert list(tasks) == ['start_sync', 'sync_batch_0', 'sync_batch_1', 'sync_batch_2', 'end_sync']
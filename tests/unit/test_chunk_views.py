@@ -0,0 +1,60 @@
+"""Readers hand out memoryviews (buffer pool, memory adapter, mmap), transformations still get bytes"""
+import pytest
+
+pytest.importorskip('airflow')
+
+from conftest import make_context  # noqa: E402
+from operators.file_sync_operator import FileSyncOperator  # noqa: E402
+
+TIMESTAMP_AND_UPPERCASE = 'dag_transfer_files.transformation.transformations.timestamp_and_uppercase_transform'
+
+
+def decode_upper(chunk):
+    # plain chunk callable written for bytes
+    assert isinstance(chunk, (bytes, bytearray))
+    return chunk.decode('utf-8').upper().encode('utf-8')
+
+
+def _lines(count, prefix='line', suffix=''):
+    return ''.join(f'{prefix} {i}{suffix}\n' for i in range(count)).encode('utf-8')
+
+
+@pytest.mark.parametrize('transform_workers', [0, 2])
+def test_buffer_pool_with_transform_workers(tmp_path, memory_store, transform_workers):
+    source = tmp_path / 'day'
+    source.mkdir()
+    # multi-byte characters end up split between chunks
+    files = {f'f{i}.txt': _lines(2000 + i * 500, f'file {i}', ' é') for i in range(3)}
+    for name, data in files.items():
+        (source / name).write_bytes(data)
+
+    stats = FileSyncOperator(
+        task_id='sync_batch_0', source_type='local', target_type='memory', source_conn_id=None,
+        target_conn_id='views_target', source_path=str(source), modulo_id=0, num_batches=1, chunk_size=4096,
+        buffer_pool_bytes=1024 * 1024,
+        transformation_func=TIMESTAMP_AND_UPPERCASE, transform_workers=transform_workers
+    ).execute(make_context())
+
+    assert stats['synced'] == 3
+    target = memory_store('views_target')
+    for name, data in files.items():
+        header, body = b''.join(target.read_file_chunks(str(source / name), 4096)).split(b'\n', 1)
+        assert header.startswith(b'[TRANSFERRED AT ')
+        assert body == data.decode('utf-8').upper().encode('utf-8')
+
+
+@pytest.mark.parametrize('execution_mode, transform_workers', [('threads', 0), ('threads', 2), ('asyncio', 0)])
+def test_plain_callable_gets_bytes(memory_store, execution_mode, transform_workers):
+    source = memory_store('views_source')
+    data = _lines(1000)
+    source.write_file_chunks('/data/day/a.txt', [data])
+
+    stats = FileSyncOperator(
+        task_id='sync_batch_0', source_type='memory', target_type='memory', source_conn_id='views_source',
+        target_conn_id='views_target', source_path='/data/day', modulo_id=0, num_batches=1, chunk_size=1000,
+        transformation_func=decode_upper, execution_mode=execution_mode, transform_workers=transform_workers
+    ).execute(make_context())
+
+    assert stats['synced'] == 1
+    target = memory_store('views_target')
+    assert b''.join(target.read_file_chunks('/data/day/a.txt', 4096)) == data.decode('utf-8').upper().encode('utf-8')
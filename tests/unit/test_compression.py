@@ -0,0 +1,50 @@
+"""compression: files are compressed on the way to the target and decompress to the source bytes"""
+import gzip
+import importlib
+
+import pytest
+
+pytest.importorskip('airflow')
+
+from conftest import make_context  # noqa: E402
+from operators.file_sync_operator import FileSyncOperator  # noqa: E402
+
+
+def _decompress(name, data):
+    if name == 'gzip':
+        return gzip.decompress(data)
+    if name == 'zstd':
+        # streamed frames don't carry the content size, decompressobj doesn't need it
+        return importlib.import_module('zstandard').ZstdDecompressor().decompressobj().decompress(data)
+    return importlib.import_module('lz4.frame').decompress(data)
+
+
+@pytest.mark.parametrize('execution_mode', ['threads', 'asyncio'])
+@pytest.mark.parametrize('compression, suffix, package', [
+    ('gzip', '.gz', None), ('zstd', '.zst', 'zstandard'), ('lz4', '.lz4', 'lz4.frame')
+])
+def test_compressed_round_trip(memory_store, execution_mode, compression, suffix, package):
+    if package:
+        pytest.importorskip(package)
+    source = memory_store('compress_source')
+    files = {
+        'a.txt': ''.join(f'line {i} é\n' for i in range(5000)).encode('utf-8'),
+        'b.bin': bytes(range(256)) * 300,
+        'empty.txt': b'',
+    }
+    for name, data in files.items():
+        source.write_file_chunks(f'/data/day/{name}', [data])
+
+    stats = FileSyncOperator(
+        task_id='sync_batch_0', source_type='memory', target_type='memory', source_conn_id='compress_source',
+        target_conn_id='compress_target', source_path='/data/day', modulo_id=0, num_batches=1, chunk_size=4096,
+        compression=compression, execution_mode=execution_mode
+    ).execute(make_context())
+
+    assert stats['synced'] == len(files)
+    assert stats['raw_bytes'] == sum(len(data) for data in files.values())
+    target = memory_store('compress_target')
+    assert sorted(target.files) == sorted(f'/data/day/{name}{suffix}' for name in files)
+    for name, data in files.items():
+        compressed = b''.join(target.read_file_chunks(f'/data/day/{name}{suffix}', 4096))
+        assert _decompress(compression, compressed) == data
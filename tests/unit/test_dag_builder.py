@@ -0,0 +1,68 @@
+"""load_dag_config pickle cache, only kept in a directory nobody else can write to"""
+import os
+import pickle
+import stat
+
+import pytest
+
+pytest.importorskip('airflow')
+
+import dag_builder  # noqa: E402
+
+TEMPLATE = """DAG:
+  dag_id: {{ config.name }}
+  args:
+    schedule: null
+  tasks: {}
+"""
+
+
+@pytest.fixture
+def template(tmp_path, monkeypatch):
+    monkeypatch.setattr(dag_builder, '_config_cache', {})
+    path = tmp_path / 'config.yaml'
+    path.write_text(TEMPLATE)
+    return str(path)
+
+
+def _load(template, cache_dir):
+    # a new scheduler process, only the files of cache_dir are left
+    dag_builder._config_cache.clear()
+    return dag_builder.load_dag_config(template, config={'name': 'cached_dag'}, cache_dir=str(cache_dir))
+
+
+def _plant(cache_dir):
+    for cache_file in cache_dir.glob('*.pickle'):
+        cache_file.write_bytes(pickle.dumps({'planted': True}))
+
+
+def test_cache_dir_is_private(template, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    assert _load(template, cache_dir)['DAG']['dag_id'] == 'cached_dag'
+
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+    cache_files = list(cache_dir.glob('*.pickle'))
+    assert len(cache_files) == 1
+    assert stat.S_IMODE(os.stat(cache_files[0]).st_mode) == 0o600
+    # later loads come from the pickle
+    _plant(cache_dir)
+    assert _load(template, cache_dir) == {'planted': True}
+
+
+def test_writable_by_others_cache_dir_is_not_loaded(template, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    _load(template, cache_dir)
+    os.chmod(cache_dir, 0o777)
+    _plant(cache_dir)
+
+    assert _load(template, cache_dir)['DAG']['dag_id'] == 'cached_dag'
+
+
+def test_symlinked_cache_dir_is_not_used(template, tmp_path):
+    real_dir = tmp_path / 'real'
+    _load(template, real_dir)
+    _plant(real_dir)
+    link = tmp_path / 'link'
+    link.symlink_to(real_dir)
+
+    assert _load(template, link)['DAG']['dag_id'] == 'cached_dag'
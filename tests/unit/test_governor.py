@@ -0,0 +1,90 @@
+"""ConnectionGovernor channel limit, and tasks using a connection limited to one channel"""
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('airflow')
+
+from adapters.storage_adapter.factory import StorageAdapterFactory  # noqa: E402
+from adapters.storage_adapter.governor import ConnectionGovernor  # noqa: E402
+from operators.file_sync_operator import FileSyncOperator  # noqa: E402
+
+
+def _governor(tmp_path, **config):
+    return ConnectionGovernor('test_conn', backend_options={'state_dir': str(tmp_path)}, **config)
+
+
+def test_channel_limit_across_threads(tmp_path):
+    governor = _governor(tmp_path, max_channels=2)
+    in_use = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with governor.channel():
+            with lock:
+                in_use.append(1)
+                peak.append(len(in_use))
+            time.sleep(0.05)
+            with lock:
+                in_use.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2 and len(peak) == 6
+
+
+def test_slots_are_shared_by_governors_of_the_same_connection(tmp_path):
+    # one governor per process, they meet in the state_dir
+    first = _governor(tmp_path, max_channels=1)
+    second = _governor(tmp_path, max_channels=1)
+
+    token = first.acquire()
+    with pytest.raises(TimeoutError):
+        second.acquire(timeout=0.1)
+    first.release(token)
+    second.release(second.acquire(timeout=0.1))
+
+
+def test_waiting_for_a_slot_times_out(tmp_path):
+    governor = _governor(tmp_path, max_channels=1, slot_timeout=0.2)
+
+    with governor.channel():
+        started = time.monotonic()
+        with pytest.raises(TimeoutError, match='max_channels'):
+            with governor.channel():
+                pass
+    assert time.monotonic() - started < 5
+    # the slot is free again
+    with governor.channel():
+        pass
+
+
+@pytest.mark.parametrize('list_workers', [1, 4])
+def test_sync_from_sftp_with_a_single_channel(sftp_server, memory_store, context, tmp_path, monkeypatch, list_workers):
+    # listing and reading the files must not need two channels at once
+    files = {f'day/sub{i % 2}/f{i}.txt': bytes([65 + i]) * (i * 100 + 1) for i in range(6)}
+    for name, data in files.items():
+        path = sftp_server.local_root / 'data' / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    monkeypatch.setattr(ConnectionGovernor, '_governors', {})
+    monkeypatch.setattr(StorageAdapterFactory, '_get_governor_config', staticmethod(
+        lambda conn_id: {'max_channels': 1, 'slot_timeout': 10, 'backend_options': {'state_dir': str(tmp_path)}}
+    ))
+
+    stats = FileSyncOperator(
+        task_id='sync_batch_0', source_type='sftp', target_type='memory', source_conn_id='test_sftp',
+        target_conn_id='governor_target', source_path='/data/day', modulo_id=0, num_batches=1, chunk_size=128,
+        list_workers=list_workers
+    ).execute(context)
+
+    assert stats['synced'] == len(files)
+    target = memory_store('governor_target')
+    for name, data in files.items():
+        assert b''.join(target.read_file_chunks(f'/data/{name}', 1024)) == data
@@ -0,0 +1,53 @@
+"""incremental='manifest': the records live in manifest_path, never on the target"""
+import pytest
+
+pytest.importorskip('airflow')
+
+from conftest import make_context  # noqa: E402
+from operators.file_sync_operator import FileSyncOperator  # noqa: E402
+
+
+def _sync(manifest_path):
+    return FileSyncOperator(
+        task_id='sync_batch_0', source_type='memory', target_type='memory', source_conn_id='manifest_source',
+        target_conn_id='manifest_target', source_path='/data/2024-03-01', modulo_id=0, num_batches=1,
+        incremental='manifest', manifest_path=str(manifest_path)
+    ).execute(make_context())
+
+
+def test_manifest_skips_unchanged_files(memory_store, tmp_path):
+    source = memory_store('manifest_source')
+    target = memory_store('manifest_target')
+    for i in range(3):
+        source.write_file_chunks(f'/data/2024-03-01/f{i}.txt', [f'file {i}'.encode()])
+
+    stats = _sync(tmp_path)
+    assert (stats['synced'], stats['skipped']) == (3, 0)
+    # the target only gets the synced files, the manifest is in its own directory
+    files = sorted(entry.name for entry in target.walk('/data') if not entry.is_dir)
+    assert files == ['2024-03-01/f0.txt', '2024-03-01/f1.txt', '2024-03-01/f2.txt']
+    assert [path.name for path in tmp_path.rglob('*.json')] == ['sync_batch_0.json']
+
+    stats = _sync(tmp_path)
+    assert (stats['synced'], stats['skipped']) == (0, 3)
+
+    source.write_file_chunks('/data/2024-03-01/f1.txt', [b'changed'])
+    stats = _sync(tmp_path)
+    assert (stats['synced'], stats['skipped']) == (1, 2)
+    assert b''.join(target.read_file_chunks('/data/2024-03-01/f1.txt', 1024)) == b'changed'
+
+
+def test_manifest_is_per_target_directory(memory_store, tmp_path):
+    source = memory_store('manifest_source')
+    source.write_file_chunks('/data/2024-03-01/a.txt', [b'a'])
+    source.write_file_chunks('/data/2024-03-02/a.txt', [b'a'])
+
+    assert _sync(tmp_path)['synced'] == 1
+    stats = FileSyncOperator(
+        task_id='sync_batch_0', source_type='memory', target_type='memory', source_conn_id='manifest_source',
+        target_conn_id='manifest_target', source_path='/data/2024-03-02', modulo_id=0, num_batches=1,
+        incremental='manifest', manifest_path=str(tmp_path)
+    ).execute(make_context())
+    # same file name in another directory, not covered by the first manifest
+    assert stats['synced'] == 1
+    assert len(list(tmp_path.iterdir())) == 2
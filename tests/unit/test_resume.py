@@ -0,0 +1,72 @@
+"""resumable=True: a retry picks the interrupted transfer up where the previous try left it"""
+import pytest
+
+pytest.importorskip('airflow')
+
+from airflow.exceptions import AirflowException  # noqa: E402
+
+from adapters.storage_adapter.memory_adapter import MemoryStorageAdapter  # noqa: E402
+from conftest import FakeTaskInstance, make_context  # noqa: E402
+from operators.file_sync_operator import FileSyncOperator  # noqa: E402
+
+CHUNK_SIZE = 1024
+FILE_SIZE = 64 * 1024
+FAIL_AT = 40 * 1024
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Offsets the source reads start from, the first read getting past FAIL_AT drops like a lost connection"""
+    offsets = []
+    failed = []
+    read_file_range = MemoryStorageAdapter.read_file_range
+
+    def flaky_read_file_range(self, file_path, offset, length, chunk_size):
+        offsets.append(offset)
+        for chunk in read_file_range(self, file_path, offset, length, chunk_size):
+            if not failed and offset >= FAIL_AT:
+                failed.append(offset)
+                raise OSError('connection lost')
+            yield chunk
+            offset += len(chunk)
+
+    monkeypatch.setattr(MemoryStorageAdapter, 'read_file_range', flaky_read_file_range)
+    return offsets
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'pipeline_depth': 2},
+    {'segment_threshold': 1, 'segment_size': 8 * 1024, 'max_parallel_segments': 2},
+], ids=['sequential', 'pipelined', 'segmented'])
+def test_retry_resumes_the_interrupted_file(memory_store, tmp_path, reads, options):
+    # memory => local, the same kind of storage on both sides would be copied in one go
+    source_path = str(tmp_path / 'day')
+    data = bytes(range(256)) * (FILE_SIZE // 256)
+    memory_store('resume_source').write_file_chunks(f'{source_path}/a.bin', [data])
+    task_instance = FakeTaskInstance()
+
+    def run(try_number):
+        task_instance.try_number = try_number
+        return FileSyncOperator(
+            task_id='sync_batch_0', source_type='memory', target_type='local', source_conn_id='resume_source',
+            target_conn_id=None, source_path=source_path, modulo_id=0, num_batches=1, chunk_size=CHUNK_SIZE,
+            resumable=True, **options
+        ).execute(make_context(task_instance=task_instance))
+
+    with pytest.raises(AirflowException, match='connection lost'):
+        run(1)
+    assert not (tmp_path / 'day' / 'a.bin').exists()
+    first_try = len(reads)
+
+    stats = run(2)
+    assert stats['synced'] == 1
+    assert (tmp_path / 'day' / 'a.bin').read_bytes() == data
+    assert not (tmp_path / 'day' / 'a.bin.tmp').exists()
+    retried = reads[first_try:]
+    if 'segment_threshold' in options:
+        # only the segments left unfinished are read again
+        assert 0 < len(retried) < FILE_SIZE // options['segment_size']
+        assert 0 not in retried
+    else:
+        assert len(retried) == 1 and 0 < retried[0] <= FAIL_AT
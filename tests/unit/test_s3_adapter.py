@@ -0,0 +1,131 @@
+"""S3StorageAdapter against moto's in-process S3"""
+import pytest
+
+pytest.importorskip('airflow.providers.amazon')
+moto = pytest.importorskip('moto')
+
+from adapters.storage_adapter.factory import StorageAdapterFactory  # noqa: E402
+from adapters.storage_adapter.s3_adapter import S3StorageAdapter  # noqa: E402
+from operators.file_sync_operator import FileSyncOperator  # noqa: E402
+
+BUCKET = 'file-sync-test'
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    for name, value in (
+        ('AWS_ACCESS_KEY_ID', 'testing'),
+        ('AWS_SECRET_ACCESS_KEY', 'testing'),
+        ('AWS_SESSION_TOKEN', 'testing'),
+        ('AWS_DEFAULT_REGION', 'us-east-1'),
+    ):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        adapter = S3StorageAdapter(conn_id=None, bucket=BUCKET, part_size=5 * MB, max_concurrency=4)
+        adapter.client.create_bucket(Bucket=BUCKET)
+        yield adapter
+
+
+def _data(size):
+    return bytes(i % 251 for i in range(size))
+
+
+def _read(adapter, path, chunk_size=MB):
+    return b''.join(adapter.read_file_chunks(path, chunk_size))
+
+
+def test_small_file_round_trip(s3):
+    data = b'hello\nworld\n'
+    assert s3.write_file_chunks('/data/2024-03-01/a.txt', [data[:5], data[5:]]) == len(data)
+
+    assert _read(s3, '/data/2024-03-01/a.txt') == data
+    assert s3.get_file_size('/data/2024-03-01/a.txt') == len(data)
+    entry = s3.stat_file('/data/2024-03-01/a.txt')
+    assert (entry.name, entry.size, entry.is_dir) == ('a.txt', len(data), False)
+
+
+def test_multipart_upload_and_ranged_reads(s3):
+    # parts are cut at part_size whatever the chunk size, the last one is smaller
+    data = _data(12 * MB + 123)
+    chunks = [data[offset:offset + 3 * MB] for offset in range(0, len(data), 3 * MB)]
+    assert s3.write_file_chunks('/big.bin', chunks) == len(data)
+
+    head = s3.client.head_object(Bucket=BUCKET, Key='big.bin')
+    assert head['ContentLength'] == len(data)
+    assert head['ETag'].strip('"').endswith('-3')
+
+    assert _read(s3, '/big.bin') == data
+    ranged = b''.join(s3.read_file_range('/big.bin', 5 * MB - 10, 2 * MB, MB))
+    assert ranged == data[5 * MB - 10:7 * MB - 10]
+    # a range past the end stops at the end of the object
+    assert b''.join(s3.read_file_range('/big.bin', len(data) - 5, 100, MB)) == data[-5:]
+
+
+def test_failed_multipart_upload_is_aborted(s3):
+    def chunks():
+        yield _data(6 * MB)
+        raise IOError('source went away')
+
+    with pytest.raises(IOError):
+        s3.write_file_chunks('/broken.bin', chunks())
+
+    assert s3.client.list_multipart_uploads(Bucket=BUCKET).get('Uploads', []) == []
+    with pytest.raises(FileNotFoundError):
+        s3.get_file_size('/broken.bin')
+
+
+def test_listing_and_walk(s3):
+    for path in ('/root/a.txt', '/root/sub/b.txt', '/root/sub/deeper/c.txt', '/other/d.txt'):
+        s3.write_file_chunks(path, [path.encode()])
+
+    entries = {entry.name: entry for entry in s3.list_entries('/root')}
+    assert set(entries) == {'a.txt', 'sub'}
+    assert entries['sub'].is_dir and not entries['a.txt'].is_dir
+
+    assert sorted(entry.name for entry in s3.walk('/root')) == ['a.txt', 'sub/b.txt', 'sub/deeper/c.txt']
+    assert s3.is_directory('/root/sub')
+    assert not s3.is_directory('/root/a.txt')
+    with pytest.raises(FileNotFoundError):
+        s3.is_directory('/missing')
+
+
+def test_rename_and_delete(s3):
+    s3.write_file_chunks('/data/a.txt.tmp', [b'content'])
+    s3.rename_file('/data/a.txt.tmp', '/data/a.txt')
+
+    assert _read(s3, '/data/a.txt') == b'content'
+    with pytest.raises(FileNotFoundError):
+        s3.stat_file('/data/a.txt.tmp')
+
+    s3.delete_file('/data/a.txt')
+    # deleting a missing key is fine
+    s3.delete_file('/data/a.txt')
+    assert list(s3.walk('/data')) == []
+
+
+def test_bucket_from_path(s3):
+    adapter = S3StorageAdapter(conn_id=None, part_size=5 * MB)
+    adapter.write_file_chunks(f'/{BUCKET}/x/y.txt', [b'y'])
+    assert _read(s3, '/x/y.txt') == b'y'
+    assert [entry.name for entry in adapter.walk(f'/{BUCKET}/x')] == ['y.txt']
+
+
+def test_file_sync_operator_to_s3(s3, memory_store, context, monkeypatch):
+    source = memory_store('s3_test_source')
+    files = {f'/data/2024-03-01/sub/f{i}.txt': _data(i * 1000 + 1) for i in range(5)}
+    for path, data in files.items():
+        source.write_file_chunks(path, [data])
+    # the operator creates its adapters through the factory, hand it the one of the mocked bucket
+    monkeypatch.setitem(StorageAdapterFactory._adapters, 's3', lambda conn_id: s3)
+
+    stats = FileSyncOperator(
+        task_id='sync_batch_0', source_type='memory', target_type='s3', source_conn_id='s3_test_source',
+        target_conn_id=None, source_path='/data/2024-03-01', modulo_id=0, num_batches=1, chunk_size=1000
+    ).execute(context)
+
+    assert stats['synced'] == 5
+    for path, data in files.items():
+        assert _read(s3, path) == data
+    # objects are written in place, no temp file is left behind
+    assert sorted(entry.name for entry in s3.walk('/data')) == sorted(path[len('/data/'):] for path in files)
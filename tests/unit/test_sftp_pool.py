@@ -0,0 +1,78 @@
+"""SFTPConnectionPool checkouts against the in-process SFTP server"""
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('airflow.providers.ssh')
+
+import paramiko  # noqa: E402
+
+from adapters.storage_adapter import sftp_pool  # noqa: E402
+from adapters.storage_adapter.sftp_pool import SFTPConnectionPool  # noqa: E402
+
+
+@pytest.fixture
+def pool(sftp_server):
+    pool = SFTPConnectionPool('test_sftp', max_channels=2, checkout_timeout=0.3)
+    yield pool
+    pool.close()
+
+
+def test_checkout_times_out_when_every_channel_is_in_use(pool):
+    first = pool.checkout()
+    second = pool.checkout()
+    started = time.monotonic()
+    with pytest.raises(TimeoutError, match='all 2 are in use'):
+        pool.checkout()
+    assert time.monotonic() - started < 5
+
+    pool.checkin(first)
+    # the freed channel is reused
+    assert pool.checkout() is first
+    pool.checkin(first)
+    pool.checkin(second)
+
+
+def test_failed_connect_gives_the_slot_back(pool, monkeypatch):
+    class FailingHook:
+        def __init__(self, ssh_conn_id):
+            pass
+
+        def get_conn(self):
+            raise paramiko.SSHException('connection refused')
+
+    hook = sftp_pool.SSHHook
+    monkeypatch.setattr(sftp_pool, 'SSHHook', FailingHook)
+    for _ in range(3):
+        with pytest.raises(paramiko.SSHException):
+            pool.checkout()
+    assert pool._in_use == 0
+
+    monkeypatch.setattr(sftp_pool, 'SSHHook', hook)
+    with pool.channel() as sftp:
+        assert sftp.listdir('/') == []
+
+
+def test_slow_channel_open_does_not_block_checkin(pool, monkeypatch):
+    first = pool.checkout()
+    from_transport = paramiko.SFTPClient.from_transport
+
+    def slow_from_transport(transport):
+        time.sleep(1)
+        return from_transport(transport)
+
+    monkeypatch.setattr(sftp_pool.paramiko.SFTPClient, 'from_transport', slow_from_transport)
+    opened = []
+    opener = threading.Thread(target=lambda: opened.append(pool.checkout(timeout=5)))
+    opener.start()
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    pool.checkin(first)
+    assert pool.checkout() is first
+    assert time.monotonic() - started < 0.5
+
+    opener.join()
+    pool.checkin(opened[0])
+    pool.checkin(first)
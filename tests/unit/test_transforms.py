@@ -0,0 +1,95 @@
+"""StreamTransform pipelines, map_blocks stands in for the operator's transform process pool (a real pool at the end)"""
+import pytest
+
+pytest.importorskip('airflow')
+
+from dag_transfer_files.transformation.transformations import (  # noqa: E402
+    AddTimestampTransform, UppercaseTransform, timestamp_and_uppercase_transform
+)
+from conftest import make_context  # noqa: E402
+from operators.file_sync_operator import FileSyncOperator  # noqa: E402
+from transfer.transforms import ChainTransform, stream_transform  # noqa: E402
+
+UPPERCASE = 'dag_transfer_files.transformation.transformations.uppercase_transform'
+
+
+class RecordingMap:
+    """map_blocks recording the functions and blocks it is handed"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, func, blocks):
+        for block in blocks:
+            self.calls.append((func, block))
+            yield func(block)
+
+
+def test_header_only_stage_skips_map_blocks():
+    map_blocks = RecordingMap()
+    out = b''.join(stream_transform(AddTimestampTransform(), [b'a\n', b'b\n'], map_blocks))
+
+    assert out.startswith(b'[transferred at ') and out.endswith(b']\na\nb\n')
+    assert map_blocks.calls == []
+
+
+def test_chain_sends_only_transforming_stages_to_map_blocks():
+    map_blocks = RecordingMap()
+    out = b''.join(stream_transform(timestamp_and_uppercase_transform, [b'ab\ncd', b'\nef\n'], map_blocks))
+
+    assert out.endswith(b']\nAB\nCD\nEF\n')
+    assert {func.__func__ for func, _ in map_blocks.calls} == {UppercaseTransform.transform_block}
+    # the timestamp header goes through the uppercase stage like any line, then the lines of the chunks
+    assert [block for _, block in map_blocks.calls][1:] == [b'ab\n', b'cd\nef\n']
+
+
+def test_chain_of_header_only_stages():
+    map_blocks = RecordingMap()
+    chain = ChainTransform(AddTimestampTransform(), AddTimestampTransform())
+    lines = b''.join(chain.stream([b'data\n'], map_blocks)).splitlines()
+
+    assert len(lines) == 3 and lines[-1] == b'data'
+    assert map_blocks.calls == []
+
+
+def test_record_without_delimiter_is_bounded():
+    uppercase = UppercaseTransform()
+    uppercase.max_record_size = 4096
+    # 2 MB without newline, the 2 byte 'é' falls across the chunk boundaries
+    data = 'abcé' * (2 * 1024 * 1024 // 5)
+    encoded = data.encode('utf-8')
+    chunks = [encoded[offset:offset + 1001] for offset in range(0, len(encoded), 1001)]
+    map_blocks = RecordingMap()
+
+    out = b''.join(stream_transform(uppercase, chunks, map_blocks))
+
+    assert out == data.upper().encode('utf-8')
+    assert max(len(block) for _, block in map_blocks.calls) <= 4096 + 1001
+    for _, block in map_blocks.calls:
+        block.decode('utf-8')
+
+
+@pytest.mark.parametrize('execution_mode', ['threads', 'asyncio'])
+def test_process_pool_round_trip(memory_store, execution_mode):
+    source = memory_store('pool_source')
+    files = {
+        # many blocks in flight, they must come back in order
+        'short.txt': ''.join(f'line {i} é\n' for i in range(20000)).encode('utf-8'),
+        # lines longer than a chunk
+        'long.txt': ''.join(f'{i} ' * 2000 + '\n' for i in range(20)).encode('utf-8'),
+        'no_newline.txt': b'tail without newline',
+    }
+    for name, data in files.items():
+        source.write_file_chunks(f'/data/day/{name}', [data])
+
+    stats = FileSyncOperator(
+        task_id='sync_batch_0', source_type='memory', target_type='memory', source_conn_id='pool_source',
+        target_conn_id='pool_target', source_path='/data/day', modulo_id=0, num_batches=1, chunk_size=1024,
+        transformation_func=UPPERCASE, transform_workers=2, transform_max_in_flight=3,
+        execution_mode=execution_mode
+    ).execute(make_context())
+
+    assert stats['synced'] == len(files)
+    target = memory_store('pool_target')
+    for name, data in files.items():
+        assert b''.join(target.read_file_chunks(f'/data/day/{name}', 4096)) == data.decode('utf-8').upper().encode()
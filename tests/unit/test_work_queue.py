@@ -0,0 +1,122 @@
+"""dispatch='queue': the SQLite work queue shared by the batch tasks of a DAG run"""
+import pytest
+
+pytest.importorskip('airflow')
+
+from airflow.exceptions import AirflowException  # noqa: E402
+
+from adapters.storage_adapter.base_adapter import FileEntry  # noqa: E402
+from conftest import FakeTaskInstance, make_context  # noqa: E402
+from operators.file_sync_operator import FileSyncOperator  # noqa: E402
+from transfer.work_queue import create_work_queue  # noqa: E402
+
+
+def _batch(batch_id, **kwargs):
+    return FileSyncOperator(
+        task_id=f'sync_batch_{batch_id}', source_type='memory', target_type='memory', source_conn_id='queue_source',
+        target_conn_id='queue_target', source_path='/data', modulo_id=batch_id, num_batches=2, dispatch='queue',
+        **kwargs
+    )
+
+
+def test_sqlite_queue_needs_a_path(context):
+    with pytest.raises(ValueError, match='shared by every worker'):
+        create_work_queue('sqlite', context)
+
+
+def test_operator_fails_fast_without_work_queue_path(memory_store, context):
+    memory_store('queue_source').write_file_chunks('/data/a.txt', [b'a'])
+
+    with pytest.raises(AirflowException, match='work_queue_path'):
+        _batch(0).execute(context)
+    assert memory_store('queue_target').files == {}
+
+
+def test_lease_complete_and_expired_leases(tmp_path, context):
+    path = str(tmp_path / 'queue.db')
+    first = create_work_queue('sqlite', context, path=path, lease_seconds=60)
+    second = create_work_queue('sqlite', context, path=path, lease_seconds=60)
+    files = [FileEntry(f'f{size}.txt', size, 0.0, False) for size in (10, 30, 20)]
+
+    assert first.populate(files, 'sync_batch_0')
+    assert not second.populate(files, 'sync_batch_1')
+    assert second.is_populated()
+    # largest first, a file is leased by one worker only
+    assert [row[0] for row in first.lease('sync_batch_0')] == ['f30.txt']
+    assert [row[0] for row in second.lease('sync_batch_1', max_items=5)] == ['f20.txt', 'f10.txt']
+    assert not first.complete('f20.txt', 'sync_batch_0')
+    assert second.complete('f20.txt', 'sync_batch_1')
+
+    # the other files go back to the queue when a worker gives them up
+    second.release('sync_batch_1')
+    assert [row[0] for row in first.lease('sync_batch_0', max_items=5)] == ['f10.txt']
+    assert first.complete('f30.txt', 'sync_batch_0') and first.complete('f10.txt', 'sync_batch_0')
+    assert first.is_drained() and first.counts() == {'done': 3}
+
+
+def test_batches_share_the_queue(memory_store, tmp_path):
+    source = memory_store('queue_source')
+    files = {f'/data/f{i}.txt': bytes([i]) * (i + 1) for i in range(6)}
+    for path, data in files.items():
+        source.write_file_chunks(path, [data])
+
+    path = str(tmp_path / 'queue.db')
+    synced = [_batch(batch_id, work_queue_path=path).execute(make_context())['synced'] for batch_id in range(2)]
+
+    # the first batch drains the queue, the second one finds nothing left
+    assert synced == [6, 0]
+    target = memory_store('queue_target')
+    for path, data in files.items():
+        assert b''.join(target.read_file_chunks(path, 1024)) == data
+
+
+def fail_on_bad(chunk):
+    if b'BAD' in chunk:
+        raise ValueError('bad record')
+    return chunk
+
+
+def test_file_failing_every_attempt_fails_the_batches(memory_store, tmp_path):
+    source = memory_store('queue_source')
+    source.write_file_chunks('/data/good.txt', [b'good'])
+    source.write_file_chunks('/data/bad.txt', [b'BAD'])
+    path = str(tmp_path / 'queue.db')
+
+    def run(batch_id, try_number=1):
+        task_instance = FakeTaskInstance(try_number=try_number)
+        return FileSyncOperator(
+            task_id=f'sync_batch_{batch_id}', source_type='memory', target_type='memory',
+            source_conn_id='queue_source', target_conn_id='queue_target', source_path='/data', modulo_id=batch_id,
+            num_batches=4, dispatch='queue', work_queue_path=path, transformation_func=fail_on_bad
+        ).execute(make_context(task_instance=task_instance))
+
+    # every batch takes its turn at bad.txt until it used up its 3 attempts
+    for batch_id in range(3):
+        with pytest.raises(AirflowException):
+            run(batch_id)
+    # nothing left to lease, the last batch must not succeed without it
+    with pytest.raises(AirflowException, match='bad.txt'):
+        run(3)
+
+    # the Airflow retry tries it again
+    source.write_file_chunks('/data/bad.txt', [b'fixed'])
+    assert run(0, try_number=2)['synced'] == 1
+    assert b''.join(memory_store('queue_target').read_file_chunks('/data/bad.txt', 1024)) == b'fixed'
+    assert run(1)['synced'] == 0
+
+
+def test_cleared_run_gets_a_new_queue(memory_store, tmp_path):
+    source = memory_store('queue_source')
+    source.write_file_chunks('/data/a.txt', [b'a'])
+    path = str(tmp_path / 'queue.db')
+    assert _batch(0, work_queue_path=path).execute(make_context())['synced'] == 1
+
+    memory_store.clear_all()
+    source = memory_store('queue_source')
+    source.write_file_chunks('/data/a.txt', [b'a'])
+    # same run_id, the drained queue of the first execution would sync nothing
+    assert _batch(0, work_queue_path=path).execute(make_context())['synced'] == 0
+    context = make_context()
+    context['dag_run'].clear_number = 1
+    assert _batch(0, work_queue_path=path).execute(context)['synced'] == 1
+    assert b''.join(memory_store('queue_target').read_file_chunks('/data/a.txt', 1024)) == b'a'